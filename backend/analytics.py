@@ -0,0 +1,159 @@
+"""Local rhythm analytics over a user's activity events.
+
+Everything here is plain NumPy over (timestamp, frequency) pairs so it can
+run over the full history in milliseconds and hand the LLM a few lines of
+digested features instead of raw event logs. NumPy is imported on first use
+to keep it off the worker startup path.
+"""
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from events import parse_timestamp
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SESSION_GAP_SECONDS = 30 * 60
+DAY_SECONDS = 24 * 60 * 60
+
+
+def _to_epoch(timestamps: List[datetime]) -> "np.ndarray":
+    import numpy as np
+    return np.array([t.timestamp() for t in timestamps], dtype=np.float64)
+
+
+def _longest_run(mask: "np.ndarray") -> int:
+    """Length of the longest run of True values"""
+    import numpy as np
+    if not mask.any():
+        return 0
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return int((edges[1::2] - edges[::2]).max())
+
+
+def rhythm_features(events: List[Dict[str, Any]], now: Optional[float] = None) -> Dict[str, Any]:
+    """Rhythm features from events with 'timestamp' (ISO string or datetime, naive means UTC) and 'frequency' keys.
+    Events whose timestamp can't be parsed are left out."""
+    import numpy as np  # deferred so worker boot doesn't pay for it
+
+    parsed = [(parse_timestamp(e.get("timestamp")), e) for e in events]
+    events = [e for t, e in parsed if t is not None]
+    if not events:
+        return {"events": 0}
+
+    times = _to_epoch([t for t, _ in parsed if t is not None])
+    order = np.argsort(times, kind="stable")
+    times = times[order]
+    labels = [events[i].get("frequency") or "unknown" for i in order]
+    names = sorted(set(labels))
+    lookup = {name: i for i, name in enumerate(names)}
+    codes = np.array([lookup[label] for label in labels], dtype=np.int64)
+
+    # Frequency transition probabilities (row-normalized counts)
+    counts = np.zeros((len(names), len(names)), dtype=np.float64)
+    if len(codes) > 1:
+        np.add.at(counts, (codes[:-1], codes[1:]), 1)
+    row_sums = counts.sum(axis=1, keepdims=True)
+    probabilities = np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
+
+    # Sessions: split wherever the gap between events exceeds SESSION_GAP_SECONDS
+    gaps = np.diff(times)
+    breaks = np.flatnonzero(gaps > SESSION_GAP_SECONDS)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(times) - 1]))
+    session_minutes = (times[ends] - times[starts]) / 60.0
+
+    # Time of day (UTC)
+    hours = ((times % DAY_SECONDS) // 3600).astype(np.int64)
+    hour_histogram = np.bincount(hours, minlength=24)
+
+    # Burstiness of inter-event times: -1 regular, 0 random, 1 bursty
+    burstiness = None
+    if len(gaps) > 1:
+        mu, sigma = gaps.mean(), gaps.std()
+        if mu + sigma > 0:
+            burstiness = float((sigma - mu) / (sigma + mu))
+
+    # Day streaks
+    days = np.unique((times // DAY_SECONDS).astype(np.int64))
+    active = np.zeros(days[-1] - days[0] + 1, dtype=bool)
+    active[days - days[0]] = True
+    today = int((now if now is not None else time.time()) // DAY_SECONDS)
+    current_streak = 0
+    if days[-1] >= today - 1:
+        tail = active[::-1]
+        current_streak = int(np.argmin(tail)) if not tail.all() else len(tail)
+
+    # Longest stay in a single frequency (consecutive events)
+    same = np.concatenate(([True], codes[1:] == codes[:-1]))
+    run_ids = np.cumsum(~same)
+    run_lengths = np.bincount(run_ids)
+    longest_idx = int(np.argmax(run_lengths))
+    longest_frequency = names[codes[np.flatnonzero(run_ids == longest_idx)[0]]]
+
+    frequency_counts = np.bincount(codes, minlength=len(names))
+
+    return {
+        "events": int(len(times)),
+        "first_at": datetime.fromtimestamp(times[0], tz=timezone.utc).isoformat(),
+        "last_at": datetime.fromtimestamp(times[-1], tz=timezone.utc).isoformat(),
+        "frequencies": {name: int(c) for name, c in zip(names, frequency_counts)},
+        "transitions": {
+            src: {dst: round(float(probabilities[i, j]), 3) for j, dst in enumerate(names) if counts[i, j]}
+            for i, src in enumerate(names) if row_sums[i, 0]
+        },
+        "sessions": {
+            "count": int(len(starts)),
+            "median_minutes": round(float(np.median(session_minutes)), 1),
+            "mean_minutes": round(float(session_minutes.mean()), 1),
+            "p90_minutes": round(float(np.percentile(session_minutes, 90)), 1),
+            "events_per_session": round(float(len(times) / len(starts)), 2),
+        },
+        "hour_histogram_utc": hour_histogram.tolist(),
+        "peak_hours_utc": [int(h) for h in np.argsort(-hour_histogram, kind="stable")[:3] if hour_histogram[h]],
+        "burstiness": None if burstiness is None else round(burstiness, 3),
+        "streaks": {
+            "active_days": int(len(days)),
+            "current_days": current_streak,
+            "longest_days": _longest_run(active),
+            "longest_frequency_run": int(run_lengths.max()),
+            "longest_frequency_run_in": longest_frequency,
+        },
+    }
+
+
+def describe_features(features: Dict[str, Any]) -> str:
+    """A few prompt lines summarising rhythm features"""
+    if not features.get("events"):
+        return ""
+
+    lines = []
+    shifts = sorted(
+        ((src, dst, p) for src, row in features["transitions"].items() for dst, p in row.items() if src != dst),
+        key=lambda t: -t[2]
+    )[:4]
+    if shifts:
+        lines.append("Likely shifts: " + ", ".join(f"{src} → {dst} {p:.0%}" for src, dst, p in shifts))
+
+    sessions = features["sessions"]
+    lines.append(
+        f"Sessions: {sessions['count']}, typically {sessions['median_minutes']:.0f} min "
+        f"(long ones {sessions['p90_minutes']:.0f} min), {sessions['events_per_session']} moments each"
+    )
+    if features["peak_hours_utc"]:
+        lines.append("Peak hours (UTC): " + ", ".join(f"{h:02d}h" for h in features["peak_hours_utc"]))
+
+    burstiness = features["burstiness"]
+    if burstiness is not None:
+        texture = "clustered bursts" if burstiness > 0.3 else "steady tempo" if burstiness < -0.1 else "loose, irregular"
+        lines.append(f"Tempo: {texture} (burstiness {burstiness})")
+
+    streaks = features["streaks"]
+    lines.append(
+        f"Active days: {streaks['active_days']}, current streak {streaks['current_days']}, "
+        f"longest {streaks['longest_days']}; longest single-frequency run {streaks['longest_frequency_run']} "
+        f"in {streaks['longest_frequency_run_in']}"
+    )
+    return "\n".join(lines)
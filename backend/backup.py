@@ -0,0 +1,276 @@
+"""Streaming workspace export / import.
+
+The export is NDJSON: a header line, then one {"collection": ..., "doc": ...}
+line per document, compressed with gzip or zstd. Both directions work on
+bounded chunks, so a workspace never has to fit in memory.
+
+Imported documents get fresh ids derived from the old ones with uuid5 under a
+per-import namespace. References (linked_ids, parent_id, merged_from, ...)
+then remap consistently even when they point forward in the stream, and no
+old -> new id map has to be kept. Links to nodes that never show up in the
+export are dropped once the stream ends - only links still waiting for their
+target are tracked on the way.
+"""
+import json
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+FORMAT = "flowtion-export"
+VERSION = 1
+COLLECTIONS = ["nodes", "artifacts", "conversations", "archived_sessions"]
+SYNCED_COLLECTIONS = ("nodes", "artifacts")
+
+CHUNK_BYTES = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024 * 1024
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+
+MEDIA_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd", "none": "application/x-ndjson"}
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst", "none": ".ndjson"}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _zstd():
+    try:
+        import zstandard  # optional, only needed for zstd archives
+    except ImportError:
+        raise ImportFormatError("zstd support is not installed on this server")
+    return zstandard
+
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=3).compressobj()
+    if compression == "none":
+        return _Identity()
+    raise ImportFormatError(f"Unknown compression: {compression}")
+
+
+async def export_workspace(db, user_id: str, compression: str = "gzip", batch_size: int = 500) -> AsyncIterator[bytes]:
+    """Yield the user's workspace as compressed NDJSON, straight off Motor cursors"""
+    packer = compressor(compression)
+    header = {
+        "format": FORMAT,
+        "version": VERSION,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "collections": COLLECTIONS,
+    }
+    buffer = bytearray(json.dumps(header).encode() + b"\n")
+
+    for collection in COLLECTIONS:
+        cursor = db[collection].find({"user_id": user_id}, {"_id": 0, "user_id": 0}).batch_size(batch_size)
+        async for doc in cursor:
+            buffer += json.dumps({"collection": collection, "doc": doc}, default=str).encode()
+            buffer += b"\n"
+            if len(buffer) >= CHUNK_BYTES:
+                out = packer.compress(bytes(buffer))
+                buffer.clear()
+                if out:
+                    yield out
+
+    out = packer.compress(bytes(buffer)) + packer.flush()
+    if out:
+        yield out
+
+
+class _Decoder:
+    """Picks gzip / zstd / plain from the first bytes of the stream"""
+
+    def __init__(self):
+        self._inner = None
+        self._head = b""
+
+    def feed(self, data: bytes) -> bytes:
+        if self._inner is None:
+            self._head += data
+            if len(self._head) < len(ZSTD_MAGIC):
+                return b""
+            data, self._head = self._head, b""
+            if data.startswith(GZIP_MAGIC):
+                self._inner = zlib.decompressobj(47)
+            elif data.startswith(ZSTD_MAGIC):
+                self._inner = _zstd().ZstdDecompressor().decompressobj(read_across_frames=True)
+            else:
+                self._inner = _Identity()
+        if not data:
+            return b""
+        try:
+            if isinstance(self._inner, _Identity):
+                return data
+            return self._inner.decompress(data)
+        except Exception as e:
+            raise ImportFormatError(f"Corrupt archive: {e}")
+
+    def close(self) -> bytes:
+        if self._inner is None:
+            data, self._head = self._head, b""
+            return data
+        return b""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    decoder = _Decoder()
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += decoder.feed(chunk)
+        start = 0
+        while True:
+            end = pending.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(pending[start:end])
+            start = end + 1
+        del pending[:start]
+        if len(pending) > MAX_LINE_BYTES:
+            raise ImportFormatError("Line too long")
+    pending += decoder.close()
+    if pending.strip():
+        yield bytes(pending)
+
+
+class IdRemapper:
+    def __init__(self):
+        self.namespace = uuid.uuid4()
+
+    def __call__(self, old: Optional[str]) -> Optional[str]:
+        if not old:
+            return old
+        return str(uuid.uuid5(self.namespace, str(old)))
+
+    def many(self, ids: Optional[List[str]]) -> List[str]:
+        return [self(i) for i in ids or []]
+
+    def node(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        doc["id"] = self(doc.get("id")) or str(uuid.uuid4())
+        doc["linked_ids"] = self.many(doc.get("linked_ids"))
+        doc["merged_from"] = self.many(doc.get("merged_from"))
+        if doc.get("parent_id"):
+            doc["parent_id"] = self(doc["parent_id"])
+        return doc
+
+    def artifact(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        doc["id"] = self(doc.get("id")) or str(uuid.uuid4())
+        doc["merged_from"] = self.many(doc.get("merged_from"))
+        return doc
+
+    def conversation(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        if doc.get("id"):
+            doc["id"] = self(doc["id"])
+        doc["artifacts_created"] = self.many(doc.get("artifacts_created"))
+        doc["archived_artifact_ids"] = self.many(doc.get("archived_artifact_ids"))
+        return doc
+
+    def archived_session(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        doc["id"] = self(doc.get("id")) or str(uuid.uuid4())
+        doc["node_ids"] = self.many(doc.get("node_ids"))
+        doc["nodes"] = [self.node(dict(n)) for n in doc.get("nodes") or []]
+        return doc
+
+    def remap(self, collection: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "nodes": self.node,
+            "artifacts": self.artifact,
+            "conversations": self.conversation,
+            "archived_sessions": self.archived_session,
+        }[collection](doc)
+
+
+async def import_workspace(db, user_id: str, chunks: AsyncIterator[bytes], batch_size: int = 500,
+                           rev: Optional[int] = None) -> Dict[str, Any]:
+    """Stream an export back in under user_id, with fresh ids, in ordered batches.
+    Synced documents are stamped with rev; revs from the exporting workspace are dropped."""
+    remapper = IdRemapper()
+    batches: Dict[str, List[Dict[str, Any]]] = {c: [] for c in COLLECTIONS}
+    counts = {c: 0 for c in COLLECTIONS}
+    skipped = 0
+    header = None
+    seen_nodes: Set[str] = set()
+    # target id -> imported nodes that link to it before it has appeared
+    forward_links: Dict[str, List[str]] = {}
+
+    def node_seen(node_id: str):
+        seen_nodes.add(node_id)
+        forward_links.pop(node_id, None)
+
+    async def flush(collection: str):
+        batch = batches[collection]
+        if batch:
+            await db[collection].insert_many(batch, ordered=True)
+            counts[collection] += len(batch)
+            batches[collection] = []
+
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ImportFormatError("Malformed NDJSON line")
+        if not isinstance(record, dict):
+            raise ImportFormatError("Malformed NDJSON line")
+
+        if header is None:
+            if record.get("format") != FORMAT:
+                raise ImportFormatError("Not a Flowtion export")
+            if record.get("version", 0) > VERSION:
+                raise ImportFormatError(f"Export version {record.get('version')} is newer than this server supports")
+            header = record
+            continue
+
+        collection, doc = record.get("collection"), record.get("doc")
+        if collection not in batches or not isinstance(doc, dict):
+            skipped += 1
+            continue
+        doc.pop("_id", None)
+        doc = remapper.remap(collection, doc)
+        doc["user_id"] = user_id
+        if collection == "nodes":
+            node_seen(doc["id"])
+            for target in doc["linked_ids"]:
+                if target not in seen_nodes:
+                    forward_links.setdefault(target, []).append(doc["id"])
+        elif collection == "archived_sessions":
+            # Archived nodes come back on restore - links to them stay
+            for node in doc["nodes"]:
+                node_seen(node["id"])
+        doc.pop("rev", None)
+        if rev is not None and collection in SYNCED_COLLECTIONS:
+            doc["rev"] = rev
+        batches[collection].append(doc)
+        if len(batches[collection]) >= batch_size:
+            await flush(collection)
+
+    if header is None:
+        raise ImportFormatError("Empty export")
+    for collection in COLLECTIONS:
+        await flush(collection)
+
+    # Whatever is still waiting points outside the export
+    dangling: Dict[str, List[str]] = {}
+    for target, sources in forward_links.items():
+        for source in sources:
+            dangling.setdefault(source, []).append(target)
+    ops = [UpdateOne({"user_id": user_id, "id": source}, {"$pull": {"linked_ids": {"$in": targets}}})
+           for source, targets in dangling.items()]
+    for i in range(0, len(ops), batch_size):
+        await db.nodes.bulk_write(ops[i:i + batch_size], ordered=False)
+
+    return {"imported": counts, "skipped": skipped, "exported_at": header.get("exported_at"),
+            "dropped_links": sum(len(targets) for targets in dangling.values())}
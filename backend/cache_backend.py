@@ -0,0 +1,210 @@
+"""Pluggable shared cache + pub/sub.
+
+CACHE_URL selects the backend:
+
+- unset / memory://  in-process dicts, pub/sub delivered within the process
+- redis://...        any Redis-protocol server (redis.asyncio, imported lazily)
+- fakeredis://       in-memory fakeredis, for local runs and tests
+
+Values are strings (callers serialize to JSON). Hash helpers group per-user
+listings under one key so a whole group can be dropped with a single DEL.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class InProcessBackend:
+    shared = False
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    def _live(self, key: str) -> Optional[Any]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] and entry[0] < time.monotonic():
+            del self._values[key]
+            return None
+        return entry[1]
+
+    def _expiry(self, ttl: Optional[float]) -> float:
+        return time.monotonic() + ttl if ttl else 0.0
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._values[key] = (self._expiry(ttl), value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._values.pop(key, None)
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return (self._live(key) or {}).get(field)
+
+    async def hset(self, key: str, field: str, value: str, ttl: Optional[float] = None) -> None:
+        mapping = self._live(key) or {}
+        mapping[field] = value
+        self._values[key] = (self._expiry(ttl), mapping)
+
+    async def hdel(self, key: str, *fields: str) -> None:
+        mapping = self._live(key)
+        for field in fields:
+            if mapping:
+                mapping.pop(field, None)
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Pub/sub handler failed on {channel}: {e}")
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self) -> None:
+        self._handlers.clear()
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, client):
+        self.client = client
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis.asyncio as redis  # optional dependency, only for shared deployments
+        return cls(redis.from_url(url, decode_responses=True))
+
+    @classmethod
+    def fake(cls) -> "RedisBackend":
+        import fakeredis
+        return cls(fakeredis.FakeAsyncRedis(decode_responses=True))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*keys)
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return await self.client.hget(key, field)
+
+    async def hset(self, key: str, field: str, value: str, ttl: Optional[float] = None) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, field, value)
+            if ttl:
+                pipe.pexpire(key, int(ttl * 1000))
+            await pipe.execute()
+
+    async def hdel(self, key: str, *fields: str) -> None:
+        if fields:
+            await self.client.hdel(key, *fields)
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        await self.client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        self._tasks.append(asyncio.create_task(self._listen(channel, handler)))
+
+    async def _listen(self, channel: str, handler: Handler) -> None:
+        # Polls with a timeout rather than pubsub.listen(): a blocked listen()
+        # doesn't always honour task cancellation, which would hang shutdown
+        backoff = 0.5
+        while not self._closing:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(channel)
+                backoff = 0.5
+                while not self._closing:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None or message.get("type") != "message":
+                        continue
+                    try:
+                        await handler(json.loads(message["data"]))
+                    except Exception as e:
+                        logger.error(f"Pub/sub handler failed on {channel}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Pub/sub connection lost on {channel}, retrying: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def ping(self) -> bool:
+        return bool(await self.client.ping())
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=2.0)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+        await self.client.aclose()
+
+
+def make_backend(url: Optional[str]):
+    if not url or url.startswith("memory://"):
+        return InProcessBackend()
+    if url.startswith("fakeredis://"):
+        return RedisBackend.fake()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {url}")
+
+
+class InvalidationBus:
+    """Broadcast cache invalidations to every worker except the sender"""
+
+    CHANNEL = "flowtion:invalidate"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self.received = 0
+        self.sent = 0
+
+    async def start(self, handler: Handler) -> None:
+        async def on_message(message: Dict[str, Any]) -> None:
+            if message.get("origin") == self.origin:
+                return
+            self.received += 1
+            await handler(message)
+        await self.backend.subscribe(self.CHANNEL, on_message)
+
+    async def publish(self, **message: Any) -> None:
+        if not self.backend.shared:
+            return  # single process - nobody else to tell
+        self.sent += 1
+        try:
+            await self.backend.publish(self.CHANNEL, {"origin": self.origin, **message})
+        except Exception as e:
+            logger.error(f"Invalidation publish failed: {e}")
@@ -0,0 +1,326 @@
+"""Response compression: zstd, brotli and gzip with Accept-Encoding negotiation.
+
+Pure ASGI middleware, so streaming responses are compressed chunk by chunk
+(each chunk is flushed and reaches the client right away) instead of being
+buffered. Bodies under `minimum_size`, responses that are already encoded
+(the /export archives) and non-text content types pass through untouched.
+
+A CpuBudget tracks how much time compression has cost over a sliding window.
+Above the budget the codecs drop to their fast levels. At twice the budget
+responses go out uncompressed until the window cools down.
+"""
+import asyncio
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Bigger one-shot bodies are compressed off the event loop (zlib / zstd / brotli release the GIL)
+OFFLOAD_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/", "image/svg+xml")
+
+NORMAL, FAST, OFF = "normal", "fast", "off"
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _ZstdStream:
+    def __init__(self, zstandard, level: int):
+        self._zstd = zstandard
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(self._zstd.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliStream:
+    def __init__(self, brotli, level: int):
+        self._obj = brotli.Compressor(quality=level)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class Codec(ABC):
+    def __init__(self, name: str, normal: int, fast: int):
+        self.name = name
+        self.levels = {NORMAL: normal, FAST: fast}
+
+    @abstractmethod
+    def compress(self, data: bytes, mode: str) -> bytes:
+        """One-shot compression of a whole body"""
+
+    @abstractmethod
+    def stream(self, mode: str):
+        """A stream object with chunk(data) -> bytes and finish() -> bytes"""
+
+
+class GzipCodec(Codec):
+    def __init__(self, normal: int = 6, fast: int = 1):
+        super().__init__("gzip", normal, fast)
+
+    def compress(self, data: bytes, mode: str) -> bytes:
+        obj = zlib.compressobj(self.levels[mode], zlib.DEFLATED, 31)
+        return obj.compress(data) + obj.flush()
+
+    def stream(self, mode: str):
+        return _GzipStream(self.levels[mode])
+
+
+class ZstdCodec(Codec):
+    def __init__(self, zstandard, normal: int = 3, fast: int = 1):
+        super().__init__("zstd", normal, fast)
+        self._zstd = zstandard
+
+    def compress(self, data: bytes, mode: str) -> bytes:
+        return self._zstd.ZstdCompressor(level=self.levels[mode]).compress(data)
+
+    def stream(self, mode: str):
+        return _ZstdStream(self._zstd, self.levels[mode])
+
+
+class BrotliCodec(Codec):
+    def __init__(self, brotli, normal: int = 5, fast: int = 1):
+        super().__init__("br", normal, fast)
+        self._brotli = brotli
+
+    def compress(self, data: bytes, mode: str) -> bytes:
+        return self._brotli.compress(data, quality=self.levels[mode])
+
+    def stream(self, mode: str):
+        return _BrotliStream(self._brotli, self.levels[mode])
+
+
+def available_codecs() -> Dict[str, Codec]:
+    """Codecs this server can produce, in preference order. zstd and brotli are optional installs."""
+    codecs: Dict[str, Codec] = {}
+    try:
+        import zstandard
+        codecs["zstd"] = ZstdCodec(zstandard)
+    except ImportError:
+        pass
+    try:
+        import brotli
+        codecs["br"] = BrotliCodec(brotli)
+    except ImportError:
+        pass
+    codecs["gzip"] = GzipCodec()
+    return codecs
+
+
+def negotiate(accept_encoding: str, preference: List[str]) -> Optional[str]:
+    """Best encoding the client accepts. Ties on q go to our preference order."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for name in preference:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CpuBudget:
+    """Share of wall time spent compressing over the last `window` seconds"""
+
+    def __init__(self, budget: float = 0.25, window: float = 10.0):
+        self.budget = budget
+        self.window = window
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._spent = 0.0
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self.skipped = 0
+        self.degraded = 0
+
+    def _trim(self, now: float):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._spent -= self._samples.popleft()[1]
+
+    def usage(self) -> float:
+        self._trim(time.monotonic())
+        return max(self._spent, 0.0) / self.window
+
+    def mode(self) -> str:
+        if self.budget <= 0:
+            return NORMAL
+        usage = self.usage()
+        if usage >= self.budget * 2:
+            self.skipped += 1
+            return OFF
+        if usage >= self.budget:
+            self.degraded += 1
+            return FAST
+        return NORMAL
+
+    def record(self, encoding: str, seconds: float, bytes_in: int, bytes_out: int):
+        now = time.monotonic()
+        self._samples.append((now, seconds))
+        self._spent += seconds
+        self._trim(now)
+        totals = self.totals.setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})
+        totals["bytes_in"] += bytes_in
+        totals["bytes_out"] += bytes_out
+        totals["cpu_ms"] += seconds * 1000
+
+    def count_response(self, encoding: str):
+        self.totals.setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})["responses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "usage": round(self.usage(), 4),
+            "degraded": self.degraded,
+            "skipped": self.skipped,
+            "encodings": {
+                name: {**t, "cpu_ms": round(t["cpu_ms"], 2),
+                       "ratio": round(t["bytes_out"] / t["bytes_in"], 3) if t["bytes_in"] else None}
+                for name, t in self.totals.items()
+            },
+        }
+
+
+def _timed(fn, *args) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - started
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, budget: Optional[CpuBudget] = None,
+                 codecs: Optional[Dict[str, Codec]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.budget = budget or CpuBudget()
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.preference = list(self.codecs)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate(accept, self.preference) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self, self.codecs[encoding], send).run(self.app, scope, receive)
+
+
+class _Responder:
+    """Per-response state: decides on the first body message, then compresses or passes through"""
+
+    def __init__(self, middleware: CompressionMiddleware, codec: Codec, send):
+        self.middleware = middleware
+        self.codec = codec
+        self.send = send
+        self.start: Optional[Dict[str, Any]] = None
+        self.stream = None
+        self.passthrough = False
+
+    async def run(self, app, scope, receive):
+        await app(scope, receive, self.handle)
+
+    def _eligible(self, headers: List[Tuple[bytes, bytes]]) -> bool:
+        if self.start["status"] < 200 or self.start["status"] in (204, 304):
+            return False
+        content_type = b""
+        for key, value in headers:
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type":
+                content_type = value
+        return content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+    def _vary(self) -> List[Tuple[bytes, bytes]]:
+        # Another client asking with a different Accept-Encoding may get a different body
+        vary = [v for k, v in self.start["headers"] if k == b"vary"] + [b"Accept-Encoding"]
+        return [(k, v) for k, v in self.start["headers"] if k != b"vary"] + [(b"vary", b", ".join(vary))]
+
+    def _encoded(self, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = [(k, v) for k, v in self._vary() if k != b"content-length"]
+        headers.append((b"content-encoding", self.codec.name.encode()))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
+
+    async def handle(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        budget = self.middleware.budget
+
+        if self.stream is None:
+            self.start["headers"] = list(self.start.get("headers", []))
+            eligible = self._eligible(self.start["headers"])
+            mode = budget.mode() if eligible else OFF
+            if mode == OFF or (not more and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                if eligible:
+                    self.start["headers"] = self._vary()
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            budget.count_response(self.codec.name)
+            if not more:
+                if len(body) >= OFFLOAD_BYTES:
+                    out, seconds = await asyncio.to_thread(_timed, self.codec.compress, body, mode)
+                else:
+                    out, seconds = _timed(self.codec.compress, body, mode)
+                budget.record(self.codec.name, seconds, len(body), len(out))
+                self.start["headers"] = self._encoded(len(out))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": out})
+                return
+
+            self.stream = self.codec.stream(mode)
+            self.start["headers"] = self._encoded(None)
+            await self.send(self.start)
+
+        started = time.perf_counter()
+        out = self.stream.chunk(body) if body else b""
+        if not more:
+            out += self.stream.finish()
+        budget.record(self.codec.name, time.perf_counter() - started, len(body), len(out))
+        if out or not more:
+            await self.send({"type": "http.response.body", "body": out, "more_body": more})
@@ -0,0 +1,176 @@
+"""Bytes on the wire and CPU cost of response compression, per endpoint.
+
+Builds the JSON bodies the listing endpoints return and runs every codec the
+server can produce over them, at the normal and the fast (over CPU budget)
+level. Streams (the NDJSON export) are compressed chunk by chunk with a flush
+per chunk, the way CompressionMiddleware sends them.
+
+Payloads are synthetic but shaped like real documents by default. With
+--user-id they are read from the Mongo in MONGO_URL / DB_NAME instead.
+
+    cd backend && python compression_benchmark.py [--nodes 500] [--artifacts 1500] [--runs 5] [--user-id ID]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from compression import FAST, NORMAL, available_codecs
+
+FREQUENCIES = ["focus", "dream", "reflect", "synthesize"]
+NODE_TYPES = ["thought", "project", "ritual", "pattern", "question"]
+ARTIFACT_TYPES = ["text_bubble", "lightbulb", "diagram", "table", "shape"]
+WORDS = ("morning walk cold shower journal breath focus dream pattern ritual anchor tide spiral "
+         "quiet evening reading notes garden light field energy rest project draft sketch").split()
+STREAM_CHUNK = 64 * 1024
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def synthetic_workspace(nodes: int, artifacts: int, seed: int = 7) -> Dict[str, List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def stamp() -> str:
+        return (start + timedelta(minutes=rng.randint(0, 500000))).isoformat()
+
+    node_docs = []
+    for i in range(nodes):
+        node_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        links = [d["id"] for d in rng.sample(node_docs, min(len(node_docs), rng.randint(0, 3)))]
+        node_docs.append({
+            "id": node_id, "user_id": user_id, "title": _sentence(rng, rng.randint(2, 5)),
+            "content": _sentence(rng, rng.randint(5, 40)), "type": rng.choice(NODE_TYPES),
+            "tags": rng.sample(WORDS, rng.randint(0, 3)), "aliases": [], "linked_ids": links,
+            "position": {"x": rng.uniform(-2000, 2000), "y": rng.uniform(-2000, 2000)},
+            "frequency": rng.choice(FREQUENCIES), "parent_id": None, "merged_from": [], "variant_label": None,
+            "created_at": stamp(), "updated_at": stamp(), "touched_at": stamp(),
+            "link_count": len(links), "archived": False, "rev": i + 1,
+        })
+
+    palette = ["#1e293b", "#f8fafc", "#fde68a", "#a5b4fc", "#fca5a5"]
+    artifact_docs = []
+    for i in range(artifacts):
+        artifact_docs.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "user_id": user_id,
+            "conversation_id": rng.choice(FREQUENCIES), "type": rng.choice(ARTIFACT_TYPES),
+            "content": {"text": _sentence(rng, rng.randint(4, 30))},
+            "style": {"background": rng.choice(palette), "color": rng.choice(palette), "borderRadius": "12px",
+                      "fontSize": rng.choice(["14px", "16px", "18px"]), "gradient": "linear-gradient(135deg, #a5b4fc, #fde68a)"},
+            "position": {"x": rng.uniform(0, 4000), "y": rng.uniform(0, 4000)},
+            "size": {"width": rng.choice([200, 240, 320]), "height": rng.choice([100, 140, 200])},
+            "created_at": stamp(), "updated_at": stamp(), "merged_from": [], "rev": nodes + i + 1,
+        })
+
+    archives = []
+    for frequency in FREQUENCIES:
+        members = [n for n in node_docs if n["frequency"] == frequency][:60]
+        archives.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "user_id": user_id, "frequency": frequency,
+            "name": f"2025-06-01 09:00 {frequency}", "nodes": members, "node_ids": [n["id"] for n in members],
+            "type_counts": {t: sum(1 for n in members if n["type"] == t) for t in NODE_TYPES},
+            "archived_at": stamp(), "node_count": len(members), "tags": [],
+        })
+    return {"nodes": node_docs, "artifacts": artifact_docs, "archived_sessions": archives}
+
+
+async def load_workspace(user_id: str) -> Dict[str, List[Dict[str, Any]]]:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        return {
+            collection: await db[collection].find({"user_id": user_id}, {"_id": 0}).to_list(None)
+            for collection in ("nodes", "artifacts", "archived_sessions")
+        }
+    finally:
+        client.close()
+
+
+def endpoint_payloads(workspace: Dict[str, List[Dict[str, Any]]]) -> Dict[str, bytes]:
+    """One representative body per endpoint, serialized like the API does"""
+    live = [n for n in workspace["nodes"] if not n.get("archived")]
+    frequency = max(FREQUENCIES, key=lambda f: sum(1 for n in live if n.get("frequency") == f))
+    conversation = max(FREQUENCIES, key=lambda f: sum(1 for a in workspace["artifacts"] if a.get("conversation_id") == f))
+    archives = [{k: v for k, v in a.items() if k != "nodes"} for a in workspace["archived_sessions"]]
+
+    def body(value) -> bytes:
+        return json.dumps(value, default=str, separators=(",", ":")).encode()
+
+    return {
+        "GET /nodes": body(live),
+        f"GET /nodes/{frequency}": body([n for n in live if n.get("frequency") == frequency]),
+        f"GET /artifacts/{conversation}": body([a for a in workspace["artifacts"]
+                                                if a.get("conversation_id") == conversation and not a.get("archived")]),
+        "GET /archives": body(archives),
+        "GET /sync (20 changes)": body({"rev": 1, "reset": False, "nodes": live[:10],
+                                        "artifacts": workspace["artifacts"][:10], "deleted": {"nodes": [], "artifacts": []}}),
+    }
+
+
+def export_stream(workspace: Dict[str, List[Dict[str, Any]]]) -> List[bytes]:
+    lines = b"".join(
+        json.dumps({"collection": c, "doc": d}, default=str).encode() + b"\n"
+        for c in ("nodes", "artifacts", "archived_sessions") for d in workspace[c]
+    )
+    return [lines[i:i + STREAM_CHUNK] for i in range(0, len(lines), STREAM_CHUNK)]
+
+
+def measure(fn, runs: int):
+    times, out = [], b""
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - started)
+    return out, statistics.median(times) * 1000
+
+
+def _stream_once(codec, mode: str, chunks: List[bytes]) -> bytes:
+    stream = codec.stream(mode)
+    return b"".join(stream.chunk(c) for c in chunks) + stream.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--artifacts", type=int, default=1500)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--user-id", help="benchmark a real workspace from MONGO_URL / DB_NAME")
+    args = parser.parse_args()
+
+    if args.user_id:
+        workspace = asyncio.run(load_workspace(args.user_id))
+    else:
+        workspace = synthetic_workspace(args.nodes, args.artifacts)
+    codecs = available_codecs()
+    print(f"codecs: {', '.join(codecs)}  (nodes={len(workspace['nodes'])}, artifacts={len(workspace['artifacts'])})\n")
+    print(f"{'endpoint':<28} {'codec':<6} {'level':<7} {'bytes':>10} {'ratio':>7} {'cpu ms':>8} {'MB/s':>8}")
+
+    rows = [(name, len(body), lambda codec, mode, body=body: codec.compress(body, mode))
+            for name, body in endpoint_payloads(workspace).items()]
+    chunks = export_stream(workspace)
+    rows.append((f"GET /export ({len(chunks)} chunks)", sum(len(c) for c in chunks),
+                 lambda codec, mode: _stream_once(codec, mode, chunks)))
+
+    for name, size, compress in rows:
+        print(f"{name:<28} {'-':<6} {'-':<7} {size:>10} {1.0:>7.3f} {0.0:>8.2f} {'-':>8}")
+        for codec in codecs.values():
+            for mode in (NORMAL, FAST):
+                out, ms = measure(lambda: compress(codec, mode), args.runs)
+                throughput = size / 1e6 / (ms / 1000) if ms else 0.0
+                print(f"{'':<28} {codec.name:<6} {mode:<7} {len(out):>10} {len(out) / size:>7.3f} {ms:>8.2f} {throughput:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("hour", "day")
+DUPLICATE_KEY = 11000
+
+
+def bucket_start(timestamp: datetime, bucket: str) -> str:
+    if bucket == "hour":
+        start = timestamp.replace(minute=0, second=0, microsecond=0)
+    else:
+        start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.isoformat()
+
+
+def field_key(value: Optional[str]) -> str:
+    """Mongo field names can't contain '.' or start with '$'"""
+    return (value or "unknown").replace(".", "_").replace("$", "_")
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        return parse_timestamp(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def fold_events(events: List[Dict[str, Any]], last_frequency: Dict[str, Optional[str]],
+                incs: Dict[Tuple[str, str, str], Dict[str, int]]) -> None:
+    """Add a time-ordered run of events to per-bucket counters (dotted field → count)"""
+    for event in events:
+        timestamp = parse_timestamp(event.get("timestamp"))
+        if timestamp is None:
+            continue
+        user_id = event["user_id"]
+        frequency = field_key(event.get("frequency"))
+        previous = last_frequency.get(user_id)
+        for bucket in BUCKETS:
+            inc = incs[(user_id, bucket, bucket_start(timestamp, bucket))]
+            inc["total"] += 1
+            inc[f"frequencies.{frequency}"] += 1
+            inc[f"actions.{field_key(event.get('action'))}"] += 1
+            if previous:
+                inc[f"transitions.{previous}.{frequency}"] += 1
+        last_frequency[user_id] = frequency
+
+
+def nest_counts(counts: Dict[str, int]) -> Dict[str, Any]:
+    """{"frequencies.focus": 2} → {"frequencies": {"focus": 2}}"""
+    nested: Dict[str, Any] = {"total": 0, "frequencies": {}, "actions": {}, "transitions": {}}
+    for path, count in counts.items():
+        *parents, leaf = path.split(".")
+        target = nested
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = count
+    return nested
+
+
+class ActivityRecorder:
+    """Append-only activity events, batched in memory and flushed with insert_many.
+
+    Raw events land in db.patterns. Every flush also folds the batch into
+    per-user hourly and daily rollups in db.pattern_rollups: totals, counts
+    per frequency and action, and a frequency→frequency transition matrix.
+    The last frequency seen per user lives in a "state" doc so transitions
+    carry across batches and restarts.
+
+    Events that fail to insert are requeued (only those - the unique `id`
+    index turns a replayed insert into a no-op), and rollup writes that fail
+    are retried with the next flush. Events recorded before rollups existed
+    are folded in once by `backfill`.
+    """
+
+    def __init__(self, db, batch_size: int = 200, flush_interval: float = 2.0, max_buffer: int = 50000,
+                 max_users: int = 10000):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_users = max_users
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_frequency: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._failed_ops: List[UpdateOne] = []
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    async def ensure_indexes(self) -> None:
+        await self.db.patterns.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
+        await self.db.patterns.create_index("id", unique=True, sparse=True)
+        await self.db.pattern_rollups.create_index(
+            [("user_id", ASCENDING), ("bucket", ASCENDING), ("start", DESCENDING)], unique=True
+        )
+        # Most recently active users, for cache warm-up
+        await self.db.pattern_rollups.create_index(
+            [("updated_at", DESCENDING)], partialFilterExpression={"bucket": "state"}
+        )
+
+    def record(self, user_id: str, frequency: Optional[str], action: str,
+               text: Optional[str] = None, **meta: Any) -> None:
+        """Queue one event - never blocks the request path"""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        event = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "frequency": frequency,
+            "action": action,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        if text:
+            event["text"] = text[:500]
+        if meta:
+            event["meta"] = meta
+        self._buffer.append(event)
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _load_last_frequencies(self, user_ids: List[str]) -> None:
+        missing = []
+        for user_id in user_ids:
+            if user_id in self._last_frequency:
+                self._last_frequency.move_to_end(user_id)
+            else:
+                missing.append(user_id)
+                self._last_frequency[user_id] = None
+        if missing:
+            async for state in self.db.pattern_rollups.find(
+                {"user_id": {"$in": missing}, "bucket": "state"}, {"_id": 0, "user_id": 1, "last_frequency": 1}
+            ):
+                self._last_frequency[state["user_id"]] = state.get("last_frequency")
+        # Evicted users reload from their state doc next time
+        while len(self._last_frequency) > max(self.max_users, len(user_ids)):
+            self._last_frequency.popitem(last=False)
+
+    async def _insert(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch; requeue whatever didn't land and return the events that did"""
+        try:
+            await self.db.patterns.insert_many([dict(e) for e in events], ordered=False)
+            return events
+        except BulkWriteError as e:
+            # Duplicate ids were stored by an earlier attempt - everything else failed
+            failed = {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY}
+            stored = [event for i, event in enumerate(events) if i not in failed]
+            if failed:
+                logger.error(f"Activity flush stored {len(stored)} events, requeueing {len(failed)}: {e}")
+            retry = [event for i, event in enumerate(events) if i in failed]
+        except Exception as e:
+            logger.error(f"Activity flush failed, requeueing {len(events)} events: {e}")
+            stored, retry = [], events
+        if retry:
+            requeued = (retry + self._buffer)[-self.max_buffer:]
+            self.dropped += len(retry) + len(self._buffer) - len(requeued)
+            self._buffer = requeued
+        return stored
+
+    async def _write_rollups(self, ops: List[UpdateOne]) -> None:
+        ops = self._failed_ops + ops
+        self._failed_ops = []
+        if not ops:
+            return
+        try:
+            await self.db.pattern_rollups.bulk_write(ops, ordered=False)
+            return
+        except BulkWriteError as e:
+            # Unordered - only the reported ops didn't apply, retrying the rest would double-count
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            retry = [op for i, op in enumerate(ops) if i in failed]
+            logger.error(f"Rollup update failed for {len(retry)} of {len(ops)} writes, retrying next flush: {e}")
+        except Exception as e:
+            retry = ops
+            logger.error(f"Rollup update failed, retrying {len(ops)} writes next flush: {e}")
+        self._failed_ops = retry[-self.max_buffer:]
+
+    async def flush(self, user_id: Optional[str] = None) -> int:
+        """Store the buffered events and fold them into rollups. With user_id only that user's are
+        stored - enough for a read of their activity, without a batch write for every user."""
+        if user_id is not None and not any(e["user_id"] == user_id for e in self._buffer):
+            return 0
+        async with self._lock:
+            if user_id is not None:
+                events = [e for e in self._buffer if e["user_id"] == user_id]
+                self._buffer = [e for e in self._buffer if e["user_id"] != user_id]
+            elif not self._buffer and not self._failed_ops:
+                return 0
+            else:
+                events, self._buffer = self._buffer, []
+            events = await self._insert(events) if events else []
+            if not events:
+                await self._write_rollups([])
+                return 0
+
+            user_ids = list({e["user_id"] for e in events})
+            await self._load_last_frequencies(user_ids)
+
+            incs: Dict[Tuple[str, str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+            fold_events(events, self._last_frequency, incs)
+
+            now = datetime.now(timezone.utc).isoformat()
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id, "bucket": bucket, "start": start},
+                    {"$inc": dict(inc), "$set": {"updated_at": now}},
+                    upsert=True
+                )
+                for (user_id, bucket, start), inc in incs.items()
+            ]
+            ops.extend(
+                UpdateOne(
+                    {"user_id": user_id, "bucket": "state", "start": ""},
+                    {"$set": {"last_frequency": self._last_frequency[user_id], "updated_at": now},
+                     "$inc": {"revision": 1}},
+                    upsert=True
+                )
+                for user_id in user_ids
+            )
+            await self._write_rollups(ops)
+            return len(events)
+
+    async def recent_users(self, limit: int) -> List[Dict[str, Any]]:
+        """[{user_id, last_frequency}] for the users whose events were stored most recently"""
+        return await self.db.pattern_rollups.find(
+            {"bucket": "state", "last_frequency": {"$ne": None}}, {"_id": 0, "user_id": 1, "last_frequency": 1}
+        ).sort("updated_at", DESCENDING).limit(limit).to_list(None)
+
+    async def revision(self, user_id: str) -> int:
+        """Bumped by every flush that stores events for the user - a cache key for anything derived from them"""
+        state = await self.db.pattern_rollups.find_one({"user_id": user_id, "bucket": "state"}, {"_id": 0, "revision": 1})
+        return (state or {}).get("revision", 0)
+
+    async def backfilled(self) -> bool:
+        return await self.db.pattern_rollups.find_one({"user_id": "", "bucket": "backfill"}, {"_id": 1}) is not None
+
+    async def backfill(self, batch_size: int = 500) -> Dict[str, int]:
+        """Rebuild rollups for every day before today from the raw events in db.patterns.
+
+        Closed buckets are overwritten with counts recomputed from the events,
+        so a rerun is harmless. Today's buckets are left to the live recorder.
+        """
+        cutoff = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        # Events written as ISO strings and older ones written as datetimes
+        query = {"$or": [{"timestamp": {"$lt": cutoff.isoformat()}}, {"timestamp": {"$lt": cutoff}}]}
+        projection = {"_id": 0, "user_id": 1, "frequency": 1, "action": 1, "timestamp": 1}
+        now = datetime.now(timezone.utc).isoformat()
+        totals = {"events": 0, "rollups": 0, "users": 0}
+        user_events: List[Dict[str, Any]] = []
+
+        async def fold_user(events: List[Dict[str, Any]]) -> None:
+            events.sort(key=lambda e: parse_timestamp(e.get("timestamp")) or cutoff)
+            last: Dict[str, Optional[str]] = {}
+            incs: Dict[Tuple[str, str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+            fold_events(events, last, incs)
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id, "bucket": bucket, "start": start},
+                    {"$set": {**nest_counts(counts), "updated_at": now}},
+                    upsert=True
+                )
+                for (user_id, bucket, start), counts in incs.items()
+            ]
+            for user_id, frequency in last.items():
+                ops.append(UpdateOne(
+                    {"user_id": user_id, "bucket": "state", "start": ""},
+                    {"$setOnInsert": {"last_frequency": frequency, "updated_at": now}},
+                    upsert=True
+                ))
+            for i in range(0, len(ops), batch_size):
+                await self.db.pattern_rollups.bulk_write(ops[i:i + batch_size], ordered=False)
+            totals["events"] += len(events)
+            totals["rollups"] += len(incs)
+            totals["users"] += 1
+
+        # User by user, so memory holds one user's events at a time
+        cursor = self.db.patterns.find(query, projection).sort("user_id", ASCENDING).batch_size(batch_size)
+        async for event in cursor:
+            if not event.get("user_id"):
+                continue
+            if user_events and user_events[-1]["user_id"] != event["user_id"]:
+                await fold_user(user_events)
+                user_events = []
+            user_events.append(event)
+        if user_events:
+            await fold_user(user_events)
+
+        await self.db.pattern_rollups.update_one(
+            {"user_id": "", "bucket": "backfill", "start": ""},
+            {"$set": {"before": cutoff.isoformat(), **totals, "updated_at": now}},
+            upsert=True
+        )
+        logger.info(f"Backfilled {totals['rollups']} rollups from {totals['events']} events for {totals['users']} users")
+        return totals
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Activity flusher error: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def merge_rollups(rollups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum a run of rollup docs into one summary"""
+    merged: Dict[str, Any] = {"total": 0, "frequencies": {}, "actions": {}, "transitions": {}}
+    for rollup in rollups:
+        merged["total"] += rollup.get("total", 0)
+        for field in ("frequencies", "actions"):
+            for key, count in (rollup.get(field) or {}).items():
+                merged[field][key] = merged[field].get(key, 0) + count
+        for source, targets in (rollup.get("transitions") or {}).items():
+            row = merged["transitions"].setdefault(source, {})
+            for target, count in targets.items():
+                row[target] = row.get(target, 0) + count
+    return merged
+
+
+def rollup_fingerprint(daily: List[Dict[str, Any]]) -> str:
+    """Coarse signature of a run of daily rollups.
+
+    Changes when a day is added, a day's dominant frequency flips or a day's
+    volume roughly doubles - not on every single event.
+    """
+    signature = []
+    for day in sorted(daily, key=lambda d: d.get("start", "")):
+        frequencies = day.get("frequencies") or {}
+        dominant = max(sorted(frequencies), key=frequencies.get) if frequencies else None
+        signature.append((day.get("start"), dominant, int(day.get("total", 0)).bit_length()))
+    return hashlib.sha1(json.dumps(signature).encode()).hexdigest()[:16]
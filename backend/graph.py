@@ -0,0 +1,280 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+
+class UserGraph:
+    """Adjacency lists for one user's nodes.
+
+    linked_ids are treated as undirected edges - a link shows up on both ends
+    and counts once towards each node's link_count. A link to an id with no
+    node behind it is dangling: it's parked in `waiting` and only becomes an
+    edge if that node shows up. Lineage (parent_id and merged_from) is kept
+    separately since it's directional.
+    """
+
+    def __init__(self):
+        self.links: Dict[str, Set[str]] = {}
+        self.outgoing: Dict[str, Set[str]] = {}
+        self.waiting: Dict[str, Set[str]] = {}
+        self.parent: Dict[str, Optional[str]] = {}
+        self.merged_from: Dict[str, List[str]] = {}
+
+    def _connect(self, a: str, b: str) -> None:
+        self.links[a].add(b)
+        self.links[b].add(a)
+
+    def _stop_waiting(self, source: str, target: str) -> None:
+        sources = self.waiting.get(target)
+        if sources is not None:
+            sources.discard(source)
+            if not sources:
+                del self.waiting[target]
+
+    def set_node(self, node: Dict[str, Any]) -> Set[str]:
+        """Insert or refresh a node; returns ids whose degree may have changed"""
+        node_id = node["id"]
+        affected = {node_id}
+        if node_id not in self.outgoing:
+            self.links[node_id] = set()
+            self.outgoing[node_id] = set()
+            # Links that arrived before this node did
+            for source in self.waiting.pop(node_id, ()):
+                self._connect(source, node_id)
+                affected.add(source)
+        old_out = self.outgoing[node_id]
+        new_out = {i for i in (node.get("linked_ids") or []) if i and i != node_id}
+
+        for target in old_out - new_out:
+            self._stop_waiting(node_id, target)
+            # Only drop the edge if the other side doesn't link back
+            if target in self.links and node_id not in self.outgoing[target]:
+                self.links[node_id].discard(target)
+                self.links[target].discard(node_id)
+        for target in new_out - old_out:
+            if target in self.outgoing:
+                self._connect(node_id, target)
+            else:
+                self.waiting.setdefault(target, set()).add(node_id)
+
+        self.outgoing[node_id] = new_out
+        self.parent[node_id] = node.get("parent_id")
+        self.merged_from[node_id] = list(node.get("merged_from") or [])
+        return affected | {i for i in old_out | new_out if i in self.outgoing}
+
+    def remove_node(self, node_id: str) -> Set[str]:
+        """Drop a node and its edges; returns the former neighbours, including nodes still linking to it"""
+        # A graph built after the node was deleted from Mongo only has its inbound links as waiting
+        neighbours = self.links.pop(node_id, set()) | self.waiting.pop(node_id, set())
+        for target in self.outgoing.pop(node_id, set()):
+            self._stop_waiting(node_id, target)
+        for other in neighbours:
+            self.links[other].discard(node_id)
+            self.outgoing[other].discard(node_id)
+        self.parent.pop(node_id, None)
+        self.merged_from.pop(node_id, None)
+        return neighbours
+
+    def dangling(self) -> Dict[str, List[str]]:
+        """node id -> linked ids that have no node"""
+        result: Dict[str, List[str]] = {}
+        for target, sources in self.waiting.items():
+            for source in sources:
+                result.setdefault(source, []).append(target)
+        return result
+
+    def drop_dangling(self) -> None:
+        for source, targets in self.dangling().items():
+            self.outgoing[source].difference_update(targets)
+        self.waiting.clear()
+
+    def degree(self, node_id: str) -> int:
+        return len(self.links.get(node_id, ()))
+
+    def neighbours(self, node_id: str) -> List[str]:
+        return sorted(self.links.get(node_id, ()))
+
+    def expand(self, node_id: str, depth: int, limit: int) -> Dict[str, int]:
+        """BFS out to depth hops; returns {node_id: hop distance}"""
+        if node_id not in self.links:
+            return {}
+        seen = {node_id: 0}
+        queue = deque([node_id])
+        while queue and len(seen) < limit:
+            current = queue.popleft()
+            if seen[current] >= depth:
+                continue
+            for other in sorted(self.links[current]):
+                if other not in seen:
+                    seen[other] = seen[current] + 1
+                    queue.append(other)
+                    if len(seen) >= limit:
+                        break
+        return seen
+
+    def shortest_path(self, source: str, target: str, max_depth: int = 12) -> Optional[List[str]]:
+        """Bidirectional BFS over links"""
+        if source not in self.links or target not in self.links:
+            return None
+        if source == target:
+            return [source]
+
+        prev: Dict[str, Optional[str]] = {source: None}
+        nxt: Dict[str, Optional[str]] = {target: None}
+        front, back = {source}, {target}
+        for _ in range(max_depth):
+            if len(front) > len(back):
+                front, back, prev, nxt = back, front, nxt, prev
+            layer = set()
+            for current in front:
+                for other in self.links[current]:
+                    if other in prev:
+                        continue
+                    prev[other] = current
+                    if other in nxt:
+                        return self._join(other, prev, nxt, source)
+                    layer.add(other)
+            if not layer:
+                return None
+            front = layer
+        return None
+
+    @staticmethod
+    def _join(meet: str, prev: Dict[str, Optional[str]], nxt: Dict[str, Optional[str]], source: str) -> List[str]:
+        head = []
+        node: Optional[str] = meet
+        while node is not None:
+            head.append(node)
+            node = prev[node]
+        head.reverse()
+        node = nxt[meet]
+        while node is not None:
+            head.append(node)
+            node = nxt[node]
+        return head if head[0] == source else list(reversed(head))
+
+    def components(self, min_size: int = 1) -> List[List[str]]:
+        seen: Set[str] = set()
+        result = []
+        for start in self.links:
+            if start in seen:
+                continue
+            component = []
+            queue = deque([start])
+            seen.add(start)
+            while queue:
+                current = queue.popleft()
+                component.append(current)
+                for other in self.links[current]:
+                    if other not in seen:
+                        seen.add(other)
+                        queue.append(other)
+            if len(component) >= min_size:
+                result.append(sorted(component))
+        result.sort(key=len, reverse=True)
+        return result
+
+    def lineage(self, node_id: str, limit: int = 500) -> Dict[str, Any]:
+        """Ancestor chain via parent_id plus everything folded in via merged_from"""
+        chain = []
+        current = self.parent.get(node_id)
+        visited = {node_id}
+        while current and current not in visited and len(chain) < limit:
+            chain.append(current)
+            visited.add(current)
+            current = self.parent.get(current)
+
+        merged = []
+        queue = deque(self.merged_from.get(node_id, []))
+        seen = {node_id}
+        while queue and len(merged) < limit:
+            source = queue.popleft()
+            if source in seen:
+                continue
+            seen.add(source)
+            merged.append(source)
+            queue.extend(self.merged_from.get(source, []))
+
+        children = [i for i, p in self.parent.items() if p == node_id]
+        return {"ancestors": chain, "merged_from": merged, "children": sorted(children)}
+
+
+class GraphIndex:
+    """Lazily loaded per-user graphs, kept in step with writes to db.nodes"""
+
+    PROJECTION = {"_id": 0, "id": 1, "linked_ids": 1, "parent_id": 1, "merged_from": 1}
+
+    def __init__(self, db, max_users: int = 1024):
+        self.db = db
+        self.max_users = max_users
+        self._graphs: "OrderedDict[str, UserGraph]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, user_id: str) -> UserGraph:
+        graph = self._graphs.get(user_id)
+        if graph is not None:
+            self._graphs.move_to_end(user_id)
+            return graph
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            graph = self._graphs.get(user_id)
+            if graph is None:
+                graph = UserGraph()
+                async for node in self.db.nodes.find({"user_id": user_id}, self.PROJECTION):
+                    graph.set_node(node)
+                self._graphs[user_id] = graph
+                while len(self._graphs) > self.max_users:
+                    evicted, _ = self._graphs.popitem(last=False)
+                    self._locks.pop(evicted, None)
+        return graph
+
+    def invalidate(self, user_id: str) -> None:
+        self._graphs.pop(user_id, None)
+
+    async def _write_link_counts(self, user_id: str, graph: UserGraph, node_ids: Iterable[str],
+                                 rev: Optional[int] = None) -> Dict[str, int]:
+        counts = {node_id: graph.degree(node_id) for node_id in node_ids}
+        ops = [
+            UpdateOne({"id": node_id, "user_id": user_id},
+                      {"$set": {"link_count": count} if rev is None else {"link_count": count, "rev": rev}})
+            for node_id, count in counts.items()
+        ]
+        if ops:
+            await self.db.nodes.bulk_write(ops, ordered=False)
+        return counts
+
+    async def recount(self, user_id: str, rev: Optional[int] = None) -> int:
+        """Rebuild the user's graph from Mongo, prune links to missing nodes and rewrite every node's link_count"""
+        self.invalidate(user_id)
+        graph = await self.get(user_id)
+        ops = [
+            UpdateOne({"id": source, "user_id": user_id}, {"$pull": {"linked_ids": {"$in": targets}}})
+            for source, targets in graph.dangling().items()
+        ]
+        if ops:
+            await self.db.nodes.bulk_write(ops, ordered=False)
+            graph.drop_dangling()
+        counts = await self._write_link_counts(user_id, graph, list(graph.parent), rev)
+        return len(counts)
+
+    async def node_updated(self, user_id: str, node: Dict[str, Any], rev: Optional[int] = None) -> Dict[str, int]:
+        """Fold an updated node into the graph; returns refreshed link_counts by node id"""
+        graph = await self.get(user_id)
+        affected = graph.set_node(node)
+        return await self._write_link_counts(user_id, graph, affected, rev)
+
+    async def node_deleted(self, user_id: str, node_id: str, rev: Optional[int] = None) -> Dict[str, int]:
+        """Drop a node from the graph; returns refreshed link_counts of its neighbours"""
+        graph = await self.get(user_id)
+        neighbours = graph.remove_node(node_id)
+        if not neighbours:
+            return {}
+        # Don't leave dangling links behind on the other end
+        update: Dict[str, Any] = {"$pull": {"linked_ids": node_id}}
+        if rev is not None:
+            update["$set"] = {"rev": rev}
+        await self.db.nodes.update_many({"user_id": user_id, "id": {"$in": list(neighbours)}}, update)
+        return await self._write_link_counts(user_id, graph, neighbours, rev)
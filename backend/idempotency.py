@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+PENDING, DONE = "pending", "done"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable hash of a request's identifying parts"""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """Same Idempotency-Key replayed with a different request body"""
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls onto one in-flight task"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one caller disconnecting doesn't cancel the shared call
+        return await asyncio.shield(fut)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+
+class IdempotencyStore:
+    """Short-lived results keyed by Idempotency-Key, with singleflight for in-flight replays.
+
+    With a collection, keys are claimed in Mongo (unique `key`) and results stored
+    there too, so a retry that lands on another worker replays the result - or
+    waits for the worker still running it - instead of calling upstream again.
+    A claim whose worker died frees up once its lease runs out; a live worker
+    renews its lease while the call runs. Each claim carries an owner token, so
+    a worker that lost its claim can't delete or complete the one that replaced it.
+    """
+
+    def __init__(self, collection=None, ttl: float = 600.0, max_entries: int = 10000,
+                 lease_seconds: float = 120.0, poll_interval: float = 0.25):
+        self.collection = collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._results: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._pending: Dict[str, str] = {}
+        self._flight = SingleFlight()
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        while self._results:
+            key, (expires_at, _, _) = next(iter(self._results.items()))
+            if expires_at > now and len(self._results) <= self.max_entries:
+                break
+            self._results.popitem(last=False)
+
+    def get(self, key: str, fingerprint: str) -> Optional[Any]:
+        self._prune()
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[1] != fingerprint:
+            raise IdempotencyConflict(key)
+        return entry[2]
+
+    async def _claim(self, key: str, fingerprint: str) -> Tuple[Optional[str], Any]:
+        """(owner token, None) once this worker owns the key, (None, result) when another worker finished it"""
+        owner = uuid.uuid4().hex
+        while True:
+            now = _now()
+            # The TTL monitor only runs once a minute - expired entries don't count
+            await self.collection.delete_one({"key": key, "expires_at": {"$lte": now}})
+            try:
+                await self.collection.insert_one({
+                    "key": key,
+                    "fingerprint": fingerprint,
+                    "state": PENDING,
+                    "owner": owner,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "expires_at": now + timedelta(seconds=self.ttl),
+                })
+                return owner, None
+            except DuplicateKeyError:
+                pass
+            entry = await self.collection.find_one({"key": key}, {"_id": 0})
+            if entry is None:
+                continue
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(key)
+            if entry["state"] == DONE:
+                return None, entry["result"]
+            taken = await self.collection.find_one_and_update(
+                {"key": key, "state": PENDING, "lease_until": {"$lte": now}},
+                {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            )
+            if taken is not None:
+                return owner, None
+            await asyncio.sleep(self.poll_interval)
+
+    async def _keep_lease(self, key: str, owner: str):
+        """Extend the claim while the call runs - a failed extension is retried, not fatal"""
+        delay = self.lease_seconds / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                result = await self.collection.update_one(
+                    {"key": key, "state": PENDING, "owner": owner},
+                    {"$set": {"lease_until": _now() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                # The lease still has time left - retry sooner than the usual beat
+                logger.warning(f"Could not extend the claim on idempotency key {key}: {e}")
+                delay = self.lease_seconds / 10
+                continue
+            if not result.matched_count:
+                logger.warning(f"Lost the claim on idempotency key {key} - it may run again elsewhere")
+                return
+            delay = self.lease_seconds / 3
+
+    async def run(self, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, replayed). Only successful results are stored."""
+        cached = self.get(key, fingerprint)
+        if cached is not None:
+            return cached, True
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            if pending != fingerprint:
+                raise IdempotencyConflict(key)
+            result, _ = await self._flight.do(key, fn)
+            return result, True
+
+        async def call_and_store():
+            # Runs inside the shared task, so the result is kept even if the first caller disconnects
+            try:
+                replayed, owner, heartbeat = False, None, None
+                if self.collection is not None:
+                    owner, result = await self._claim(key, fingerprint)
+                    replayed = owner is None
+                if not replayed:
+                    if owner is not None:
+                        heartbeat = asyncio.create_task(self._keep_lease(key, owner))
+                    try:
+                        result = await fn()
+                    except BaseException:
+                        if owner is not None:
+                            # Let a retry run it again - unless another worker has taken the key over since
+                            await self.collection.delete_one({"key": key, "state": PENDING, "owner": owner})
+                        raise
+                    finally:
+                        if heartbeat is not None:
+                            heartbeat.cancel()
+                    if owner is not None:
+                        await self.collection.update_one({"key": key, "owner": owner}, {"$set": {
+                            "state": DONE, "result": result, "expires_at": _now() + timedelta(seconds=self.ttl)
+                        }})
+                self._results[key] = (time.monotonic() + self.ttl, fingerprint, result)
+                return result, replayed
+            finally:
+                self._pending.pop(key, None)
+
+        self._pending[key] = fingerprint
+        return await self._flight.do(key, call_and_store)
@@ -0,0 +1,251 @@
+"""Durable background jobs: a Mongo-backed queue worked by an asyncio pool.
+
+Jobs live in db.jobs and are claimed with an atomic find_one_and_update that
+takes a lease. Workers extend the lease while a handler runs. If a worker
+dies, its lease expires and another worker picks the job up. Failures retry
+with exponential backoff up to max_attempts.
+
+A dedupe_key is held in `active_key` while a job is queued. A sparse unique
+index on it means a second enqueue with the same key is a no-op until the
+first job starts running.
+"""
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobRunner:
+    def __init__(self, db, workers: int = 4, lease_seconds: float = 60.0, poll_interval: float = 1.0,
+                 retain_seconds: float = 7 * 24 * 3600):
+        self.collection = db.jobs
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retain_seconds = retain_seconds
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._handlers: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._claim_lock: Optional[asyncio.Lock] = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.lease_errors = 0
+
+    def register(self, job_type: str, handler: Handler, concurrency: int = 1, max_attempts: int = 5,
+                 timeout: float = 300.0, backoff: float = 5.0) -> None:
+        """concurrency caps how many jobs of this type one process runs at once"""
+        self._handlers[job_type] = {
+            "handler": handler,
+            "concurrency": concurrency,
+            "max_attempts": max_attempts,
+            "timeout": timeout,
+            "backoff": backoff,
+        }
+        self._running.setdefault(job_type, 0)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("type", 1), ("run_at", 1)])
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index("active_key", unique=True, sparse=True)
+        # Finished jobs clean themselves up
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], user_id: Optional[str] = None,
+                      dedupe_key: Optional[str] = None, delay: float = 0.0) -> Optional[str]:
+        """Queue a job; returns its id, or the already-queued job's id for a duplicate dedupe_key"""
+        if job_type not in self._handlers:
+            raise ValueError(f"No handler registered for job type {job_type}")
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "user_id": user_id,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": self._handlers[job_type]["max_attempts"],
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+            "updated_at": now,
+        }
+        if dedupe_key:
+            job["active_key"] = f"{job_type}:{dedupe_key}"
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"active_key": job["active_key"]}, {"_id": 0, "id": 1})
+            return existing["id"] if existing else None
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job["id"]
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        query: Dict[str, Any] = {"id": job_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return await self.collection.find_one(query, {"_id": 0, "active_key": 0, "lease_until": 0, "worker": 0})
+
+    def _free_types(self) -> List[str]:
+        return [t for t, spec in self._handlers.items() if self._running[t] < spec["concurrency"]]
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        types = self._free_types()
+        if not types:
+            return None
+        now = _now()
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": types},
+                "$or": [
+                    {"status": QUEUED, "run_at": {"$lte": now}},
+                    # Lease ran out - the worker that held it is gone
+                    {"status": RUNNING, "lease_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {"status": RUNNING, "worker": self.worker_id, "started_at": now, "updated_at": now,
+                         "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$unset": {"active_key": ""},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _keep_lease(self, job_id: str):
+        """Extend the lease while the handler runs - a failed extension is retried, not fatal"""
+        delay = self.lease_seconds / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                result = await self.collection.update_one(
+                    {"id": job_id, "worker": self.worker_id, "status": RUNNING},
+                    {"$set": {"lease_until": _now() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                # The lease still has time left - retry sooner than the usual beat
+                self.lease_errors += 1
+                logger.warning(f"Could not extend the lease on job {job_id}: {e}")
+                delay = self.lease_seconds / 10
+                continue
+            if not result.matched_count:
+                logger.warning(f"Lost the lease on job {job_id} - it may run again elsewhere")
+                return
+            delay = self.lease_seconds / 3
+
+    async def _finish(self, job: Dict[str, Any], update: Dict[str, Any]):
+        update.setdefault("$set", {})["updated_at"] = _now()
+        update.setdefault("$unset", {})["lease_until"] = ""
+        await self.collection.update_one({"id": job["id"], "worker": self.worker_id}, update)
+
+    async def _execute(self, job: Dict[str, Any]):
+        spec = self._handlers[job["type"]]
+        heartbeat = asyncio.create_task(self._keep_lease(job["id"]))
+        try:
+            result = await asyncio.wait_for(spec["handler"](job["payload"]), spec["timeout"])
+        except asyncio.CancelledError:
+            # Shutting down - hand the job straight back instead of waiting out the lease
+            await asyncio.shield(self._finish(job, {"$set": {"status": QUEUED, "run_at": _now()}, "$inc": {"attempts": -1}}))
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if job["attempts"] >= job.get("max_attempts", spec["max_attempts"]):
+                self.failed += 1
+                logger.error(f"Job {job['type']} {job['id']} failed for good: {error}")
+                await self._finish(job, {"$set": {
+                    "status": FAILED, "last_error": error, "finished_at": _now(),
+                    "expires_at": _now() + timedelta(seconds=self.retain_seconds)
+                }})
+            else:
+                self.retried += 1
+                delay = min(spec["backoff"] * 2 ** (job["attempts"] - 1), 3600) * random.uniform(0.8, 1.2)
+                logger.warning(f"Job {job['type']} {job['id']} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+                await self._finish(job, {"$set": {
+                    "status": QUEUED, "last_error": error, "run_at": _now() + timedelta(seconds=delay)
+                }})
+        else:
+            self.completed += 1
+            await self._finish(job, {"$set": {
+                "status": DONE, "result": result, "finished_at": _now(),
+                "expires_at": _now() + timedelta(seconds=self.retain_seconds)
+            }})
+        finally:
+            heartbeat.cancel()
+            self._running[job["type"]] -= 1
+            self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            try:
+                # Claim and count under one lock so workers can't overshoot a type's concurrency
+                async with self._claim_lock:
+                    job = await self._claim()
+                    if job is not None:
+                        self._running[job["type"]] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job bookkeeping failed for {job.get('id')}: {e}")
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, Dict[str, int]] = {}
+        async for row in self.collection.aggregate([
+            {"$match": {"status": {"$in": [QUEUED, RUNNING, FAILED]}}},
+            {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}},
+        ]):
+            counts.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+        return {
+            "worker_id": self.worker_id,
+            "running_here": dict(self._running),
+            "queue": counts,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "lease_errors": self.lease_errors,
+        }
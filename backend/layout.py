@@ -0,0 +1,400 @@
+"""Server-side canvas layout for new artifacts.
+
+Existing artifacts are bucketed into a uniform grid hash over their
+position/size rects, so checking a candidate slot only touches the few
+cells it covers. New artifacts are placed on the first free slot of an
+outward spiral around the anchor point. Artifacts born together with a
+diagram can optionally be pulled into a cluster with a small NumPy
+force-directed pass before the final overlap check.
+
+A CanvasLayout keeps one conversation's grid hash alive between turns
+together with a frontier - the spiral slot where the last search found
+room - so each search resumes where the last one stopped instead of
+walking every occupied ring again. CanvasLayouts holds them per
+conversation and is kept current by the same write-through hooks as the
+workspace cache.
+"""
+import math
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+Rect = Tuple[float, float, float, float]  # x, y, width, height
+
+DEFAULT_SIZE = {"width": 200, "height": 100}
+DEFAULT_ANCHOR = (400.0, 300.0)
+GAP = 24.0
+
+
+def artifact_rect(artifact: Dict) -> Rect:
+    position = artifact.get("position") or {}
+    size = artifact.get("size") or DEFAULT_SIZE
+    return (
+        float(position.get("x", 0)),
+        float(position.get("y", 0)),
+        float(size.get("width", DEFAULT_SIZE["width"])),
+        float(size.get("height", DEFAULT_SIZE["height"])),
+    )
+
+
+def rects_overlap(a: Rect, b: Rect, gap: float = 0.0) -> bool:
+    return (
+        a[0] < b[0] + b[2] + gap and b[0] < a[0] + a[2] + gap and
+        a[1] < b[1] + b[3] + gap and b[1] < a[1] + a[3] + gap
+    )
+
+
+class GridIndex:
+    """Uniform grid hash of rectangles - O(1) cell lookup per query.
+
+    Rects inserted with a key can later be moved (upsert) or removed.
+    """
+
+    def __init__(self, cell_size: float = 256.0):
+        self.cell_size = cell_size
+        # Cell -> insertion-ordered set of rect indices
+        self._cells: Dict[Tuple[int, int], Dict[int, None]] = {}
+        self._rects: Dict[int, Rect] = {}
+        self._items: Dict[int, Any] = {}
+        self._keys: Dict[Any, int] = {}
+        self._next = 0
+
+    def _cell_range(self, rect: Rect) -> Tuple[int, int, int, int]:
+        x, y, w, h = rect
+        cs = self.cell_size
+        return (math.floor(x / cs), math.floor((x + w) / cs),
+                math.floor(y / cs), math.floor((y + h) / cs))
+
+    def _cells_for(self, rect: Rect) -> Iterable[Tuple[int, int]]:
+        cx0, cx1, cy0, cy1 = self._cell_range(rect)
+        # Huge (zoomed-out) rects: walk the occupied cells instead of the empty ones
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            for cx, cy in list(self._cells):
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    yield cx, cy
+            return
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                yield cx, cy
+
+    def insert(self, rect: Rect, item: Any = None, key: Any = None) -> int:
+        if key is not None:
+            self.remove(key)
+        idx = self._next
+        self._next += 1
+        self._rects[idx] = rect
+        self._items[idx] = item
+        if key is not None:
+            self._keys[key] = idx
+        cx0, cx1, cy0, cy1 = self._cell_range(rect)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self._cells.setdefault((cx, cy), {})[idx] = None
+        return idx
+
+    def remove(self, key: Any) -> Optional[Rect]:
+        """Drop the rect inserted under key; returns it, or None if there was none"""
+        idx = self._keys.pop(key, None)
+        if idx is None:
+            return None
+        rect = self._rects.pop(idx)
+        self._items.pop(idx, None)
+        cx0, cx1, cy0, cy1 = self._cell_range(rect)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    cell.pop(idx, None)
+                    if not cell:
+                        del self._cells[(cx, cy)]
+        return rect
+
+    def rect_of(self, key: Any) -> Optional[Rect]:
+        idx = self._keys.get(key)
+        return None if idx is None else self._rects[idx]
+
+    def occupied(self, cell: Tuple[int, int]) -> bool:
+        return cell in self._cells
+
+    def _query_indices(self, rect: Rect) -> List[int]:
+        seen = set()
+        hits = []
+        for cell in self._cells_for(rect):
+            for idx in self._cells.get(cell, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if rects_overlap(rect, self._rects[idx]):
+                    hits.append(idx)
+        return hits
+
+    def query(self, rect: Rect) -> List[Rect]:
+        """Rects whose bounding boxes intersect the given rect"""
+        return [self._rects[idx] for idx in self._query_indices(rect)]
+
+    def query_items(self, rect: Rect) -> List[Any]:
+        """Items (as passed to insert) whose rects intersect the given rect"""
+        return [self._items[idx] for idx in self._query_indices(rect)]
+
+    def is_free(self, rect: Rect, gap: float = GAP) -> bool:
+        padded = (rect[0] - gap, rect[1] - gap, rect[2] + 2 * gap, rect[3] + 2 * gap)
+        return not self.query(padded)
+
+    def __len__(self) -> int:
+        return len(self._rects)
+
+
+_RING_OFFSETS: Dict[int, List[Tuple[int, int]]] = {0: [(0, 0)]}
+
+
+def ring_offsets(ring: int) -> List[Tuple[int, int]]:
+    """Grid offsets on one square ring around the anchor, nearest first"""
+    offsets = _RING_OFFSETS.get(ring)
+    if offsets is None:
+        edge = {(i, j) for i in range(-ring, ring + 1) for j in (-ring, ring)}
+        edge |= {(j, i) for i, j in edge}
+        offsets = _RING_OFFSETS[ring] = sorted(edge, key=lambda o: (o[0] ** 2 + o[1] ** 2, -o[0], -o[1]))
+    return offsets
+
+
+def find_slot_from(index: GridIndex, width: float, height: float,
+                   anchor: Tuple[float, float], step: float = 40.0,
+                   start: Tuple[int, int] = (0, 0), max_rings: int = 200) -> Tuple[float, float, Tuple[int, int]]:
+    """Walk the spiral from start = (ring, position in ring) until a slot is free -> (x, y, (ring, position)).
+
+    Candidates within a ring are tried nearest-first; slots with negative
+    coordinates are skipped since the canvas starts at the origin. Gives
+    up max_rings rings past the start ring.
+    """
+    ax, ay = max(anchor[0], 0.0), max(anchor[1], 0.0)
+    start_ring, start_pos = start
+    last_ring = start_ring + max_rings
+    for ring in range(start_ring, last_ring + 1):
+        offsets = ring_offsets(ring)
+        for pos in range(start_pos if ring == start_ring else 0, len(offsets)):
+            dx, dy = offsets[pos]
+            x, y = ax + dx * step, ay + dy * step
+            if x < 0 or y < 0:
+                continue
+            if index.is_free((x, y, width, height)):
+                return x, y, (ring, pos)
+    # Canvas is saturated around the anchor - drop it to the right of everything
+    return ax + (last_ring + 1) * step, ay, (last_ring, 0)
+
+
+def find_free_slot(index: GridIndex, width: float, height: float,
+                   anchor: Tuple[float, float], step: float = 40.0,
+                   max_rings: int = 200) -> Tuple[float, float]:
+    """Nearest free slot on an outward spiral around anchor"""
+    x, y, _ = find_slot_from(index, width, height, anchor, step, (0, 0), max_rings)
+    return x, y
+
+
+def relax_positions(positions: "np.ndarray", sizes: "np.ndarray", edges: Sequence[Tuple[int, int]],
+                    fixed: Optional[Sequence[int]] = None, iterations: int = 60,
+                    spring_length: float = 200.0, repulsion: float = 40000.0,
+                    step: float = 0.1) -> "np.ndarray":
+    """Vectorized spring/repulsion pass over artifact centres.
+
+    positions and sizes are (n, 2) arrays of top-left corners and
+    width/height; indices in fixed stay where they are. Returns new
+    top-left corners.
+    """
+    import numpy as np  # only needed for relaxation - kept off the startup path
+
+    n = len(positions)
+    if n < 2:
+        return positions.copy()
+
+    centres = positions + sizes / 2.0
+    edge_arr = np.asarray(edges, dtype=int).reshape(-1, 2)
+    movable = np.ones((n, 1))
+    if fixed:
+        movable[list(fixed)] = 0.0
+
+    for _ in range(iterations):
+        delta = centres[:, None, :] - centres[None, :, :]
+        dist2 = np.maximum((delta ** 2).sum(axis=-1), 1.0)
+        np.fill_diagonal(dist2, np.inf)
+        force = (delta * (repulsion / dist2)[..., None]).sum(axis=1)
+
+        if len(edge_arr):
+            a, b = edge_arr[:, 0], edge_arr[:, 1]
+            d = centres[b] - centres[a]
+            length = np.maximum(np.linalg.norm(d, axis=1), 1e-6)
+            pull = (d / length[:, None]) * (length - spring_length)[:, None] * 0.5
+            np.add.at(force, a, pull)
+            np.add.at(force, b, -pull)
+
+        centres = centres + np.clip(force * step, -50.0, 50.0) * movable
+
+    return centres - sizes / 2.0
+
+
+class CanvasLayout:
+    """One conversation's artifacts in a grid hash, plus the spiral frontier.
+
+    `frontier` is a (ring, position in ring) spiral cursor: every slot
+    before it is believed taken, so placement resumes there. It moves back
+    when an artifact is moved or removed. The frontier is only a search
+    hint - a slot is always checked against the grid before it is used, so
+    a stale frontier can make a layout less compact but never overlapping.
+    """
+
+    def __init__(self, anchor: Tuple[float, float] = DEFAULT_ANCHOR, step: float = 40.0, cell_size: float = 256.0):
+        self.anchor = (max(anchor[0], 0.0), max(anchor[1], 0.0))
+        self.step = step
+        self.index = GridIndex(cell_size=cell_size)
+        self.frontier: Tuple[int, int] = (0, 0)
+
+    @classmethod
+    def from_artifacts(cls, artifacts: Iterable[Dict], **kwargs) -> "CanvasLayout":
+        layout = cls(**kwargs)
+        for artifact in artifacts:
+            layout.index.insert(artifact_rect(artifact), artifact, key=artifact.get("id"))
+        layout.frontier = (layout._estimate_frontier(), 0)
+        return layout
+
+    def _estimate_frontier(self) -> int:
+        """First ring of grid cells around the anchor with an empty cell, in slot rings.
+
+        Checking a cell is one dict lookup, so this is much cheaper than
+        walking the slot spiral through a densely packed canvas.
+        """
+        cs = self.index.cell_size
+        acx, acy = math.floor(self.anchor[0] / cs), math.floor(self.anchor[1] / cs)
+        # Rings 0..k of the quadrant hold over k*k/2 cells, so an empty one turns up by sqrt(2 * occupied)
+        for ring in range(math.isqrt(2 * len(self.index._cells)) + 2):
+            for dx, dy in ring_offsets(ring):
+                cx, cy = acx + dx, acy + dy
+                if cx >= 0 and cy >= 0 and not self.index.occupied((cx, cy)):
+                    return max(0, int((ring - 1) * cs / self.step))
+        return 0
+
+    def _ring_near(self, rect: Rect) -> int:
+        """Innermost slot ring whose candidates could overlap rect"""
+        x, y, w, h = rect
+        ax, ay = self.anchor
+        # A candidate of about this size overlaps when its corner lies within w + GAP of the rect
+        dx = max(x - w - GAP - ax, ax - (x + w + GAP), 0.0)
+        dy = max(y - h - GAP - ay, ay - (y + h + GAP), 0.0)
+        return int(max(dx, dy) // self.step)
+
+    def upsert(self, artifact: Dict) -> None:
+        old = self.index.remove(artifact.get("id"))
+        if old is not None:
+            self._reopen(old)
+        self.index.insert(artifact_rect(artifact), artifact, key=artifact.get("id"))
+
+    def remove(self, artifact_id: str) -> None:
+        old = self.index.remove(artifact_id)
+        if old is not None:
+            self._reopen(old)
+
+    def _reopen(self, rect: Rect) -> None:
+        self.frontier = min(self.frontier, (self._ring_near(rect), 0))
+
+    def place(self, width: float, height: float) -> Tuple[float, float]:
+        """Next free slot on the spiral, resuming at the frontier"""
+        x, y, self.frontier = find_slot_from(self.index, width, height, self.anchor, self.step, self.frontier)
+        return x, y
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class CanvasLayouts:
+    """LRU of CanvasLayout per (user, conversation), kept current by write-through"""
+
+    def __init__(self, max_layouts: int = 256):
+        self.max_layouts = max_layouts
+        self._layouts: "OrderedDict[Tuple[str, str], CanvasLayout]" = OrderedDict()
+
+    def get(self, user_id: str, conversation_id: str) -> Optional[CanvasLayout]:
+        layout = self._layouts.get((user_id, conversation_id))
+        if layout is not None:
+            self._layouts.move_to_end((user_id, conversation_id))
+        return layout
+
+    def build(self, user_id: str, conversation_id: str, artifacts: Iterable[Dict]) -> CanvasLayout:
+        layout = self._layouts[(user_id, conversation_id)] = CanvasLayout.from_artifacts(artifacts)
+        self._layouts.move_to_end((user_id, conversation_id))
+        while len(self._layouts) > self.max_layouts:
+            self._layouts.popitem(last=False)
+        return layout
+
+    def artifact_changed(self, user_id: str, artifact: Dict) -> None:
+        """Live artifacts land in their conversation's layout; archived ones leave every layout"""
+        self.artifact_removed(user_id, artifact.get("id"))
+        if artifact.get("archived"):
+            return
+        layout = self._layouts.get((user_id, artifact.get("conversation_id")))
+        if layout is not None:
+            layout.upsert(artifact)
+
+    def artifact_removed(self, user_id: str, artifact_id: str) -> None:
+        for (uid, _), layout in self._layouts.items():
+            if uid == user_id:
+                layout.remove(artifact_id)
+
+    def invalidate(self, user_id: str, conversation_id: Optional[str] = None) -> None:
+        for key in list(self._layouts):
+            if key[0] == user_id and (conversation_id is None or key[1] == conversation_id):
+                del self._layouts[key]
+
+
+def place_artifacts(existing: Optional[List[Dict]], new_specs: List[Dict],
+                    anchor: Optional[Tuple[float, float]] = None,
+                    relax: bool = True, layout: Optional[CanvasLayout] = None,
+                    keys: Optional[Sequence[Any]] = None) -> List[Dict[str, Dict[str, float]]]:
+    """Compute non-overlapping position/size for each new artifact spec.
+
+    With a layout the search resumes at its frontier and the placed rects
+    stay in it under `keys` (the new artifacts' ids); otherwise a layout is
+    built from `existing`. Returns one {"position": ..., "size": ...} dict
+    per spec, in order.
+    """
+    if layout is None:
+        layout = CanvasLayout.from_artifacts(existing or [], anchor=anchor or DEFAULT_ANCHOR)
+    scratch = keys is None
+    keys = [("new", i) for i in range(len(new_specs))] if scratch else list(keys)
+    index = layout.index
+    sizes = [
+        (float((spec.get("size") or DEFAULT_SIZE).get("width", DEFAULT_SIZE["width"])),
+         float((spec.get("size") or DEFAULT_SIZE).get("height", DEFAULT_SIZE["height"])))
+        for spec in new_specs
+    ]
+
+    placed: List[Tuple[float, float]] = []
+    for key, (width, height) in zip(keys, sizes):
+        x, y = layout.place(width, height)
+        index.insert((x, y, width, height), key=key)
+        placed.append((x, y))
+
+    # Diagrams act as hubs: artifacts created in the same turn cluster around them
+    hubs = [i for i, spec in enumerate(new_specs) if spec.get("type") == "diagram"]
+    if relax and hubs and len(new_specs) > 1:
+        edges = [(h, j) for h in hubs for j in range(len(new_specs)) if j != h]
+        import numpy as np
+        relaxed = relax_positions(np.array(placed), np.array(sizes), edges, fixed=hubs)
+
+        for key in keys:
+            index.remove(key)
+        placed = []
+        for key, (rx, ry), (width, height) in zip(keys, relaxed.tolist(), sizes):
+            # Relaxed points sit next to the frontier, so this local spiral is short
+            x, y = find_free_slot(index, width, height, (rx, ry), layout.step)
+            x, y = round(x, 1), round(y, 1)
+            index.insert((x, y, width, height), key=key)
+            placed.append((x, y))
+
+    if scratch:
+        for key in keys:
+            index.remove(key)
+
+    return [
+        {"position": {"x": x, "y": y}, "size": {"width": w, "height": h}}
+        for (x, y), (w, h) in zip(placed, sizes)
+    ]
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.monitoring import ConnectionPoolListener
+
+logger = logging.getLogger(__name__)
+
+
+def client_options_from_env() -> Dict[str, Any]:
+    """Motor/PyMongo pool settings, overridable per deployment"""
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "10")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    }
+
+
+class PoolMonitor(ConnectionPoolListener):
+    """Counts connection pool events so readiness can report pool usage"""
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.created = 0
+        self.closed = 0
+        self.checkout_failures = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open += 1
+        self.created += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+        self.closed += 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open": self.open,
+            "checked_out": self.checked_out,
+            "created": self.created,
+            "closed": self.closed,
+            "checkout_failures": self.checkout_failures,
+        }
+
+
+# (collection, keys, options) - everything the request paths filter or sort on
+INDEXES: List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]] = [
+    ("users", [("email", ASCENDING)], {}),
+    ("users", [("id", ASCENDING)], {}),
+    ("nodes", [("id", ASCENDING)], {}),
+    ("nodes", [("user_id", ASCENDING), ("frequency", ASCENDING)], {}),
+    ("nodes", [("user_id", ASCENDING), ("rev", ASCENDING)], {}),
+    ("artifacts", [("id", ASCENDING)], {}),
+    ("artifacts", [("user_id", ASCENDING), ("conversation_id", ASCENDING)], {}),
+    ("artifacts", [("user_id", ASCENDING), ("rev", ASCENDING)], {}),
+    ("tombstones", [("user_id", ASCENDING), ("rev", ASCENDING)], {}),
+    ("conversations", [("user_id", ASCENDING), ("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], {}),
+    ("conversations", [("id", ASCENDING)], {"unique": True, "sparse": True}),
+    ("archived_sessions", [("user_id", ASCENDING), ("archived_at", DESCENDING)], {}),
+    ("insights", [("user_id", ASCENDING), ("model", ASCENDING)], {"unique": True}),
+]
+
+
+async def ping(db) -> float:
+    """Round trip to the server in milliseconds"""
+    started = time.perf_counter()
+    await db.command("ping")
+    return (time.perf_counter() - started) * 1000
+
+
+async def warm_up(db, min_pool_size: int, attempts: int = 5) -> Dict[str, Any]:
+    """Wait for Mongo, pre-open min_pool_size connections and make sure indexes exist"""
+    latency = None
+    for attempt in range(1, attempts + 1):
+        try:
+            latency = await ping(db)
+            break
+        except Exception as e:
+            logger.warning(f"Mongo ping failed (attempt {attempt}/{attempts}): {e}")
+            await asyncio.sleep(min(2 ** attempt * 0.25, 4))
+    if latency is None:
+        raise RuntimeError("Mongo unreachable during warm-up")
+
+    # Concurrent pings each need their own socket, which fills the pool up front
+    if min_pool_size > 1:
+        await asyncio.gather(*(ping(db) for _ in range(min_pool_size)))
+
+    failed = []
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Index {collection}{keys} not created: {e}")
+            failed.append(collection)
+    if failed:
+        raise RuntimeError(f"Indexes not created on {', '.join(sorted(set(failed)))}")
+
+    return {"ping_ms": round(latency, 2)}
@@ -0,0 +1,72 @@
+"""Lazily imported LLM provider SDKs.
+
+Nothing here imports openai or emergentintegrations at module import time,
+so a worker only pays for the SDKs it actually talks to. Clients are cached
+per (key, base_url) so their HTTP connection pools are reused across calls.
+"""
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_lock = threading.Lock()
+
+
+def openai_client(api_key: str, base_url: Optional[str] = None):
+    """Shared AsyncOpenAI client for this key/base_url"""
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url) if base_url else AsyncOpenAI(api_key=api_key)
+                _clients[key] = client
+    return client
+
+
+_warmed: Dict[int, float] = {}
+
+
+async def warm_connection(client, min_interval: float = 30.0) -> bool:
+    """Open (or keep alive) the client's pooled HTTPS connection with a cheap authenticated GET.
+
+    The response doesn't matter - the TCP/TLS handshake is what we're paying for
+    ahead of time. Skipped if this client was warmed within min_interval.
+    """
+    now = time.monotonic()
+    if now - _warmed.get(id(client), 0.0) < min_interval:
+        return False
+    _warmed[id(client)] = now
+    try:
+        await client.with_options(max_retries=0, timeout=5.0).models.list()
+    except Exception as e:
+        logger.debug(f"Connection warm-up request failed (connection may still be open): {e}")
+    return True
+
+
+def emergent_chat():
+    """(LlmChat, UserMessage) from emergentintegrations"""
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    return LlmChat, UserMessage
+
+
+PROVIDER_MODULES = {
+    "hermes": "openai",
+    "openai": "openai",
+    "emergent": "emergentintegrations.llm.chat",
+}
+
+
+def preload(providers) -> None:
+    """Import SDKs for the configured providers - meant to run off the event loop after startup"""
+    for module in sorted({PROVIDER_MODULES[p] for p in providers if p in PROVIDER_MODULES}):
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.error(f"Could not preload {module}: {e}")
@@ -0,0 +1,180 @@
+"""Artifact references in LLM output ("merge ARTIFACT_1a2b3c4d with ARTIFACT_9f8e...").
+
+References are full artifact ids or short prefixes of them (the canvas
+context shows the model SHORT_ID_LENGTH-char ids). Each reference resolves
+with its own indexed query - an exact id or an anchored prefix regex, both
+served by the `id` index - capped at two results, so a prefix that matches
+more than one artifact is dropped as ambiguous.
+"""
+import asyncio
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import InsertOne, UpdateMany
+
+SHORT_ID_LENGTH = 8
+MIN_PREFIX_LENGTH = 4
+
+REFERENCE_PATTERN = re.compile(r'ARTIFACT_([0-9A-Za-z-]{%d,36})' % MIN_PREFIX_LENGTH)
+MERGE_VERBS = re.compile(r'\b(merg\w*|combin\w*|fus\w*|unif\w*|blend\w*)', re.IGNORECASE)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+NEGATION = re.compile(
+    r"\b(not|never|no need|don['’]t|won['’]t|can['’]t|cannot|shouldn['’]t|wouldn['’]t|didn['’]t|isn['’]t|"
+    r"without|rather than|instead of)\b",
+    re.IGNORECASE
+)
+ID_LENGTH = 36
+
+
+def short_id(artifact_id: str) -> str:
+    return artifact_id[:SHORT_ID_LENGTH]
+
+
+def extract_references(text: str) -> List[str]:
+    """Unique artifact references in order of appearance"""
+    seen = []
+    for ref in REFERENCE_PATTERN.findall(text or ""):
+        ref = ref.rstrip("-")
+        if ref not in seen:
+            seen.append(ref)
+    return seen
+
+
+def find_merge_groups(text: str) -> List[List[str]]:
+    """Sentences with a merge verb and two or more references, one group per sentence.
+
+    A negation before the verb ("I won't merge ...") drops the sentence; one
+    after it ("merge A with B, not C") drops the references that follow it.
+    """
+    groups = []
+    for sentence in SENTENCE_SPLIT.split(text or ""):
+        verb = MERGE_VERBS.search(sentence)
+        if not verb or NEGATION.search(sentence, 0, verb.start()):
+            continue
+        negated = NEGATION.search(sentence, verb.end())
+        refs = extract_references(sentence[:negated.start()] if negated else sentence)
+        if len(refs) >= 2:
+            groups.append(refs)
+    return groups
+
+
+async def resolve_references(db, user_id: str, refs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """ref -> live artifact. Ambiguous or unknown prefixes are left out."""
+    async def resolve(ref: str) -> List[Dict[str, Any]]:
+        target = ref if len(ref) == ID_LENGTH else re.compile("^" + re.escape(ref))
+        return await db.artifacts.find(
+            {"user_id": user_id, "id": target, "archived": {"$ne": True}},
+            {"_id": 0}
+        ).limit(2).to_list(2)
+
+    matches = await asyncio.gather(*(resolve(ref) for ref in refs))
+    return {ref: found[0] for ref, found in zip(refs, matches) if len(found) == 1}
+
+
+def _merge_values(values: List[Any]) -> Any:
+    values = [v for v in values if v not in (None, "", [], {})]
+    if not values:
+        return None
+    if all(isinstance(v, str) for v in values):
+        unique = []
+        for v in values:
+            if v not in unique:
+                unique.append(v)
+        return "\n\n".join(unique)
+    if all(isinstance(v, list) for v in values):
+        merged = []
+        for v in values:
+            for item in v:
+                if item not in merged:
+                    merged.append(item)
+        return merged
+    if all(isinstance(v, dict) for v in values):
+        return merge_content(values)
+    return values[0]
+
+
+def merge_content(contents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Field-wise merge: text is joined, lists are unioned, dicts merge recursively"""
+    keys = []
+    for content in contents:
+        for key in content:
+            if key not in keys:
+                keys.append(key)
+    merged = {}
+    for key in keys:
+        value = _merge_values([c.get(key) for c in contents])
+        if value is not None:
+            merged[key] = value
+    return merged
+
+
+def merge_artifacts(sources: List[Dict[str, Any]], user_id: str, conversation_id: str) -> Dict[str, Any]:
+    """A new artifact combining sources: first source's type and style, centred on them"""
+    now = datetime.now(timezone.utc).isoformat()
+    xs = [s.get("position", {}).get("x", 0) for s in sources]
+    ys = [s.get("position", {}).get("y", 0) for s in sources]
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "type": sources[0].get("type", "text_bubble"),
+        "content": merge_content([s.get("content") or {} for s in sources]),
+        "style": dict(sources[0].get("style") or {}),
+        "position": {"x": sum(xs) / len(xs), "y": sum(ys) / len(ys)},
+        "size": {
+            "width": max(s.get("size", {}).get("width", 200) for s in sources),
+            "height": max(s.get("size", {}).get("height", 100) for s in sources),
+        },
+        "created_at": now,
+        "updated_at": now,
+        "merged_from": [s["id"] for s in sources],
+    }
+
+
+async def apply_merges(db, user_id: str, conversation_id: str, groups: List[List[str]],
+                       resolved: Dict[str, Dict[str, Any]], rev: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Create merged artifacts and archive their sources in one ordered bulk write.
+
+    Returns [{"merged": new_artifact, "sources": [archived source docs]}].
+    An artifact is consumed by at most one merge per call.
+    """
+    consumed = set()
+    results = []
+    operations = []
+    for refs in groups:
+        sources = []
+        for ref in refs:
+            artifact = resolved.get(ref)
+            if artifact and artifact["id"] not in consumed and artifact not in sources:
+                sources.append(artifact)
+        if len(sources) < 2:
+            continue
+        consumed.update(s["id"] for s in sources)
+
+        merged = merge_artifacts(sources, user_id, conversation_id)
+        changes = {"archived": True, "merged_into": merged["id"], "updated_at": merged["updated_at"]}
+        if rev is not None:
+            merged["rev"] = changes["rev"] = rev
+        archived = [{**s, **changes} for s in sources]
+        operations.append(InsertOne(dict(merged)))
+        operations.append(UpdateMany(
+            {"user_id": user_id, "id": {"$in": merged["merged_from"]}},
+            {"$set": changes}
+        ))
+        results.append({"merged": merged, "sources": archived})
+
+    if operations:
+        await db.artifacts.bulk_write(operations, ordered=True)
+    return results
+
+
+def canvas_reference_list(artifacts: List[Dict[str, Any]], limit: int = 20) -> Optional[str]:
+    """Short-id listing of the canvas for the system prompt"""
+    lines = []
+    for artifact in artifacts[-limit:]:
+        content = artifact.get("content") or {}
+        label = content.get("text") or content.get("title") or content.get("caption") or ""
+        lines.append(f"ARTIFACT_{short_id(artifact['id'])} ({artifact.get('type', 'artifact')}): {str(label)[:60]}")
+    return "\n".join(lines) if lines else None
@@ -0,0 +1,116 @@
+"""Per-user revision counters for listing ETags.
+
+Counters live in db.revisions keyed "{user}:{kind}:{key}". Every write bumps
+the counters of the scopes it touched, plus the kind-wide "all" counter used
+by unscoped listings. A write that can't name its scopes bumps "epoch", which
+every scoped ETag of that kind includes. Counters are bumped after the write
+lands, so an ETag is never newer than the documents it was served with.
+
+Separately, each user has a sync sequence. Writes take the next value and
+stamp it on the documents they touch as `rev` (tombstones too), so
+/sync?since=N is one indexed range query per collection.
+
+A revision is taken before its write lands, so the sequence doc also lists
+the revisions still in flight. Clients are handed `sync_cursor` - just below
+the lowest one in flight - never a revision whose documents may not be
+visible yet. A writer that dies without releasing its revision stops holding
+the cursor back after `write_lease` seconds.
+"""
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+ALL = "all"
+EPOCH = "epoch"
+SYNC = "sync"
+SEQUENCE = "seq"
+
+
+class RevisionCounter:
+    def __init__(self, db, write_lease: float = 300.0):
+        self.collection = db.revisions
+        self.write_lease = write_lease
+
+    @staticmethod
+    def _id(user_id: str, kind: str, key: str) -> str:
+        return f"{user_id}:{kind}:{key}"
+
+    async def bump(self, user_id: str, kind: str, scopes: Optional[Iterable[Optional[str]]] = None) -> None:
+        """scopes=None means every scope of this kind changed"""
+        keys: List[str] = [ALL]
+        if scopes is None:
+            keys.append(EPOCH)
+        else:
+            keys.extend(f"scope:{scope}" for scope in scopes if scope is not None)
+        await self.collection.bulk_write([
+            UpdateOne({"_id": self._id(user_id, kind, key)}, {"$inc": {"rev": 1}}, upsert=True)
+            for key in keys
+        ], ordered=False)
+
+    async def _read(self, user_id: str, kind: str, keys: List[str]) -> Dict[str, int]:
+        ids = [self._id(user_id, kind, key) for key in keys]
+        found = {doc["_id"]: doc.get("rev", 0) async for doc in self.collection.find({"_id": {"$in": ids}})}
+        return {key: found.get(doc_id, 0) for key, doc_id in zip(keys, ids)}
+
+    async def etag(self, user_id: str, kind: str, scope: Optional[str] = None, variant: str = "") -> str:
+        """Weak ETag for a listing. Includes a hash of the user so cached responses never cross accounts."""
+        if scope is None:
+            revs = await self._read(user_id, kind, [ALL])
+            version = str(revs[ALL])
+        else:
+            revs = await self._read(user_id, kind, [f"scope:{scope}", EPOCH])
+            version = f"{revs[f'scope:{scope}']}.{revs[EPOCH]}"
+        tag = hashlib.sha1(f"{user_id}:{kind}:{scope}:{variant}".encode()).hexdigest()[:12]
+        return f'W/"{tag}-{version}"'
+
+    async def next_rev(self, user_id: str) -> int:
+        """Allocate the next sync revision for a write - in flight until release()"""
+        doc_id = self._id(user_id, SYNC, SEQUENCE)
+        while True:
+            doc = await self.collection.find_one({"_id": doc_id})
+            now = time.time()
+            if doc is None:
+                try:
+                    await self.collection.insert_one({"_id": doc_id, "rev": 1, "open": [{"rev": 1, "at": now}]})
+                    return 1
+                except DuplicateKeyError:
+                    continue
+            # Compare-and-set on the whole doc, so the new revision and its in-flight mark land together
+            rev = doc.get("rev", 0) + 1
+            still_open = [entry for entry in doc.get("open") or [] if entry["at"] > now - self.write_lease]
+            result = await self.collection.update_one(
+                {"_id": doc_id, "rev": doc.get("rev", 0), "open": doc.get("open")},
+                {"$set": {"rev": rev, "open": still_open + [{"rev": rev, "at": now}]}}
+            )
+            if result.modified_count:
+                return rev
+
+    async def release(self, user_id: str, rev: int) -> None:
+        """The write stamped with rev has landed (or given up)"""
+        await self.collection.update_one({"_id": self._id(user_id, SYNC, SEQUENCE)}, {"$pull": {"open": {"rev": rev}}})
+
+    @asynccontextmanager
+    async def writing(self, user_id: str) -> AsyncIterator[int]:
+        """A sync revision held in flight for the duration of the block"""
+        rev = await self.next_rev(user_id)
+        try:
+            yield rev
+        finally:
+            await self.release(user_id, rev)
+
+    async def current_rev(self, user_id: str) -> int:
+        """Latest revision handed out - some of its writes may still be in flight"""
+        return (await self._read(user_id, SYNC, [SEQUENCE]))[SEQUENCE]
+
+    async def sync_cursor(self, user_id: str) -> int:
+        """Highest revision whose writes, and every earlier one's, have all landed"""
+        doc = await self.collection.find_one({"_id": self._id(user_id, SYNC, SEQUENCE)})
+        if doc is None:
+            return 0
+        cutoff = time.time() - self.write_lease
+        in_flight = [entry["rev"] for entry in doc.get("open") or [] if entry["at"] > cutoff]
+        return min(in_flight) - 1 if in_flight else doc.get("rev", 0)
@@ -0,0 +1,234 @@
+"""Per-turn model routing: which model and max_tokens a conversation turn gets.
+
+Routes come from a JSON rules file (model_routes.json by default). "tiers"
+name a model per provider plus a max_tokens, and "rules" are tried in order.
+The first rule whose conditions all hold picks the tier:
+
+    min_chars / max_chars   length of the user's message
+    artifacts               true/false - does the turn look like it wants an artifact
+    user_tiers              the user's plan ("free", "pro", ...)
+    frequencies             the conversation's frequency
+
+"tier_caps" maps a user's plan to the most expensive tier it may get
+(tiers are listed cheapest first). A capped plan is routed to at most that
+tier unless the matching rule names the plan in its "user_tiers" - so a
+long free-tier message gets "standard", not the pro-sized "heavy" tier.
+
+A rule with "latency_budget_s" drops to its "degrade_to" tier while the
+tier's model has been answering slower than that on average (EWMA of
+observed call time per provider/model). Averages older than `latency_ttl`
+are ignored, so a degraded tier gets tried - and re-measured - again. The
+file is re-read when it changes on disk. A broken file is logged and the
+previous rules are kept.
+"""
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("hermes", "openai", "emergent")
+CONDITIONS = {"min_chars", "max_chars", "artifacts", "user_tiers", "frequencies"}
+
+# Used when the rules file is missing: every turn gets what converse always sent
+DEFAULT_RULES = {
+    "tiers": {
+        "standard": {"models": {"hermes": "Hermes-4-70B", "openai": "gpt-4o", "emergent": "gpt-4o"}, "max_tokens": 300},
+    },
+    "artifact_keywords": [],
+    "rules": [{"name": "default", "tier": "standard"}],
+    "tier_caps": {},
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_when(label: str, when: Any) -> None:
+    if not isinstance(when, dict):
+        raise ValueError(f"rule {label!r} 'when' must be an object")
+    unknown = set(when) - CONDITIONS
+    if unknown:
+        raise ValueError(f"rule {label!r} has unknown conditions {sorted(unknown)}")
+    for name in ("min_chars", "max_chars"):
+        if name in when and not _is_number(when[name]):
+            raise ValueError(f"rule {label!r} {name} must be a number")
+    if "artifacts" in when and not isinstance(when["artifacts"], bool):
+        raise ValueError(f"rule {label!r} artifacts must be true or false")
+    for name in ("user_tiers", "frequencies"):
+        if name in when and not (isinstance(when[name], list) and all(isinstance(v, str) for v in when[name])):
+            raise ValueError(f"rule {label!r} {name} must be a list of strings")
+
+
+def validate_rules(config: Any) -> Dict[str, Any]:
+    """Raises ValueError naming the first problem in a rules document"""
+    if not isinstance(config, dict):
+        raise ValueError("the rules document must be an object")
+    tiers = config.get("tiers")
+    if not isinstance(tiers, dict) or not tiers:
+        raise ValueError("'tiers' must be a non-empty object")
+    for name, tier in tiers.items():
+        if not isinstance(tier, dict) or not isinstance(tier.get("models"), dict):
+            raise ValueError(f"tier {name!r} must be an object with a 'models' object")
+        missing = [p for p in PROVIDERS if not isinstance(tier["models"].get(p), str)]
+        if missing:
+            raise ValueError(f"tier {name!r} has no model for {', '.join(missing)}")
+        if not isinstance(tier.get("max_tokens"), int) or isinstance(tier["max_tokens"], bool) or tier["max_tokens"] <= 0:
+            raise ValueError(f"tier {name!r} needs a positive integer max_tokens")
+    rules = config.get("rules")
+    if not isinstance(rules, list) or not rules:
+        raise ValueError("'rules' must be a non-empty list")
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f"rule #{i} must be an object")
+        label = rule.get("name", f"#{i}")
+        if not isinstance(rule.get("tier"), str) or rule["tier"] not in tiers:
+            raise ValueError(f"rule {label!r} points at unknown tier {rule.get('tier')!r}")
+        if "degrade_to" in rule and (not isinstance(rule["degrade_to"], str) or rule["degrade_to"] not in tiers):
+            raise ValueError(f"rule {label!r} degrades to unknown tier {rule['degrade_to']!r}")
+        if "latency_budget_s" in rule and not _is_number(rule["latency_budget_s"]):
+            raise ValueError(f"rule {label!r} latency_budget_s must be a number")
+        _validate_when(label, rule.get("when", {}))
+    if rules[-1].get("when"):
+        raise ValueError("the last rule must have no conditions so every turn is routed")
+    keywords = config.get("artifact_keywords", [])
+    if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+        raise ValueError("'artifact_keywords' must be a list of strings")
+    caps = config.get("tier_caps", {})
+    if not isinstance(caps, dict):
+        raise ValueError("'tier_caps' must be an object")
+    for user_tier, cap in caps.items():
+        if not isinstance(cap, str) or cap not in tiers:
+            raise ValueError(f"user tier {user_tier!r} is capped at unknown tier {cap!r}")
+    return config
+
+
+class ModelRouter:
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 5.0, latency_alpha: float = 0.2,
+                 latency_ttl: float = 120.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.latency_alpha = latency_alpha
+        self.latency_ttl = latency_ttl
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._apply(DEFAULT_RULES)
+        self.latency: Dict[str, Dict[str, Any]] = {}
+        self.routes: Dict[str, int] = {}
+        self.degraded = 0
+        self.capped = 0
+        self.reload()
+
+    def _apply(self, config: Dict[str, Any]):
+        self.tiers = config["tiers"]
+        self.rules = config["rules"]
+        self.tier_caps = config.get("tier_caps") or {}
+        keywords = config.get("artifact_keywords") or []
+        self._artifact_pattern = re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")", re.I) if keywords else None
+
+    def reload(self) -> bool:
+        """Re-read the rules file if it changed since the last load"""
+        self._checked = time.monotonic()
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if self._mtime is None:
+                logger.warning(f"No model routes at {self.path}, using the default route")
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.path) as f:
+                self._apply(validate_rules(json.load(f)))
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring invalid model routes in {self.path}: {e}")
+            return False
+        logger.info(f"Loaded {len(self.rules)} model routes from {self.path}")
+        return True
+
+    def wants_artifacts(self, text: str) -> bool:
+        return bool(self._artifact_pattern and self._artifact_pattern.search(text))
+
+    def _matches(self, when: Dict[str, Any], chars: int, artifacts: bool, user_tier: str, frequency: str) -> bool:
+        if "min_chars" in when and chars < when["min_chars"]:
+            return False
+        if "max_chars" in when and chars > when["max_chars"]:
+            return False
+        if "artifacts" in when and artifacts != when["artifacts"]:
+            return False
+        if "user_tiers" in when and user_tier not in when["user_tiers"]:
+            return False
+        if "frequencies" in when and frequency not in when["frequencies"]:
+            return False
+        return True
+
+    def _rank(self, tier_name: str) -> int:
+        return list(self.tiers).index(tier_name)
+
+    def route(self, provider: str, text: str, user_tier: str = "free", frequency: str = "") -> Dict[str, Any]:
+        """{rule, tier, model, max_tokens, degraded, capped, wants_artifacts} for one turn on this provider"""
+        if time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+        artifacts = self.wants_artifacts(text)
+        rule = next(r for r in self.rules if self._matches(r.get("when", {}), len(text), artifacts, user_tier, frequency))
+        tier_name = rule["tier"]
+        degraded = False
+        budget = rule.get("latency_budget_s")
+        if budget is not None and rule.get("degrade_to"):
+            observed = self.latency.get(f"{provider}:{self.tiers[tier_name]['models'][provider]}")
+            fresh = observed and observed["avg_s"] is not None and time.monotonic() - observed["at"] < self.latency_ttl
+            if fresh and observed["avg_s"] > budget:
+                tier_name, degraded = rule["degrade_to"], True
+                self.degraded += 1
+        capped = False
+        cap = self.tier_caps.get(user_tier)
+        explicit = user_tier in rule.get("when", {}).get("user_tiers", ())
+        if cap is not None and not explicit and self._rank(tier_name) > self._rank(cap):
+            tier_name, capped = cap, True
+            self.capped += 1
+        tier = self.tiers[tier_name]
+        name = rule.get("name", tier_name)
+        self.routes[name] = self.routes.get(name, 0) + 1
+        return {
+            "rule": name,
+            "tier": tier_name,
+            "model": tier["models"][provider],
+            "max_tokens": tier["max_tokens"],
+            "degraded": degraded,
+            "capped": capped,
+            "wants_artifacts": artifacts,
+        }
+
+    def record(self, provider: str, model: str, seconds: float, ok: bool = True):
+        """Observed call time for a provider/model - feeds the latency budgets"""
+        entry = self.latency.setdefault(f"{provider}:{model}", {"calls": 0, "errors": 0, "avg_s": None, "at": 0.0})
+        entry["calls"] += 1
+        if not ok:
+            entry["errors"] += 1
+            return
+        avg = entry["avg_s"]
+        if avg is None or time.monotonic() - entry["at"] >= self.latency_ttl:
+            # Stale average - start over from this call
+            entry["avg_s"] = seconds
+        else:
+            entry["avg_s"] = (1 - self.latency_alpha) * avg + self.latency_alpha * seconds
+        entry["at"] = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "routes": dict(self.routes),
+            "degraded": self.degraded,
+            "capped": self.capped,
+            "models": {
+                key: {"calls": entry["calls"], "errors": entry["errors"],
+                      "avg_s": round(entry["avg_s"], 3) if entry["avg_s"] is not None else None}
+                for key, entry in self.latency.items()
+            },
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
+
+# Lower value = served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class LLMOverloaded(Exception):
+    """Raised when a call is shed - carries a Retry-After hint in seconds"""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float = 1.0, reserve: float = 0.0) -> float:
+        """Spend tokens; returns 0 on success or seconds until enough are available"""
+        self._refill()
+        if self.tokens - cost >= reserve:
+            self.tokens -= cost
+            return 0.0
+        return (cost + reserve - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class ProviderGate:
+    """Concurrency cap for one provider with a priority-ordered wait queue"""
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.avg_service = 2.0  # EWMA of call duration, seconds
+        self.shed = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> float:
+        return (self.depth + 1) * self.avg_service / max(1, self.limit)
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.limit and not self.depth:
+            self.active += 1
+            return
+
+        # Background work gets only half the queue so interactive calls always have room
+        cap = self.max_queue if priority <= INTERACTIVE else self.max_queue // 2
+        if self.depth >= cap:
+            self.shed += 1
+            raise LLMOverloaded(self.retry_after(), "LLM queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we gave up - pass it on
+                self.release()
+            self.shed += 1
+            raise LLMOverloaded(self.retry_after(), "LLM queue timeout")
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # hand the slot straight to the next waiter
+                return
+        self.active -= 1
+
+    def record(self, duration: float) -> None:
+        self.avg_service = 0.8 * self.avg_service + 0.2 * duration
+
+
+class LLMScheduler:
+    """Per-user admission control plus per-provider priority scheduling"""
+
+    def __init__(self, user_rate_per_min: float = 20, user_burst: float = 5,
+                 provider_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 20.0):
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+        self.provider_concurrency = provider_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._gates: Dict[str, ProviderGate] = {}
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                # Full buckets carry no state worth keeping
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.full}
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def gate(self, provider: str) -> ProviderGate:
+        gate = self._gates.get(provider)
+        if gate is None:
+            gate = self._gates[provider] = ProviderGate(self.provider_concurrency, self.max_queue, self.queue_timeout)
+        return gate
+
+    @asynccontextmanager
+    async def slot(self, provider: str, user_id: str, priority: int = INTERACTIVE):
+        # Background calls leave a token in reserve for the user's next interactive turn
+        wait = self._bucket(user_id).take(reserve=1.0 if priority > INTERACTIVE else 0.0)
+        if wait:
+            raise LLMOverloaded(wait, "Too many AI requests")
+
+        gate = self.gate(provider)
+        await gate.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            gate.record(time.monotonic() - started)
+            gate.release()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            provider: {
+                "active": gate.active,
+                "queued": gate.depth,
+                "limit": gate.limit,
+                "avg_service_s": round(gate.avg_service, 3),
+                "shed": gate.shed,
+            }
+            for provider, gate in self._gates.items()
+        }
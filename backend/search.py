@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Field weights folded into term frequency - a title hit beats a body hit
+FIELD_WEIGHTS = {"title": 3.0, "aliases": 3.0, "tags": 2.0, "content": 1.0}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def artifact_text(artifact: Dict[str, Any]) -> str:
+    content = artifact.get("content") or {}
+    if isinstance(content, dict):
+        parts = [content.get("text"), content.get("caption")]
+        nodes = content.get("nodes")
+        if isinstance(nodes, list):
+            parts.extend(n for n in nodes if isinstance(n, str))
+        return " ".join(p for p in parts if isinstance(p, str))
+    return str(content)
+
+
+class UserSearchIndex:
+    """Inverted index with BM25 ranking over one user's nodes and artifacts"""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.doc_terms: Dict[str, Set[str]] = {}
+        self.total_length = 0.0
+        self._sorted_terms: Optional[List[str]] = None
+        self._sorted_names: Optional[List[Tuple[str, str]]] = None
+
+    # ---- maintenance ----
+
+    def _index(self, key: str, meta: Dict[str, Any], fields: Dict[str, Any]) -> None:
+        self.remove(key)
+        weights: Dict[str, float] = {}
+        for field, value in fields.items():
+            text = " ".join(value) if isinstance(value, list) else value
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[field]
+        meta["length"] = sum(weights.values())
+        self.docs[key] = meta
+        self.doc_terms[key] = set(weights)
+        self.total_length += meta["length"]
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[key] = weight
+        self._sorted_terms = None
+        self._sorted_names = None
+
+    def add_node(self, node: Dict[str, Any]) -> None:
+        meta = {
+            "kind": "node",
+            "id": node.get("id"),
+            "title": node.get("title", ""),
+            "aliases": list(node.get("aliases") or []),
+            "tags": list(node.get("tags") or []),
+            "frequency": node.get("frequency"),
+            "type": node.get("type"),
+            "archived": bool(node.get("archived")),
+            "snippet": (node.get("content") or "")[:160],
+        }
+        self._index("node:" + meta["id"], meta, {
+            "title": node.get("title", ""),
+            "aliases": meta["aliases"],
+            "tags": meta["tags"],
+            "content": node.get("content", ""),
+        })
+
+    def add_artifact(self, artifact: Dict[str, Any]) -> None:
+        text = artifact_text(artifact)
+        meta = {
+            "kind": "artifact",
+            "id": artifact.get("id"),
+            "title": text[:80],
+            "aliases": [],
+            "tags": [],
+            # Artifacts live in a conversation named after the frequency
+            "frequency": artifact.get("conversation_id"),
+            "type": artifact.get("type"),
+            "archived": bool(artifact.get("archived")),
+            "snippet": text[:160],
+        }
+        self._index("artifact:" + meta["id"], meta, {"content": text})
+
+    def remove(self, key: str) -> None:
+        meta = self.docs.pop(key, None)
+        if meta is None:
+            return
+        self.total_length -= meta["length"]
+        for term in self.doc_terms.pop(key, ()):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self.postings[term]
+        self._sorted_terms = None
+        self._sorted_names = None
+
+    def set_archived(self, kind: str, frequency: str, archived: bool) -> None:
+        for meta in self.docs.values():
+            if meta["kind"] == kind and meta["frequency"] == frequency:
+                meta["archived"] = archived
+
+    # ---- queries ----
+
+    def _terms_with_prefix(self, prefix: str) -> List[str]:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        matches = []
+        for term in self._sorted_terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def _matches(self, meta: Dict[str, Any], kind: Optional[str], frequency: Optional[str],
+                 tags: Optional[List[str]], include_archived: bool) -> bool:
+        if kind and meta["kind"] != kind:
+            return False
+        if frequency and meta["frequency"] != frequency:
+            return False
+        if not include_archived and meta["archived"]:
+            return False
+        if tags and not set(tags).issubset(meta["tags"]):
+            return False
+        return True
+
+    def search(self, query: str, kind: Optional[str] = None, frequency: Optional[str] = None,
+               tags: Optional[List[str]] = None, include_archived: bool = False,
+               prefix: bool = True) -> List[Tuple[float, Dict[str, Any]]]:
+        terms = tokenize(query)
+        if not terms or not self.docs:
+            return []
+
+        # The last token is still being typed - expand it to every indexed term it prefixes
+        query_terms: List[Tuple[str, float]] = [(t, 1.0) for t in terms[:-1]]
+        last = terms[-1]
+        if prefix:
+            for term in self._terms_with_prefix(last):
+                query_terms.append((term, 1.0 if term == last else 0.5))
+        else:
+            query_terms.append((last, 1.0))
+
+        n_docs = len(self.docs)
+        avg_length = self.total_length / n_docs if n_docs else 1.0
+        scores: Dict[str, float] = {}
+        for term, boost in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, tf in posting.items():
+                length = self.docs[key]["length"]
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                scores[key] = scores.get(key, 0.0) + boost * idf * norm
+
+        ranked = [
+            (score, self.docs[key]) for key, score in scores.items()
+            if self._matches(self.docs[key], kind, frequency, tags, include_archived)
+        ]
+        ranked.sort(key=lambda item: (-item[0], item[1]["title"]))
+        return ranked
+
+    def suggest(self, prefix: str, limit: int = 10, frequency: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Typeahead over node titles and aliases"""
+        if self._sorted_names is None:
+            names = []
+            for key, meta in self.docs.items():
+                if meta["kind"] != "node":
+                    continue
+                for name in [meta["title"]] + meta["aliases"]:
+                    if name:
+                        names.append((name.lower(), key))
+            names.sort()
+            self._sorted_names = names
+
+        needle = prefix.lower().strip()
+        if not needle:
+            return []
+        start = bisect.bisect_left(self._sorted_names, (needle, ""))
+        results = []
+        seen = set()
+        for name, key in self._sorted_names[start:]:
+            if not name.startswith(needle) or len(results) >= limit:
+                break
+            meta = self.docs[key]
+            if key in seen or meta["archived"] or (frequency and meta["frequency"] != frequency):
+                continue
+            seen.add(key)
+            results.append({"id": meta["id"], "title": meta["title"], "matched": name,
+                            "frequency": meta["frequency"], "type": meta["type"]})
+        return results
+
+
+def tag_facets(results: List[Tuple[float, Dict[str, Any]]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for _, meta in results:
+        for tag in meta["tags"]:
+            counts[tag] = counts.get(tag, 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+class SearchIndex:
+    """Lazily built per-user search indexes, updated by the write handlers"""
+
+    NODE_PROJECTION = {"_id": 0, "id": 1, "title": 1, "content": 1, "tags": 1, "aliases": 1,
+                       "frequency": 1, "type": 1, "archived": 1}
+    ARTIFACT_PROJECTION = {"_id": 0, "id": 1, "content": 1, "conversation_id": 1, "type": 1, "archived": 1}
+
+    def __init__(self, db, max_users: int = 256):
+        self.db = db
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, UserSearchIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, user_id: str) -> UserSearchIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = UserSearchIndex()
+                async for node in self.db.nodes.find({"user_id": user_id}, self.NODE_PROJECTION):
+                    index.add_node(node)
+                async for artifact in self.db.artifacts.find({"user_id": user_id}, self.ARTIFACT_PROJECTION):
+                    index.add_artifact(artifact)
+                self._indexes[user_id] = index
+                while len(self._indexes) > self.max_users:
+                    evicted, _ = self._indexes.popitem(last=False)
+                    self._locks.pop(evicted, None)
+        return index
+
+    def peek(self, user_id: str) -> Optional[UserSearchIndex]:
+        """The user's index if it's already loaded - writes never force a load"""
+        return self._indexes.get(user_id)
+
+    def node_changed(self, user_id: str, node: Dict[str, Any]) -> None:
+        index = self.peek(user_id)
+        if index is not None:
+            index.add_node(node)
+
+    def node_removed(self, user_id: str, node_id: str) -> None:
+        index = self.peek(user_id)
+        if index is not None:
+            index.remove("node:" + node_id)
+
+    def artifact_changed(self, user_id: str, artifact: Dict[str, Any]) -> None:
+        index = self.peek(user_id)
+        if index is not None:
+            index.add_artifact(artifact)
+
+    def artifact_removed(self, user_id: str, artifact_id: str) -> None:
+        index = self.peek(user_id)
+        if index is not None:
+            index.remove("artifact:" + artifact_id)
+
+    def frequency_archived(self, user_id: str, frequency: str) -> None:
+        index = self.peek(user_id)
+        if index is not None:
+            index.set_archived("node", frequency, True)
+
+    def invalidate(self, user_id: str) -> None:
+        self._indexes.pop(user_id, None)
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -7,23 +8,129 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import json
 import re
-from openai import AsyncOpenAI
+import asyncio
+import time
+from collections import OrderedDict
+from workspace_cache import Generation, WorkspaceCache, TTLCache
+from layout import CanvasLayout, CanvasLayouts, place_artifacts
+from viewport import tile_counts
+from graph import GraphIndex
+from search import SearchIndex, tag_facets
+from scheduler import LLMScheduler, LLMOverloaded, INTERACTIVE, BACKGROUND
+from idempotency import IdempotencyStore, IdempotencyConflict, SingleFlight, request_fingerprint
+from events import ActivityRecorder, merge_rollups, rollup_fingerprint
+from analytics import rhythm_features, describe_features
+import providers
+from mongo_pool import PoolMonitor, client_options_from_env, warm_up, ping
+from cache_backend import make_backend, InvalidationBus
+from history import VersionHistory
+from references import find_merge_groups, resolve_references, apply_merges, canvas_reference_list
+from jobs import JobRunner
+from revisions import RevisionCounter
+from compression import CompressionMiddleware, CpuBudget
+from turn_stream import STREAMING, TurnStreams
+from routing import ModelRouter
+from structured import ARTIFACT_TOOL, TEXT, TOOLS, ArtifactStats, ToolCallDecoder, decode_tool_calls
+from backup import export_workspace, import_workspace, compressor, ImportFormatError, MEDIA_TYPES, EXTENSIONS, SYNCED_COLLECTIONS
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+mongo_options = client_options_from_env()
+pool_monitor = PoolMonitor()
+client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_monitor], **mongo_options)
 db = client[os.environ['DB_NAME']]
 
+# Flipped once startup warm-up succeeds - load balancers poll /api/health/ready
+readiness = {"ready": False, "warmed_at": None, "warm_up_ms": None, "warmed_users": None, "error": None}
+
+# Hot per-user node/artifact listings - populated on read, written through on update
+workspace_cache = WorkspaceCache(
+    max_bytes=int(os.getenv('WORKSPACE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=float(os.getenv('WORKSPACE_CACHE_TTL', '300'))
+)
+# Per-conversation grid hash of live artifacts - answers viewport queries and keeps the
+# spiral frontier for placing new ones. Updated in place on every artifact write.
+canvas_layouts = CanvasLayouts(max_layouts=int(os.getenv('CANVAS_LAYOUTS', '256')))
+
+# Per-user listing revisions (db.revisions) - ETags and 304s for unchanged listings, plus /sync cursors
+revisions = RevisionCounter(db, write_lease=float(os.getenv('SYNC_WRITE_LEASE_SECONDS', '300')))
+# Past this many changes /sync tells the client to reload listings instead
+SYNC_MAX_CHANGES = int(os.getenv('SYNC_MAX_CHANGES', '2000'))
+
+# Streamed replies persisted as coalesced chunks (db.message_chunks) so clients can resume them
+turn_streams = TurnStreams(
+    db,
+    flush_interval=float(os.getenv('STREAM_FLUSH_MS', '180')) / 1000,
+    flush_chars=int(os.getenv('STREAM_FLUSH_CHARS', '512'))
+)
+
+# "tools" asks for artifacts as create_artifact tool calls; ARTIFACT[...] text stays the fallback
+ARTIFACT_MODE = os.getenv('ARTIFACT_MODE', TEXT)
+ARTIFACT_TOOL_PROVIDERS = set(os.getenv('ARTIFACT_TOOL_PROVIDERS', 'openai').split(','))
+tools_unsupported = set()
+artifact_stats = ArtifactStats()
+
+# Model and max_tokens per turn from the rules in MODEL_ROUTES_FILE - input size, likely artifacts,
+# the user's tier and observed provider latency
+model_router = ModelRouter(os.getenv('MODEL_ROUTES_FILE', str(ROOT_DIR / 'model_routes.json')))
+user_tiers = TTLCache(ttl=float(os.getenv('USER_TIER_TTL', '300')))
+
+# System prompts rendered by /converse/prepare while the user types, used once by the next turn
+prepared_prompts = TTLCache(ttl=float(os.getenv('CONVERSE_PREPARE_TTL', '30')))
+background_tasks = set()
+
+# Shared tier behind the in-process caches (CACHE_URL=redis://... for multi-worker
+# deployments) plus a pub/sub bus so peers drop their local copies on writes
+shared_cache = make_backend(os.getenv('CACHE_URL'))
+invalidation_bus = InvalidationBus(shared_cache)
+INSIGHTS_CACHE_TTL = float(os.getenv('INSIGHTS_CACHE_TTL', '300'))
+# Idle-time insight precompute: how long a user must be idle, and the minimum gap between regenerations
+IDLE_PRECOMPUTE_SECONDS = float(os.getenv('IDLE_PRECOMPUTE_SECONDS', '60'))
+INSIGHTS_MIN_INTERVAL = float(os.getenv('INSIGHTS_MIN_INTERVAL', '600'))
+graph_index = GraphIndex(db)
+search_index = SearchIndex(db)
+
+# Bounds LLM calls per user (token bucket) and per provider (priority queue)
+llm_scheduler = LLMScheduler(
+    user_rate_per_min=float(os.getenv('LLM_USER_RATE_PER_MIN', '20')),
+    user_burst=float(os.getenv('LLM_USER_BURST', '5')),
+    provider_concurrency=int(os.getenv('LLM_PROVIDER_CONCURRENCY', '8')),
+    max_queue=int(os.getenv('LLM_MAX_QUEUE', '32')),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '20'))
+)
+
+# One upstream call per user action: replayed Idempotency-Keys get the stored result
+# (claimed and kept in db.idempotency_keys, so a retry on another worker replays it too).
+# Identical concurrent requests without a key share the in-flight call - per worker only.
+converse_results = IdempotencyStore(
+    db.idempotency_keys,
+    ttl=float(os.getenv('IDEMPOTENCY_TTL', '600')),
+    lease_seconds=float(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '120'))
+)
+inflight_calls = SingleFlight()
+
+# Activity events → db.patterns, with hourly/daily rollups in db.pattern_rollups
+activity = ActivityRecorder(
+    db,
+    batch_size=int(os.getenv('ACTIVITY_BATCH_SIZE', '200')),
+    flush_interval=float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '2'))
+)
+
+# Node/artifact edits as JSON-patch deltas in db.versions, full snapshot every N versions
+version_history = VersionHistory(db, snapshot_every=int(os.getenv('HISTORY_SNAPSHOT_EVERY', '20')))
+
+# Follow-up work that shouldn't block a request but must survive a restart (db.jobs)
+job_runner = JobRunner(db, workers=int(os.getenv('JOB_WORKERS', '4')), lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', '60')))
+
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24 * 7
@@ -45,6 +152,7 @@ class User(BaseModel):
     email: EmailStr
     name: str
     password_hash: str
+    tier: str = "free"
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class UserRegister(BaseModel):
@@ -73,6 +181,7 @@ class Artifact(BaseModel):
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     merged_from: List[str] = []  # Track merged artifacts
+    rev: Optional[int] = None  # Per-user sync revision of the last write
 
 class Node(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -105,6 +214,12 @@ class ConversationInput(BaseModel):
     text: str
     current_frequency: str = "reflect"
     model_preference: str = "hermes"  # hermes or openai
+    artifact_mode: Optional[str] = None  # text or tools; server default when unset
+
+class ConversePrepareInput(BaseModel):
+    current_frequency: str = "reflect"
+    model_preference: str = "hermes"
+    artifact_mode: Optional[str] = None
 
 class StructureResponse(BaseModel):
     action: str  # create, link, modify, archive
@@ -112,6 +227,14 @@ class StructureResponse(BaseModel):
     links: List[Dict[str, str]] = []
     message: str = ""
 
+class ArtifactMergeInput(BaseModel):
+    artifact_ids: List[str]  # full ids or short prefixes
+    conversation_id: Optional[str] = None  # defaults to the first artifact's
+
+class IdleSignal(BaseModel):
+    idle_seconds: float
+    model: str = "hermes"
+
 class PatternInsight(BaseModel):
     pattern: str
     confidence: float
@@ -132,13 +255,28 @@ def create_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+# token -> (user_id, exp) - skips re-verifying the same JWT on every request
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()
+TOKEN_CACHE_SIZE = 10000
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     try:
         token = credentials.credentials
+        cached = _token_cache.get(token)
+        if cached:
+            if cached[1] > time.time():
+                _token_cache.move_to_end(token)
+                return cached[0]
+            del _token_cache[token]
+        
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id = payload.get('user_id')
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
+        
+        _token_cache[token] = (user_id, payload.get('exp', 0))
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
         return user_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -233,6 +371,31 @@ def parse_artifacts_from_response(text: str, user_id: str, conversation_id: str)
     
     return artifacts
 
+async def merge_referenced_artifacts(user_id: str, conversation_id: str, text: str) -> List[Dict[str, Any]]:
+    """Apply merge directives in an AI response; cache and index upkeep included"""
+    groups = find_merge_groups(text)
+    if not groups:
+        return []
+    resolved = await resolve_references(db, user_id, sorted({ref for refs in groups for ref in refs}))
+    return await commit_merges(user_id, conversation_id, groups, resolved)
+
+async def commit_merges(user_id: str, conversation_id: str, groups: List[List[str]], resolved: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async with revisions.writing(user_id) as rev:
+        merges = await apply_merges(db, user_id, conversation_id, groups, resolved, rev=rev)
+    originals = {a["id"]: a for a in resolved.values()}
+    for merge in merges:
+        merged = merge["merged"]
+        for source in merge["sources"]:
+            workspace_cache.discard(user_id, "artifacts", source["id"])
+            search_index.artifact_changed(user_id, source)
+            canvas_layouts.artifact_changed(user_id, source)
+            await record_version("artifact", user_id, originals[source["id"]], source)
+        workspace_cache.upsert(user_id, "artifacts", merged["conversation_id"], merged)
+        search_index.artifact_changed(user_id, merged)
+        canvas_layouts.artifact_changed(user_id, merged)
+        activity.record(user_id, merged["conversation_id"], "merge", sources=len(merge["sources"]))
+    return merges
+
 def parse_natural_response(text: str, user_input: str, frequency: str) -> Dict[str, Any]:
     """Parse AI response - extract conversation and artifact specs"""
     
@@ -248,33 +411,102 @@ def parse_natural_response(text: str, user_input: str, frequency: str) -> Dict[s
     }
 
 @api_router.post("/converse")
-async def converse(data: ConversationInput, user_id: str = Depends(get_current_user)):
+async def converse(
+    data: ConversationInput,
+    user_id: str = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Natural language → structure generation with fluid, invitational AI"""
+    fingerprint = request_fingerprint(user_id, data.model_dump())
     
-    # Choose model - prioritize user's keys
-    use_hermes = data.model_preference == "hermes" and NOUS_API_KEY
-    use_openai_direct = data.model_preference == "openai" and OPENAI_API_KEY
-    use_emergent = data.model_preference == "openai" and not OPENAI_API_KEY and EMERGENT_LLM_KEY
-    
-    if not NOUS_API_KEY and not OPENAI_API_KEY and not EMERGENT_LLM_KEY:
-        raise HTTPException(status_code=500, detail="AI service not configured")
+    if not idempotency_key:
+        return await inflight_calls.do(f"converse:{fingerprint}", lambda: run_conversation_turn(data, user_id))
     
     try:
-        # Get existing nodes for context
-        existing_nodes = await db.nodes.find(
-            {"user_id": user_id, "frequency": data.current_frequency},
-            {"_id": 0}
-        ).to_list(100)
-        
-        # Get recent nodes for richer context
-        node_titles = [n.get("title", "") for n in existing_nodes[:10]]
-        context_snippet = ", ".join(node_titles) if node_titles else "empty field"
-        
-        # System prompts - give full autonomy WITH artifact creation abilities
-        if use_hermes:
-            system_message = f"""You're Hermes. You're in a conversation workspace where ideas can manifest as visual artifacts.
+        result, _ = await converse_results.run(
+            f"{user_id}:{idempotency_key}",
+            fingerprint,
+            lambda: run_conversation_turn(data, user_id)
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return result
+
+@api_router.post("/converse/prepare")
+async def prepare_conversation(data: ConversePrepareInput, user_id: str = Depends(get_current_user)):
+    """Called on first keystroke: snapshot context, render the prompt and warm the provider connection"""
+    provider = choose_provider(data.model_preference)
+    if provider is None:
+        return {"prepared": False}
+    
+    artifact_mode = artifact_mode_for(provider, data.artifact_mode)
+    key = (user_id, data.current_frequency, provider, artifact_mode)
+    if prepared_prompts.get(key) is None:
+        prepared_prompts.set(key, await build_system_message(user_id, data.current_frequency, provider, artifact_mode))
+    
+    if provider in ("hermes", "openai"):
+        client = providers.openai_client(NOUS_API_KEY, NOUS_API_BASE) if provider == "hermes" else providers.openai_client(OPENAI_API_KEY)
+        task = asyncio.create_task(providers.warm_connection(client))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    
+    return {"prepared": True, "provider": provider, "expires_in": prepared_prompts.ttl}
+
+def choose_provider(model_preference: str) -> Optional[str]:
+    """Which configured provider serves this preference - user's own keys first"""
+    if model_preference == "hermes" and NOUS_API_KEY:
+        return "hermes"
+    if model_preference == "openai" and OPENAI_API_KEY:
+        return "openai"
+    if model_preference == "openai" and EMERGENT_LLM_KEY:
+        return "emergent"
+    return None
+
+def artifact_mode_for(provider: Optional[str], requested: Optional[str] = None) -> str:
+    """Tool-call artifacts only where the provider takes tools; everything else uses ARTIFACT[...] text"""
+    mode = requested or ARTIFACT_MODE
+    if mode == TOOLS and provider in ARTIFACT_TOOL_PROVIDERS and provider not in tools_unsupported:
+        return TOOLS
+    return TEXT
+
+async def build_system_message(user_id: str, frequency: str, provider: Optional[str], artifact_mode: str = TEXT) -> str:
+    """Context snapshot for this frequency rendered into the provider's system prompt"""
+    use_hermes = provider == "hermes"
+    use_openai_direct = provider == "openai"
+    use_emergent = provider == "emergent"
+    
+    # Get existing nodes for context
+    existing_nodes = await db.nodes.find(
+        {"user_id": user_id, "frequency": frequency},
+        {"_id": 0}
+    ).to_list(100)
+    
+    # Get recent nodes for richer context
+    node_titles = [n.get("title", "") for n in existing_nodes[:10]]
+    context_snippet = ", ".join(node_titles) if node_titles else "empty field"
+    
+    # Short ids of what's on the canvas, so the model can reference artifacts
+    canvas_refs = canvas_reference_list(await load_conversation_artifacts(user_id, frequency))
+    canvas_snippet = f"\n\nArtifacts on the canvas:\n{canvas_refs}" if canvas_refs else ""
+    
+    # System prompts - give full autonomy WITH artifact creation abilities
+    if artifact_mode == TOOLS and (use_hermes or use_openai_direct):
+        system_message = f"""You're {'Hermes' if use_hermes else 'GPT'}. You're in a conversation workspace where ideas can manifest as visual artifacts.
+
+Current conversation: {context_snippet if context_snippet != 'empty field' else 'blank canvas'}{canvas_snippet}
+
+When an idea wants visual form, call the create_artifact tool - once per artifact. Types: lightbulb (ideas), text_bubble (quotes, notes), diagram (nodes and links), table (rows and columns), shape, image.
+
+You decide ALL styling: colors, gradients, shapes, sizes. Be creative.
+
+You can reference artifacts: "merge ARTIFACT_abc123 with ARTIFACT_def456 into..."
 
-Current conversation: {context_snippet if context_snippet != 'empty field' else 'blank canvas'}
+Just talk naturally. Some conversations are just dialogue - that's fine too."""
+
+    elif use_hermes:
+        system_message = f"""You're Hermes. You're in a conversation workspace where ideas can manifest as visual artifacts.
+
+Current conversation: {context_snippet if context_snippet != 'empty field' else 'blank canvas'}{canvas_snippet}
 
 You have complete creative freedom. When building something, you can create visual artifacts using this format:
 
@@ -294,10 +526,10 @@ You can reference artifacts: "merge ARTIFACT_abc123 with ARTIFACT_def456 into...
 
 Just talk naturally. Create artifacts when ideas want visual form. Some conversations are just dialogue - that's fine too."""
 
-        elif use_openai_direct or use_emergent:
-            system_message = f"""You're GPT. You're in a conversation workspace where ideas can manifest visually.
+    elif use_openai_direct or use_emergent:
+        system_message = f"""You're GPT. You're in a conversation workspace where ideas can manifest visually.
 
-Current conversation: {context_snippet if context_snippet != 'empty field' else 'blank canvas'}
+Current conversation: {context_snippet if context_snippet != 'empty field' else 'blank canvas'}{canvas_snippet}
 
 You can create visual artifacts when building projects:
 
@@ -310,106 +542,657 @@ You control all visual aspects. Be creative with colors, shapes, layouts.
 Reference artifacts to merge/modify: "combining ARTIFACT_123 with ARTIFACT_456..."
 
 Talk naturally. Create when ideas want form. Not every conversation needs artifacts."""
-        
-        else:
-            system_message = f"""You're in a conversation that can manifest visual artifacts. Respond freely."""
+    
+    else:
+        system_message = f"""You're in a conversation that can manifest visual artifacts. Respond freely."""
+    
+    return system_message
+
+async def conversation_system_message(user_id: str, frequency: str, provider: Optional[str], artifact_mode: str = TEXT) -> str:
+    # A prompt prepared while the user was typing is used once, then rebuilt
+    prepared = prepared_prompts.pop((user_id, frequency, provider, artifact_mode))
+    if prepared is not None:
+        return prepared
+    return await build_system_message(user_id, frequency, provider, artifact_mode)
+
+async def user_tier(user_id: str) -> str:
+    tier = user_tiers.get(user_id)
+    if tier is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "tier": 1})
+        tier = (user or {}).get("tier") or "free"
+        user_tiers.set(user_id, tier)
+    return tier
+
+async def generate_reply(data: ConversationInput, user_id: str, provider: Optional[str],
+                         on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+                         admitted: Optional[asyncio.Future] = None) -> Dict[str, Any]:
+    """Prompt + provider call in the turn's artifact mode, falling back to text if the provider refuses tools"""
+    artifact_mode = artifact_mode_for(provider, data.artifact_mode)
+    route = None
+    if provider is not None:
+        route = model_router.route(provider, data.text, await user_tier(user_id), data.current_frequency)
+    system_message = await conversation_system_message(user_id, data.current_frequency, provider, artifact_mode)
+    try:
+        return await call_model(data, user_id, provider, system_message, on_text, admitted, artifact_mode, route)
+    except Exception as e:
+        # A 400 comes back before any output, so nothing has streamed yet
+        if artifact_mode != TOOLS or getattr(e, "status_code", None) != 400:
+            raise
+        logging.warning(f"{provider} rejected artifact tools, using text artifacts from now on: {e}")
+        tools_unsupported.add(provider)
+    system_message = await build_system_message(user_id, data.current_frequency, provider, TEXT)
+    return await call_model(data, user_id, provider, system_message, on_text, admitted, TEXT, route)
+
+async def run_conversation_turn(data: ConversationInput, user_id: str) -> Dict[str, Any]:
+    """One conversation turn: LLM call, artifact creation and turn logging"""
+    if not NOUS_API_KEY and not OPENAI_API_KEY and not EMERGENT_LLM_KEY:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    try:
+        provider = choose_provider(data.model_preference)
+        reply = await generate_reply(data, user_id, provider)
+        return await complete_conversation_turn(data, user_id, reply)
+    except (LLMOverloaded, HTTPException):
+        raise
+    except Exception as e:
+        logging.error(f"Converse error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Call AI based on preference
-        if use_hermes:
+async def call_model(data: ConversationInput, user_id: str, provider: Optional[str], system_message: str,
+                     on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+                     admitted: Optional[asyncio.Future] = None, artifact_mode: str = TEXT,
+                     route: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """The provider call -> {text, artifacts, rejected, completion_tokens, mode, route}.
+    route (from model_router) picks the model and max_tokens.
+    With on_text the reply streams and each delta is handed over as it arrives; tool-call
+    artifacts are decoded from the same stream. admitted resolves once the scheduler lets the call through."""
+    if provider is None:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    route = route or model_router.route(provider, data.text)
+    
+    # Interactive turns jump the queue
+    async with llm_scheduler.slot(provider, user_id, priority=INTERACTIVE):
+        if admitted is not None and not admitted.done():
+            admitted.set_result(True)
+        started = time.monotonic()
+        try:
+            reply = await request_model(data, user_id, provider, system_message, on_text, artifact_mode, route)
+        except Exception:
+            model_router.record(provider, route["model"], time.monotonic() - started, ok=False)
+            raise
+        model_router.record(provider, route["model"], time.monotonic() - started)
+        return {**reply, "route": route}
+
+async def request_model(data: ConversationInput, user_id: str, provider: str, system_message: str,
+                        on_text: Optional[Callable[[str], Awaitable[None]]], artifact_mode: str,
+                        route: Dict[str, Any]) -> Dict[str, Any]:
+    """One call to the routed model (inside the scheduler slot)"""
+    if provider in ("hermes", "openai"):
+        if provider == "hermes":
             # Use Nous Hermes 4 (optimized params from technical report)
-            client = AsyncOpenAI(
-                api_key=NOUS_API_KEY,
-                base_url=NOUS_API_BASE
-            )
-            
-            response = await client.chat.completions.create(
-                model="Hermes-4-70B",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": data.text}
-                ],
-                temperature=0.7,  # Sweet spot for creative but grounded
-                top_p=0.95,  # From technical report
-                max_tokens=300
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-        elif use_openai_direct:
+            client = providers.openai_client(NOUS_API_KEY, NOUS_API_BASE)
+            params = {
+                "model": route["model"],
+                "temperature": 0.7,  # Sweet spot for creative but grounded
+                "top_p": 0.95,  # From technical report
+                "max_tokens": route["max_tokens"]
+            }
+        else:
             # Use user's OpenAI key directly
-            client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": data.text}
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-        elif use_emergent:
-            # Use Emergent LLM key as fallback
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"builder_{user_id}",
-                system_message=system_message
-            ).with_model("openai", "gpt-4o")
-            
-            user_message = UserMessage(text=data.text)
-            ai_response = await chat.send_message(user_message)
+            client = providers.openai_client(OPENAI_API_KEY)
+            params = {"model": route["model"], "temperature": 0.7, "max_tokens": route["max_tokens"]}
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": data.text}
+        ]
+        if artifact_mode == TOOLS:
+            params["tools"] = [ARTIFACT_TOOL]
+            params["tool_choice"] = "auto"
         
-        # Parse response for artifacts
-        structure = parse_natural_response(ai_response, data.text, data.current_frequency)
-        artifacts_specs = parse_artifacts_from_response(structure.get("raw_text", ""), user_id, data.current_frequency)
+        if on_text is None:
+            response = await client.chat.completions.create(messages=messages, **params)
+            message = response.choices[0].message
+            decoded = decode_tool_calls(message.tool_calls) if artifact_mode == TOOLS else {"artifacts": [], "rejected": 0}
+            usage = getattr(response, "usage", None)
+            return {"text": message.content or "", **decoded,
+                    "completion_tokens": getattr(usage, "completion_tokens", None), "mode": artifact_mode}
         
-        # Create artifacts
-        created_artifacts = []
-        import random
-        
-        for i, artifact_spec in enumerate(artifacts_specs):
-            # Random positioning for now - AI could specify later
-            x = 400 + random.randint(-200, 200) + (i * 150)
-            y = 300 + random.randint(-100, 100)
-            
+        if provider == "openai":
+            params["stream_options"] = {"include_usage": True}
+        parts = []
+        decoder = ToolCallDecoder()
+        completion_tokens = None
+        stream = await client.chat.completions.create(messages=messages, stream=True, **params)
+        async for event in stream:
+            if getattr(event, "usage", None):
+                completion_tokens = event.usage.completion_tokens
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta
+            if delta.content:
+                parts.append(delta.content)
+                await on_text(delta.content)
+            if getattr(delta, "tool_calls", None):
+                decoder.feed(delta.tool_calls)
+        decoder.close()
+        return {"text": "".join(parts), "artifacts": decoder.decoded, "rejected": decoder.rejected,
+                "completion_tokens": completion_tokens, "mode": artifact_mode}
+    
+    # Use Emergent LLM key as fallback - no streaming, the reply arrives whole
+    LlmChat, UserMessage = providers.emergent_chat()
+    chat = LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"builder_{user_id}",
+        system_message=system_message
+    ).with_model("openai", route["model"])
+    
+    ai_response = await chat.send_message(UserMessage(text=data.text))
+    if on_text is not None:
+        await on_text(ai_response)
+    return {"text": ai_response, "artifacts": [], "rejected": 0, "completion_tokens": None, "mode": TEXT}
+
+async def complete_conversation_turn(data: ConversationInput, user_id: str, reply: Dict[str, Any],
+                                     turn_id: Optional[str] = None) -> Dict[str, Any]:
+    """Artifacts and merges from the reply, then the turn log. turn_id finishes a turn logged when its stream began."""
+    # Parse response for artifacts - ARTIFACT[...] text still counts in tools mode, models slip back into it
+    structure = parse_natural_response(reply["text"], data.text, data.current_frequency)
+    artifacts_specs = parse_artifacts_from_response(structure.get("raw_text", ""), user_id, data.current_frequency)
+    text_kept = sum(1 for spec in artifacts_specs if spec.get("content"))
+    text_markers = len(re.findall(r'ARTIFACT\[[^\]]+\]', structure.get("raw_text", "")))
+    artifacts_specs += [{"user_id": user_id, "conversation_id": data.current_frequency, **spec} for spec in reply["artifacts"]]
+    artifact_stats.record(
+        reply["mode"],
+        kept=text_kept + len(reply["artifacts"]),
+        dropped=text_markers - text_kept + reply["rejected"],
+        completion_tokens=reply["completion_tokens"]
+    )
+    
+    # Create artifacts
+    created_artifacts = []
+    placements = []
+    artifact_ids = []
+    
+    if artifacts_specs:
+        # Lay new artifacts out around what's already on the canvas, resuming at the layout's frontier
+        layout = await canvas_layout(user_id, data.current_frequency)
+        artifact_ids = [str(uuid.uuid4()) for _ in artifacts_specs]
+        placements = place_artifacts(None, artifacts_specs, layout=layout, keys=artifact_ids)
+    
+    rev = await revisions.next_rev(user_id) if artifacts_specs else None
+    try:
+        for artifact_id, artifact_spec, placement in zip(artifact_ids, artifacts_specs, placements):
             artifact = Artifact(
+                id=artifact_id,
                 user_id=user_id,
                 conversation_id=artifact_spec.get("conversation_id", data.current_frequency),
                 type=artifact_spec.get("type", "text_bubble"),
                 content=artifact_spec.get("content", {}),
                 style=artifact_spec.get("style", {}),
-                position={"x": x, "y": y}
+                position=placement["position"],
+                size=placement["size"],
+                rev=rev
             )
             
             await db.artifacts.insert_one(artifact.model_dump())
+            workspace_cache.upsert(user_id, "artifacts", artifact.conversation_id, artifact.model_dump())
+            search_index.artifact_changed(user_id, artifact.model_dump())
+            canvas_layouts.artifact_changed(user_id, artifact.model_dump())
             created_artifacts.append(artifact)
-        
-        # Log conversation turn
+    finally:
+        if rev is not None:
+            await revisions.release(user_id, rev)
+    
+    # "merge ARTIFACT_x with ARTIFACT_y" - resolved and applied server-side
+    merges = await merge_referenced_artifacts(user_id, data.current_frequency, structure.get("raw_text", ""))
+    
+    if created_artifacts or merges:
+        scopes = {a.conversation_id for a in created_artifacts}
+        scopes.update(s["conversation_id"] for m in merges for s in m["sources"])
+        scopes.update(m["merged"]["conversation_id"] for m in merges)
+        await sync_workspace(user_id, "artifacts", scopes)
+    
+    # Log conversation turn
+    archived_ids = [s["id"] for m in merges for s in m["sources"]]
+    outcome = {
+        "ai_message": structure.get("message"),
+        "artifacts_created": [a.id for a in created_artifacts] + [m["merged"]["id"] for m in merges],
+        "archived_artifact_ids": archived_ids,
+        "route": reply.get("route"),
+        "status": "done"
+    }
+    if turn_id:
+        await db.conversations.update_one(
+            {"id": turn_id},
+            {"$set": {**outcome, "completed_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    else:
+        turn_id = str(uuid.uuid4())
         await db.conversations.insert_one({
+            "id": turn_id,
             "user_id": user_id,
             "conversation_id": data.current_frequency,
             "user_message": data.text,
-            "ai_message": structure.get("message"),
-            "model": "hermes" if use_hermes else "openai",
-            "artifacts_created": [a.id for a in created_artifacts],
+            "model": turn_model(data.model_preference),
+            **outcome,
             "timestamp": datetime.now(timezone.utc).isoformat()
         })
-        
-        return {
-            "message": structure.get("message"),
-            "artifacts": [a.model_dump() for a in created_artifacts]
-        }
+    activity.record(user_id, data.current_frequency, "converse", data.text, artifacts=len(created_artifacts))
+    
+    return {
+        "message": structure.get("message"),
+        "artifacts": [a.model_dump() for a in created_artifacts] + [m["merged"] for m in merges],
+        "archived_artifact_ids": archived_ids,
+        "turn_id": turn_id
+    }
+
+def turn_model(model_preference: str) -> str:
+    return "hermes" if model_preference == "hermes" and NOUS_API_KEY else "openai"
+
+# ==================== Streaming Turns ====================
+
+@api_router.post("/converse/stream")
+async def converse_stream(
+    data: ConversationInput,
+    user_id: str = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """A conversation turn with the reply streamed as NDJSON events (turn, chunk..., done).
+    Generation carries on if the client drops - GET /converse/stream/{turn_id}?after_seq= picks it back up.
+    A retried POST (same Idempotency-Key, or identical and concurrent) follows the turn already started."""
+    provider = choose_provider(data.model_preference)
+    if provider is None:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    fingerprint = request_fingerprint(user_id, data.model_dump())
+    if not idempotency_key:
+        started = await inflight_calls.do(
+            f"converse-stream:{fingerprint}", lambda: start_streaming_turn(data, user_id, provider)
+        )
+    else:
+        try:
+            started, _ = await converse_results.run(
+                f"{user_id}:stream:{idempotency_key}",
+                fingerprint,
+                lambda: start_streaming_turn(data, user_id, provider)
+            )
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    
+    turn_id = started["turn_id"]
+    return StreamingResponse(turn_events(user_id, turn_id), media_type="application/x-ndjson", headers={"X-Turn-Id": turn_id})
+
+async def start_streaming_turn(data: ConversationInput, user_id: str, provider: str) -> Dict[str, str]:
+    """Store the turn and start generating; returns {turn_id} once the scheduler has admitted the call"""
+    turn_id = str(uuid.uuid4())
+    await db.conversations.insert_one({
+        "id": turn_id,
+        "user_id": user_id,
+        "conversation_id": data.current_frequency,
+        "user_message": data.text,
+        "ai_message": "",
+        "model": turn_model(data.model_preference),
+        "artifacts_created": [],
+        "status": STREAMING,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+    
+    # Only commit to a 200 stream once the scheduler has admitted the call - overload stays a 429
+    admitted = asyncio.get_running_loop().create_future()
+    task = asyncio.create_task(run_streaming_turn(data, user_id, provider, turn_id, admitted))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    try:
+        await admitted
     except Exception as e:
-        logging.error(f"Converse error: {str(e)}")
+        await db.conversations.delete_one({"id": turn_id})
+        if isinstance(e, (LLMOverloaded, HTTPException)):
+            raise
+        logging.error(f"Converse stream error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    return {"turn_id": turn_id}
+
+@api_router.get("/converse/stream/{turn_id}")
+async def resume_converse_stream(turn_id: str, after_seq: int = -1, user_id: str = Depends(get_current_user)):
+    """Resume a streamed turn after the last chunk seq the client saw - replays stored chunks, then follows live"""
+    turn = await db.conversations.find_one({"id": turn_id, "user_id": user_id}, {"_id": 0, "id": 1})
+    if not turn:
+        raise HTTPException(status_code=404, detail="Turn not found")
+    return StreamingResponse(turn_events(user_id, turn_id, after_seq), media_type="application/x-ndjson", headers={"X-Turn-Id": turn_id})
+
+async def run_streaming_turn(data: ConversationInput, user_id: str, provider: str, turn_id: str, admitted: asyncio.Future):
+    writer = turn_streams.writer(turn_id)
+    settled = False
+    try:
+        reply = await generate_reply(data, user_id, provider, on_text=writer.write, admitted=admitted)
+        await writer.flush()
+        await complete_conversation_turn(data, user_id, reply, turn_id=turn_id)
+        settled = True
+    except Exception as e:
+        if not admitted.done():
+            admitted.set_exception(e)
+            settled = True
+            return
+        logging.error(f"Streaming turn {turn_id} failed: {e}")
+        try:
+            await writer.flush()
+            await db.conversations.update_one(
+                {"id": turn_id},
+                {"$set": {"status": "error", "error": str(e) or type(e).__name__, "completed_at": datetime.now(timezone.utc).isoformat()}}
+            )
+            settled = True
+        except Exception as err:
+            logging.error(f"Could not record failure of turn {turn_id}: {err}")
+    finally:
+        if not admitted.done():
+            admitted.cancel()
+        try:
+            if not settled:
+                # Cancelled (e.g. shutdown) - don't leave followers on other workers polling a turn nobody generates
+                await writer.flush()
+                await db.conversations.update_one(
+                    {"id": turn_id, "status": STREAMING},
+                    {"$set": {"status": "interrupted", "completed_at": datetime.now(timezone.utc).isoformat()}}
+                )
+        except Exception as err:
+            logging.error(f"Could not mark turn {turn_id} interrupted: {err}")
+        finally:
+            turn_streams.finish(turn_id)
+
+def ndjson(event: Dict[str, Any]) -> bytes:
+    return json.dumps(event, default=str).encode() + b"\n"
+
+async def turn_events(user_id: str, turn_id: str, after_seq: int = -1) -> AsyncIterator[bytes]:
+    yield ndjson({"type": "turn", "turn_id": turn_id})
+    async for chunk in turn_streams.follow(turn_id, after_seq):
+        yield ndjson({"type": "chunk", "seq": chunk["seq"], "text": chunk["text"]})
+    
+    turn = await db.conversations.find_one({"id": turn_id, "user_id": user_id}, {"_id": 0})
+    turn_status = (turn or {}).get("status")
+    if turn_status == "done":
+        artifacts = await db.artifacts.find(
+            {"user_id": user_id, "id": {"$in": turn.get("artifacts_created", [])}},
+            {"_id": 0}
+        ).to_list(None)
+        yield ndjson({
+            "type": "done",
+            "turn_id": turn_id,
+            "message": turn.get("ai_message"),
+            "artifacts": artifacts,
+            "archived_artifact_ids": turn.get("archived_artifact_ids", [])
+        })
+    elif turn_status == "error":
+        yield ndjson({"type": "error", "turn_id": turn_id, "detail": turn.get("error")})
+    else:
+        # The worker generating it went away - what was streamed so far is all there is
+        yield ndjson({"type": "interrupted", "turn_id": turn_id})
+
+# ==================== Conversation History ====================
+
+@api_router.get("/conversations/{conversation_id}/history")
+async def get_conversation_history(conversation_id: str, limit: int = 50, before: Optional[str] = None,
+                                   before_id: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    """Turns oldest-first, a page at a time going back. Pass next_before / next_before_id as `before` / `before_id`
+    for the previous page."""
+    limit = max(1, min(limit, 200))
+    query: Dict[str, Any] = {"user_id": user_id, "conversation_id": conversation_id}
+    if before:
+        # Keyset pagination on (timestamp, id) - an index range scan, however far back the page is.
+        # The id breaks ties, so turns sharing a timestamp across a page boundary are neither skipped nor repeated
+        timestamp = normalize_timestamp(before)
+        if before_id:
+            query["$or"] = [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "id": {"$lt": before_id}}]
+        else:
+            query["timestamp"] = {"$lt": timestamp}
+    turns = await db.conversations.find(query, {"_id": 0, "user_id": 0}).sort(
+        [("timestamp", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(turns) > limit
+    turns = turns[:limit]
+    return {
+        "turns": turns[::-1],
+        "next_before": turns[-1]["timestamp"] if has_more else None,
+        "next_before_id": turns[-1].get("id") if has_more else None
+    }
+
+# ==================== Workspace Cache ====================
+
+def shared_workspace_key(user_id: str, kind: str) -> str:
+    return f"ws:{user_id}:{kind}"
+
+async def read_workspace_list(user_id: str, kind: str, scope: str, tag: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Local cache first, then the shared tier (which refills the local one).
+    With tag (the listing's ETag) only a local copy loaded under that ETag counts - the shared
+    tier is refreshed after the revision bump, so it can't vouch for one."""
+    docs = workspace_cache.get(user_id, kind, scope, tag)
+    if docs is not None or tag is not None or not shared_cache.shared:
+        return docs
+    generation = workspace_cache.generation(user_id, kind, scope)
+    try:
+        raw = await shared_cache.hget(shared_workspace_key(user_id, kind), scope)
+    except Exception as e:
+        logging.warning(f"Shared cache read failed: {e}")
+        return None
+    if raw is None:
+        return None
+    workspace_cache.set(user_id, kind, scope, json.loads(raw), generation)
+    return workspace_cache.get(user_id, kind, scope) or json.loads(raw)
+
+async def store_workspace_list(user_id: str, kind: str, scope: str, docs: List[Dict[str, Any]],
+                               generation: Generation, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Cache a listing read from Mongo - unless a write-through touched it since `generation` was taken"""
+    workspace_cache.set(user_id, kind, scope, docs, generation, tag)
+    if workspace_cache.generation(user_id, kind, scope) != generation:
+        # A write landed while we read - this list may predate it, so don't share it either
+        return docs
+    if shared_cache.shared:
+        try:
+            await shared_cache.hset(shared_workspace_key(user_id, kind), scope, json.dumps(docs, default=str), ttl=workspace_cache.ttl)
+        except Exception as e:
+            logging.warning(f"Shared cache write failed: {e}")
+    # Hand back the cached list itself so viewport indexes can key off it
+    return workspace_cache.get(user_id, kind, scope) or docs
+
+async def sync_workspace(user_id: str, kind: str, scopes: Optional[set] = None):
+    """After a local write-through: bump listing revisions, refresh the shared tier and tell peer workers.
+    scopes=None means every listing of this kind for the user."""
+    try:
+        await revisions.bump(user_id, kind, scopes)
+    except Exception as e:
+        logging.error(f"Revision bump failed: {e}")
+    if not shared_cache.shared:
+        return
+    key = shared_workspace_key(user_id, kind)
+    try:
+        if scopes is None:
+            await shared_cache.delete(key)
+        else:
+            for scope in scopes:
+                if scope is None:
+                    continue
+                docs = workspace_cache.peek(user_id, kind, scope)
+                if docs is None:
+                    await shared_cache.hdel(key, scope)
+                else:
+                    await shared_cache.hset(key, scope, json.dumps(docs, default=str), ttl=workspace_cache.ttl)
+    except Exception as e:
+        logging.warning(f"Shared cache sync failed: {e}")
+    await invalidation_bus.publish(
+        user_id=user_id,
+        kind=kind,
+        scopes=None if scopes is None else sorted(s for s in scopes if s is not None)
+    )
+
+async def apply_remote_invalidation(message: Dict[str, Any]):
+    """A peer worker wrote - drop our local copies so the next read refills"""
+    user_id, kind, scopes = message.get("user_id"), message.get("kind"), message.get("scopes")
+    if not user_id or kind not in ("nodes", "artifacts"):
+        return
+    if scopes is None:
+        workspace_cache.invalidate(user_id, kind)
+    else:
+        for scope in scopes:
+            workspace_cache.invalidate(user_id, kind, scope)
+    if kind == "nodes":
+        graph_index.invalidate(user_id)
+    else:
+        canvas_layouts.invalidate(user_id)
+    search_index.invalidate(user_id)
+
+# ==================== Version History ====================
+
+async def record_version(kind: str, user_id: str, before: Dict[str, Any], after: Dict[str, Any]):
+    # History is best-effort - a failed append must not fail the edit itself
+    try:
+        await version_history.record(kind, user_id, before, after)
+    except Exception as e:
+        logging.error(f"Recording {kind} version failed: {e}")
+
+def normalize_timestamp(value: str) -> str:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="timestamp must be ISO 8601")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+async def version_history_response(kind: str, entity_id: str, user_id: str, limit: int, before: Optional[int]):
+    history = await version_history.list_versions(kind, user_id, entity_id, limit=max(1, min(limit, 200)), before=before)
+    if not history["total_versions"]:
+        raise HTTPException(status_code=404, detail="No history for this item")
+    return {f"{kind}_id": entity_id, **history}
+
+async def version_response(kind: str, entity_id: str, user_id: str, version: Optional[int] = None, timestamp: Optional[str] = None):
+    if timestamp is not None:
+        doc = await version_history.as_of(kind, user_id, entity_id, normalize_timestamp(timestamp))
+    else:
+        doc = await version_history.get_version(kind, user_id, entity_id, version)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return doc
+
+@api_router.get("/artifacts/{artifact_id}/history")
+async def get_artifact_history(artifact_id: str, limit: int = 50, before: Optional[int] = None, user_id: str = Depends(get_current_user)):
+    """Version list (newest first) with delta vs full-copy storage"""
+    return await version_history_response("artifact", artifact_id, user_id, limit, before)
+
+@api_router.get("/artifacts/{artifact_id}/versions/{version}")
+async def get_artifact_version(artifact_id: str, version: int, user_id: str = Depends(get_current_user)):
+    """The artifact as of a version number"""
+    return await version_response("artifact", artifact_id, user_id, version=version)
+
+@api_router.get("/artifacts/{artifact_id}/as-of")
+async def get_artifact_as_of(artifact_id: str, timestamp: str, user_id: str = Depends(get_current_user)):
+    """The artifact as it was at a point in time"""
+    return await version_response("artifact", artifact_id, user_id, timestamp=timestamp)
+
+@api_router.get("/nodes/{node_id}/history")
+async def get_node_history(node_id: str, limit: int = 50, before: Optional[int] = None, user_id: str = Depends(get_current_user)):
+    """Version list (newest first) with delta vs full-copy storage"""
+    return await version_history_response("node", node_id, user_id, limit, before)
+
+@api_router.get("/nodes/{node_id}/versions/{version}")
+async def get_node_version(node_id: str, version: int, user_id: str = Depends(get_current_user)):
+    """The node as of a version number"""
+    return await version_response("node", node_id, user_id, version=version)
+
+@api_router.get("/nodes/{node_id}/as-of")
+async def get_node_as_of(node_id: str, timestamp: str, user_id: str = Depends(get_current_user)):
+    """The node as it was at a point in time"""
+    return await version_response("node", node_id, user_id, timestamp=timestamp)
+
+# ==================== Delta Sync ====================
+
+async def write_tombstone(user_id: str, kind: str, doc_id: str, rev: Optional[int] = None) -> int:
+    """Record a hard delete so /sync can pass it on; returns its revision.
+    Pass rev when the caller holds one in flight for follow-up writes."""
+    if rev is None:
+        async with revisions.writing(user_id) as rev:
+            return await write_tombstone(user_id, kind, doc_id, rev)
+    await db.tombstones.insert_one({
+        "user_id": user_id,
+        "kind": kind,
+        "id": doc_id,
+        "rev": rev,
+        "deleted_at": datetime.now(timezone.utc).isoformat()
+    })
+    return rev
+
+@api_router.get("/sync")
+async def sync_changes(since: Optional[int] = None, user_id: str = Depends(get_current_user)):
+    """Nodes and artifacts written, and ids deleted, after revision `since`.
+    Archived documents come back with archived=True. reset=True means reload the full listings."""
+    # Read the cursor first - it sits below every write still in flight, so anything
+    # that lands while we query (or landed out of order) is sent again next time
+    rev = await revisions.sync_cursor(user_id)
+    if since is None or since > rev:
+        return {"rev": rev, "reset": True}
+    
+    query = {"user_id": user_id, "rev": {"$gt": since}}
+    limit = SYNC_MAX_CHANGES + 1
+    nodes, artifacts, tombstones = await asyncio.gather(
+        db.nodes.find(query, {"_id": 0}).sort("rev", 1).to_list(limit),
+        db.artifacts.find(query, {"_id": 0}).sort("rev", 1).to_list(limit),
+        db.tombstones.find(query, {"_id": 0, "kind": 1, "id": 1}).sort("rev", 1).to_list(limit),
+    )
+    if len(nodes) + len(artifacts) + len(tombstones) > SYNC_MAX_CHANGES:
+        return {"rev": rev, "reset": True}
+    
+    deleted = {"nodes": [], "artifacts": []}
+    for tombstone in tombstones:
+        deleted.setdefault(tombstone["kind"], []).append(tombstone["id"])
+    return {
+        "rev": rev,
+        "reset": False,
+        "nodes": nodes,
+        "artifacts": artifacts,
+        "deleted": deleted
+    }
+
+# ==================== Conditional GET ====================
+
+async def not_modified(request: Request, response: Response, user_id: str, kind: str,
+                       scope: Optional[str] = None, variant: str = "") -> Optional[Response]:
+    """Set the listing's ETag; a 304 to return instead if the client already has this revision.
+    A body sent with the ETag must be read after it, and never from a cached copy loaded under another."""
+    etag = await revisions.etag(user_id, kind, scope, variant)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 # ==================== Node Management ====================
 
+async def load_conversation_artifacts(user_id: str, conversation_id: str, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Live artifacts for a conversation, served from the workspace cache when hot.
+    tag is the ETag being served with them, read before this call."""
+    generation = workspace_cache.generation(user_id, "artifacts", conversation_id)
+    cached = await read_workspace_list(user_id, "artifacts", conversation_id, tag)
+    if cached is not None:
+        return cached
+    
+    artifacts = await db.artifacts.find(
+        {"user_id": user_id, "conversation_id": conversation_id, "archived": {"$ne": True}},
+        {"_id": 0}
+    ).to_list(None)
+    return await store_workspace_list(user_id, "artifacts", conversation_id, artifacts, generation, tag)
+
+async def canvas_layout(user_id: str, conversation_id: str) -> CanvasLayout:
+    """The conversation's spatial index - built once from the full listing, then kept current by write-through"""
+    layout = canvas_layouts.get(user_id, conversation_id)
+    if layout is None:
+        layout = canvas_layouts.build(user_id, conversation_id, await load_conversation_artifacts(user_id, conversation_id))
+    return layout
+
 @api_router.get("/nodes")
-async def get_nodes(user_id: str = Depends(get_current_user), include_archived: bool = False):
+async def get_nodes(request: Request, response: Response, user_id: str = Depends(get_current_user), include_archived: bool = False):
+    unchanged = await not_modified(request, response, user_id, "nodes", variant=f"archived={include_archived}")
+    if unchanged:
+        return unchanged
+    
     query = {"user_id": user_id}
     if not include_archived:
         query["archived"] = {"$ne": True}
@@ -417,13 +1200,44 @@ async def get_nodes(user_id: str = Depends(get_current_user), include_archived:
     return nodes
 
 @api_router.get("/artifacts/{conversation_id}")
-async def get_artifacts(conversation_id: str, user_id: str = Depends(get_current_user)):
+async def get_artifacts(conversation_id: str, request: Request, response: Response, user_id: str = Depends(get_current_user)):
     """Get all artifacts for a conversation"""
-    artifacts = await db.artifacts.find(
-        {"user_id": user_id, "conversation_id": conversation_id, "archived": {"$ne": True}},
-        {"_id": 0}
-    ).to_list(1000)
-    return artifacts
+    unchanged = await not_modified(request, response, user_id, "artifacts", conversation_id)
+    if unchanged:
+        return unchanged
+    return await load_conversation_artifacts(user_id, conversation_id, response.headers["ETag"])
+
+@api_router.get("/artifacts/{conversation_id}/viewport")
+async def get_artifacts_in_viewport(
+    conversation_id: str,
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    tile: float = 0,
+    max_artifacts: int = Query(500, ge=1, le=5000),
+    user_id: str = Depends(get_current_user)
+):
+    """Artifacts intersecting the viewport, plus per-tile counts for zoomed-out views"""
+    if x1 <= x0 or y1 <= y0:
+        raise HTTPException(status_code=400, detail="Viewport must have x1 > x0 and y1 > y0")
+    
+    layout = await canvas_layout(user_id, conversation_id)
+    # Slots reserved by a turn still writing its artifacts have no document yet
+    visible = [a for a in layout.index.query_items((x0, y0, x1 - x0, y1 - y0)) if a is not None]
+    
+    # Too many to draw individually - the client should render tile summaries instead
+    truncated = len(visible) > max_artifacts
+    if truncated and tile <= 0:
+        tile = max(x1 - x0, y1 - y0) / 16
+    
+    return {
+        "viewport": {"x0": x0, "y0": y0, "x1": x1, "y1": y1},
+        "total": len(visible),
+        "truncated": truncated,
+        "artifacts": [] if truncated else visible,
+        "tiles": tile_counts(visible, tile) if tile > 0 else []
+    }
 
 @api_router.patch("/artifacts/{artifact_id}")
 async def update_artifact(artifact_id: str, updates: dict, user_id: str = Depends(get_current_user)):
@@ -433,28 +1247,83 @@ async def update_artifact(artifact_id: str, updates: dict, user_id: str = Depend
         raise HTTPException(status_code=404, detail="Artifact not found")
     
     updates['updated_at'] = datetime.now(timezone.utc).isoformat()
-    await db.artifacts.update_one({"id": artifact_id}, {"$set": updates})
+    async with revisions.writing(user_id) as rev:
+        updates['rev'] = rev
+        await db.artifacts.update_one({"id": artifact_id}, {"$set": updates})
     
     updated = await db.artifacts.find_one({"id": artifact_id}, {"_id": 0})
+    
+    # Write-through: the artifact may have moved conversation or been archived
+    workspace_cache.discard(user_id, "artifacts", artifact_id)
+    if updated and not updated.get("archived"):
+        workspace_cache.upsert(user_id, "artifacts", updated.get("conversation_id"), updated)
+    if updated:
+        search_index.artifact_changed(user_id, updated)
+        canvas_layouts.artifact_changed(user_id, updated)
+        await record_version("artifact", user_id, artifact, updated)
+    await sync_workspace(user_id, "artifacts", {artifact.get("conversation_id"), (updated or {}).get("conversation_id")})
     return updated
 
+@api_router.post("/artifacts/merge")
+async def merge_artifacts_route(data: ArtifactMergeInput, user_id: str = Depends(get_current_user)):
+    """Merge artifacts into a new one and archive the sources"""
+    refs = list(dict.fromkeys(data.artifact_ids))
+    resolved = await resolve_references(db, user_id, refs)
+    unresolved = [ref for ref in refs if ref not in resolved]
+    if unresolved:
+        raise HTTPException(status_code=404, detail=f"Unknown or ambiguous artifact ids: {', '.join(unresolved)}")
+    
+    conversation_id = data.conversation_id or resolved[refs[0]]["conversation_id"]
+    merges = await commit_merges(user_id, conversation_id, [refs], resolved)
+    if not merges:
+        raise HTTPException(status_code=400, detail="Need at least two distinct artifacts to merge")
+    
+    scopes = {conversation_id} | {s["conversation_id"] for s in merges[0]["sources"]}
+    await sync_workspace(user_id, "artifacts", scopes)
+    return {"artifact": merges[0]["merged"], "archived_artifact_ids": [s["id"] for s in merges[0]["sources"]]}
+
 @api_router.delete("/artifacts/{artifact_id}")
 async def delete_artifact(artifact_id: str, user_id: str = Depends(get_current_user)):
     """Delete artifact"""
-    result = await db.artifacts.delete_one({"id": artifact_id, "user_id": user_id})
+    deleted = await db.artifacts.find_one_and_delete(
+        {"id": artifact_id, "user_id": user_id},
+        {"_id": 0, "conversation_id": 1}
+    )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Artifact not found")
     
+    await write_tombstone(user_id, "artifacts", artifact_id)
+    workspace_cache.discard(user_id, "artifacts", artifact_id)
+    search_index.artifact_removed(user_id, artifact_id)
+    canvas_layouts.artifact_removed(user_id, artifact_id)
+    await sync_workspace(user_id, "artifacts", {deleted.get("conversation_id")})
     return {"deleted": True, "artifact_id": artifact_id}
 
 @api_router.get("/nodes/{frequency}")
-async def get_nodes_by_frequency(frequency: str, user_id: str = Depends(get_current_user), include_archived: bool = False):
-    query = {"user_id": user_id, "frequency": frequency}
+async def get_nodes_by_frequency(frequency: str, request: Request, response: Response,
+                                 user_id: str = Depends(get_current_user), include_archived: bool = False):
+    unchanged = await not_modified(request, response, user_id, "nodes", frequency, variant=f"archived={include_archived}")
+    if unchanged:
+        return unchanged
+    
     if not include_archived:
-        query["archived"] = {"$ne": True}
-    nodes = await db.nodes.find(query, {"_id": 0}).to_list(1000)
-    return nodes
+        return await load_frequency_nodes(user_id, frequency, response.headers["ETag"])
+    return await db.nodes.find({"user_id": user_id, "frequency": frequency}, {"_id": 0}).to_list(1000)
+
+async def load_frequency_nodes(user_id: str, frequency: str, tag: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Live nodes in a frequency - the listing the canvas loads, so the one that's cached.
+    tag is the ETag being served with them, read before this call."""
+    generation = workspace_cache.generation(user_id, "nodes", frequency)
+    cached = await read_workspace_list(user_id, "nodes", frequency, tag)
+    if cached is not None:
+        return cached
+    
+    nodes = await db.nodes.find(
+        {"user_id": user_id, "frequency": frequency, "archived": {"$ne": True}},
+        {"_id": 0}
+    ).to_list(1000)
+    return await store_workspace_list(user_id, "nodes", frequency, nodes, generation, tag)
 
 @api_router.patch("/nodes/{node_id}")
 async def update_node(node_id: str, updates: dict, user_id: str = Depends(get_current_user)):
@@ -463,9 +1332,31 @@ async def update_node(node_id: str, updates: dict, user_id: str = Depends(get_cu
         raise HTTPException(status_code=404, detail="Node not found")
     
     updates['updated_at'] = datetime.now(timezone.utc).isoformat()
-    await db.nodes.update_one({"id": node_id}, {"$set": updates})
+    async with revisions.writing(user_id) as rev:
+        updates['rev'] = rev
+        await db.nodes.update_one({"id": node_id}, {"$set": updates})
+        
+        updated = await db.nodes.find_one({"id": node_id}, {"_id": 0})
+        
+        # Keep the link graph and denormalized link_count in step
+        touched_scopes = {node.get("frequency"), (updated or {}).get("frequency")}
+        if updated and any(k in updates for k in ("linked_ids", "parent_id", "merged_from")):
+            link_counts = await graph_index.node_updated(user_id, updated, rev)
+            updated["link_count"] = link_counts.get(node_id, updated.get("link_count", 0))
+            if set(link_counts) - {node_id}:
+                workspace_cache.invalidate(user_id, "nodes")
+                touched_scopes = None
     
-    updated = await db.nodes.find_one({"id": node_id}, {"_id": 0})
+    # Write-through: the node may have changed frequency or been archived
+    workspace_cache.discard(user_id, "nodes", node_id)
+    if updated and not updated.get("archived"):
+        workspace_cache.upsert(user_id, "nodes", updated.get("frequency"), updated)
+    if updated:
+        search_index.node_changed(user_id, updated)
+        activity.record(user_id, updated.get("frequency"), "update_node",
+                        fields=sorted(k for k in updates if k not in ("updated_at", "rev")))
+        await record_version("node", user_id, node, updated)
+    await sync_workspace(user_id, "nodes", touched_scopes)
     return updated
 
 @api_router.post("/nodes/archive-all")
@@ -507,10 +1398,18 @@ async def archive_all_nodes(frequency: str, user_id: str = Depends(get_current_u
         })
         
         # Mark nodes as archived instead of deleting
-        await db.nodes.update_many(
-            {"user_id": user_id, "frequency": frequency},
-            {"$set": {"archived": True, "archived_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        async with revisions.writing(user_id) as rev:
+            await db.nodes.update_many(
+                {"user_id": user_id, "frequency": frequency},
+                {"$set": {"archived": True, "archived_at": datetime.now(timezone.utc).isoformat(), "rev": rev}}
+            )
+        
+        # Every node in this frequency is archived now - the live listing is empty
+        workspace_cache.set(user_id, "nodes", frequency, [])
+        search_index.frequency_archived(user_id, frequency)
+        activity.record(user_id, frequency, "archive", nodes=len(nodes))
+        await sync_workspace(user_id, "nodes", {frequency})
+        await revisions.bump(user_id, "archives")
     
     return {
         "archived": len(nodes),
@@ -523,11 +1422,24 @@ async def archive_all_nodes(frequency: str, user_id: str = Depends(get_current_u
 @api_router.delete("/nodes/{node_id}")
 async def delete_node(node_id: str, user_id: str = Depends(get_current_user)):
     """Delete a single node"""
-    result = await db.nodes.delete_one({"id": node_id, "user_id": user_id})
+    deleted = await db.nodes.find_one_and_delete(
+        {"id": node_id, "user_id": user_id},
+        {"_id": 0, "frequency": 1}
+    )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Node not found")
     
+    touched_scopes = {deleted.get("frequency")}
+    # One revision for the tombstone and the neighbours' link updates, held until both have landed
+    async with revisions.writing(user_id) as rev:
+        await write_tombstone(user_id, "nodes", node_id, rev)
+        if await graph_index.node_deleted(user_id, node_id, rev):
+            workspace_cache.invalidate(user_id, "nodes")
+            touched_scopes = None
+    workspace_cache.discard(user_id, "nodes", node_id)
+    search_index.node_removed(user_id, node_id)
+    await sync_workspace(user_id, "nodes", touched_scopes)
     return {"deleted": True, "node_id": node_id}
 
 @api_router.post("/nodes/restore-from-archive")
@@ -552,15 +1464,23 @@ async def restore_from_archive(archive_id: str, node_ids: List[str], user_id: st
     
     # Restore nodes (unmark as archived)
     restored_count = 0
-    for node in nodes_to_restore:
-        node["archived"] = False
-        node["restored_at"] = datetime.now(timezone.utc).isoformat()
-        await db.nodes.update_one(
-            {"id": node.get("id")},
-            {"$set": node},
-            upsert=True
-        )
-        restored_count += 1
+    async with revisions.writing(user_id) as rev:
+        for node in nodes_to_restore:
+            node["archived"] = False
+            node["restored_at"] = datetime.now(timezone.utc).isoformat()
+            node["rev"] = rev
+            await db.nodes.update_one(
+                {"id": node.get("id")},
+                {"$set": node},
+                upsert=True
+            )
+            restored_count += 1
+    
+    workspace_cache.invalidate(user_id, "nodes")
+    graph_index.invalidate(user_id)
+    search_index.invalidate(user_id)
+    activity.record(user_id, archive.get("frequency"), "restore", nodes=restored_count)
+    await sync_workspace(user_id, "nodes")
     
     return {
         "restored": restored_count,
@@ -569,11 +1489,19 @@ async def restore_from_archive(archive_id: str, node_ids: List[str], user_id: st
     }
 
 @api_router.get("/archives")
-async def get_archives(user_id: str = Depends(get_current_user)):
+async def get_archives(request: Request, response: Response, user_id: str = Depends(get_current_user)):
     """Get all archives for user"""
+    unchanged = await not_modified(request, response, user_id, "archives")
+    if unchanged:
+        return unchanged
+    
+    return await load_archive_summaries(user_id)
+
+async def load_archive_summaries(user_id: str) -> List[Dict[str, Any]]:
+    # The node snapshots are the bulk of an archive and the listing doesn't show them
     archives = await db.archived_sessions.find(
         {"user_id": user_id},
-        {"_id": 0}
+        {"_id": 0, "nodes": 0}
     ).sort("archived_at", -1).to_list(100)
     
     # Return simplified view
@@ -587,11 +1515,269 @@ async def get_archives(user_id: str = Depends(get_current_user)):
         "node_ids": a.get("node_ids", [])
     } for a in archives]
 
+# ==================== Node Graph ====================
+
+async def fetch_nodes_by_id(user_id: str, node_ids: List[str]) -> List[Dict[str, Any]]:
+    if not node_ids:
+        return []
+    return await db.nodes.find(
+        {"user_id": user_id, "id": {"$in": node_ids}},
+        {"_id": 0}
+    ).to_list(len(node_ids))
+
+@api_router.get("/graph/neighbors/{node_id}")
+async def get_node_neighbors(node_id: str, user_id: str = Depends(get_current_user)):
+    """Nodes directly linked to a node"""
+    graph = await graph_index.get(user_id)
+    if node_id not in graph.links:
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    neighbor_ids = graph.neighbours(node_id)
+    return {"node_id": node_id, "neighbors": await fetch_nodes_by_id(user_id, neighbor_ids)}
+
+@api_router.get("/graph/expand/{node_id}")
+async def expand_node_graph(node_id: str, depth: int = 2, limit: int = 200, user_id: str = Depends(get_current_user)):
+    """k-hop neighbourhood of a node - nodes with hop distance plus the edges between them"""
+    graph = await graph_index.get(user_id)
+    if node_id not in graph.links:
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    hops = graph.expand(node_id, max(0, min(depth, 6)), max(1, min(limit, 2000)))
+    nodes = await fetch_nodes_by_id(user_id, list(hops))
+    for node in nodes:
+        node["hops"] = hops.get(node.get("id"))
+    
+    edges = sorted({
+        tuple(sorted((a, b)))
+        for a in hops for b in graph.links.get(a, ()) if b in hops
+    })
+    return {"root": node_id, "nodes": nodes, "edges": [list(e) for e in edges]}
+
+@api_router.get("/graph/path")
+async def get_node_path(source: str, target: str, user_id: str = Depends(get_current_user)):
+    """Shortest link path between two nodes"""
+    graph = await graph_index.get(user_id)
+    path = graph.shortest_path(source, target)
+    if path is None:
+        return {"source": source, "target": target, "path": [], "length": None}
+    return {"source": source, "target": target, "path": path, "length": len(path) - 1}
+
+@api_router.get("/graph/components")
+async def get_node_components(min_size: int = 2, user_id: str = Depends(get_current_user)):
+    """Connected clusters of linked nodes (ids only), largest first"""
+    graph = await graph_index.get(user_id)
+    components = graph.components(min_size=max(1, min_size))
+    return {"count": len(components), "components": components}
+
+@api_router.get("/graph/lineage/{node_id}")
+async def get_node_lineage(node_id: str, user_id: str = Depends(get_current_user)):
+    """parent_id ancestry, merged_from sources and direct children of a node"""
+    graph = await graph_index.get(user_id)
+    if node_id not in graph.links:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return {"node_id": node_id, **graph.lineage(node_id)}
+
+# ==================== Search ====================
+
+@api_router.get("/search")
+async def search_workspace(
+    q: str,
+    kind: Optional[str] = None,
+    frequency: Optional[str] = None,
+    tags: Optional[str] = None,
+    include_archived: bool = False,
+    offset: int = 0,
+    limit: int = 20,
+    user_id: str = Depends(get_current_user)
+):
+    """Ranked (BM25) search over node title/aliases/tags/content and artifact text"""
+    if kind not in (None, "node", "artifact"):
+        raise HTTPException(status_code=400, detail="kind must be 'node' or 'artifact'")
+    
+    index = await search_index.get(user_id)
+    tag_filter = [t.strip() for t in tags.split(",") if t.strip()] if tags else None
+    results = index.search(q, kind=kind, frequency=frequency, tags=tag_filter, include_archived=include_archived)
+    
+    frequency_counts = {}
+    for _, meta in results:
+        frequency_counts[meta["frequency"]] = frequency_counts.get(meta["frequency"], 0) + 1
+    
+    offset = max(0, offset)
+    limit = max(1, min(limit, 100))
+    page = results[offset:offset + limit]
+    return {
+        "query": q,
+        "total": len(results),
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {**{k: v for k, v in meta.items() if k != "length"}, "score": round(score, 4)}
+            for score, meta in page
+        ],
+        "facets": {"tags": tag_facets(results), "frequency": frequency_counts}
+    }
+
+@api_router.get("/search/suggest")
+async def suggest_nodes(prefix: str, frequency: Optional[str] = None, limit: int = 10, user_id: str = Depends(get_current_user)):
+    """Typeahead over node titles and aliases"""
+    index = await search_index.get(user_id)
+    return {"prefix": prefix, "suggestions": index.suggest(prefix, limit=max(1, min(limit, 50)), frequency=frequency)}
+
 # ==================== Pattern Recognition ====================
 
+def describe_rollups(daily: List[Dict[str, Any]], summary: Dict[str, Any]) -> str:
+    """Compact prompt context from rollup docs"""
+    def ranked(counts: Dict[str, int]) -> str:
+        return ", ".join(f"{k} {v}" for k, v in sorted(counts.items(), key=lambda kv: -kv[1]))
+    
+    shifts = sorted(
+        ((src, dst, n) for src, row in summary["transitions"].items() for dst, n in row.items() if src != dst),
+        key=lambda t: -t[2]
+    )[:5]
+    
+    lines = [
+        f"{summary['total']} moments over {len(daily)} active days",
+        f"Frequencies: {ranked(summary['frequencies'])}",
+        f"Actions: {ranked(summary['actions'])}",
+    ]
+    if shifts:
+        lines.append("Common shifts: " + ", ".join(f"{src} → {dst} ({n})" for src, dst, n in shifts))
+    for day in daily[:7]:
+        frequencies = day.get("frequencies") or {}
+        if frequencies:
+            dominant = max(frequencies, key=frequencies.get)
+            lines.append(f"{day['start'][:10]}: mostly {dominant} ({day.get('total', 0)} moments)")
+    return "\n".join(lines)
+
+RHYTHM_HISTORY_LIMIT = 200000
+# user_id -> (activity revision, features); recomputed only once new events are stored
+rhythm_cache = TTLCache(ttl=float(os.getenv('RHYTHM_CACHE_TTL', '3600')), max_entries=int(os.getenv('RHYTHM_CACHE_USERS', '1024')))
+
+async def load_rhythm_features(user_id: str) -> Dict[str, Any]:
+    """Rhythm features over the user's full event history (newest RHYTHM_HISTORY_LIMIT events)"""
+    await activity.flush(user_id)
+    revision = await activity.revision(user_id)
+    cached = rhythm_cache.get(user_id)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+    return await inflight_calls.do(f"rhythm:{user_id}:{revision}", lambda: compute_rhythm_features(user_id, revision))
+
+async def compute_rhythm_features(user_id: str, revision: int) -> Dict[str, Any]:
+    events = await db.patterns.find(
+        {"user_id": user_id},
+        {"_id": 0, "timestamp": 1, "frequency": 1}
+    ).sort("timestamp", -1).limit(RHYTHM_HISTORY_LIMIT).to_list(None)
+    # Parsing and NumPy over a long history takes real CPU - keep it off the event loop
+    features = await asyncio.to_thread(rhythm_features, events)
+    rhythm_cache.set(user_id, (revision, features))
+    return features
+
+@api_router.get("/patterns/stats")
+async def get_pattern_stats(user_id: str = Depends(get_current_user)):
+    """Rhythm features computed locally - no LLM involved"""
+    return await load_rhythm_features(user_id)
+
+@api_router.get("/patterns/rollups")
+async def get_pattern_rollups(bucket: str = "day", limit: int = 30, user_id: str = Depends(get_current_user)):
+    """Pre-aggregated activity per hour/day, newest first, plus their sum"""
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be 'hour' or 'day'")
+    
+    await activity.flush(user_id)
+    rollups = await db.pattern_rollups.find(
+        {"user_id": user_id, "bucket": bucket},
+        {"_id": 0, "user_id": 0}
+    ).sort("start", -1).limit(max(1, min(limit, 24 * 31))).to_list(None)
+    
+    return {"bucket": bucket, "rollups": rollups, "summary": merge_rollups(rollups)}
+
 @api_router.get("/patterns/insights")
 async def get_pattern_insights(user_id: str = Depends(get_current_user), model: str = "hermes"):
     """Analyze user's creative rhythms with affective language"""
+    cached = await read_cached_insights(user_id, model)
+    if cached is not None:
+        return cached
+    return await refresh_pattern_insights(user_id, model)
+
+async def read_cached_insights(user_id: str, model: str) -> Optional[Dict[str, Any]]:
+    """Insights without calling the LLM: shared cache, then the stored precompute. None if neither exists."""
+    cache_key = f"insights:{user_id}:{model}"
+    try:
+        cached = await shared_cache.get(cache_key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logging.warning(f"Insights cache read failed: {e}")
+    
+    # Precomputed (e.g. while the user was idle) - serve it, refresh in the background if the pattern moved on
+    stored = await db.insights.find_one({"user_id": user_id, "model": model}, {"_id": 0})
+    if stored:
+        result = {"insights": stored["insights"]}
+        await cache_insights(cache_key, result)
+        if stored.get("fingerprint") != await current_pattern_fingerprint(user_id):
+            await queue_insights_job(user_id, model)
+        return result
+    return None
+
+async def current_pattern_fingerprint(user_id: str) -> str:
+    await activity.flush(user_id)
+    daily = await db.pattern_rollups.find(
+        {"user_id": user_id, "bucket": "day"},
+        {"_id": 0, "start": 1, "total": 1, "frequencies": 1}
+    ).sort("start", -1).limit(14).to_list(14)
+    return rollup_fingerprint(daily)
+
+async def cache_insights(cache_key: str, result: Dict[str, Any]):
+    try:
+        await shared_cache.set(cache_key, json.dumps(result), ttl=INSIGHTS_CACHE_TTL)
+    except Exception as e:
+        logging.warning(f"Insights cache write failed: {e}")
+
+async def refresh_pattern_insights(user_id: str, model: str) -> Dict[str, Any]:
+    """Generate insights, persist them with the pattern fingerprint and cache them for the next read"""
+    cache_key = f"insights:{user_id}:{model}"
+    fingerprint = await current_pattern_fingerprint(user_id)
+    # Reloads while an insight is being generated wait on the same call
+    result = await inflight_calls.do(cache_key, lambda: compute_pattern_insights(user_id, model))
+    if result.get("insights"):
+        await cache_insights(cache_key, result)
+        await db.insights.update_one(
+            {"user_id": user_id, "model": model},
+            {"$set": {
+                "insights": result["insights"],
+                "fingerprint": fingerprint,
+                "computed_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+    return result
+
+async def queue_insights_job(user_id: str, model: str) -> Optional[str]:
+    return await job_runner.enqueue("insights.refresh", {"user_id": user_id, "model": model},
+                                    user_id=user_id, dedupe_key=f"{user_id}:{model}")
+
+@api_router.post("/activity/idle")
+async def report_idle(signal: IdleSignal, user_id: str = Depends(get_current_user)):
+    """Idle signal from the client - a quiet moment to precompute insights at low priority"""
+    if signal.idle_seconds < IDLE_PRECOMPUTE_SECONDS:
+        return {"queued": False, "reason": "not idle long enough"}
+    
+    stored = await db.insights.find_one({"user_id": user_id, "model": signal.model}, {"_id": 0, "fingerprint": 1, "computed_at": 1})
+    if stored:
+        if stored.get("fingerprint") == await current_pattern_fingerprint(user_id):
+            return {"queued": False, "reason": "insights are current"}
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(stored["computed_at"])).total_seconds()
+        if age < INSIGHTS_MIN_INTERVAL:
+            return {"queued": False, "reason": "refreshed recently"}
+    
+    return {"queued": True, "job_id": await queue_insights_job(user_id, signal.model)}
+
+@api_router.post("/patterns/insights/refresh", status_code=202)
+async def queue_insights_refresh(user_id: str = Depends(get_current_user), model: str = "hermes"):
+    """Regenerate insights in the background; poll /jobs/{job_id} or just re-read insights later"""
+    return {"job_id": await queue_insights_job(user_id, model)}
+
+async def compute_pattern_insights(user_id: str, model: str) -> Dict[str, Any]:
     use_hermes = model == "hermes" and NOUS_API_KEY
     use_openai_direct = model == "openai" and OPENAI_API_KEY
     use_emergent = model == "openai" and not OPENAI_API_KEY and EMERGENT_LLM_KEY
@@ -600,23 +1786,21 @@ async def get_pattern_insights(user_id: str = Depends(get_current_user), model:
         return {"insights": []}
     
     try:
-        # Get recent pattern history
-        patterns = await db.patterns.find(
-            {"user_id": user_id},
+        # Read the last two weeks of daily rollups instead of scanning raw events
+        await activity.flush(user_id)
+        daily = await db.pattern_rollups.find(
+            {"user_id": user_id, "bucket": "day"},
             {"_id": 0}
-        ).sort("timestamp", -1).limit(50).to_list(50)
+        ).sort("start", -1).limit(14).to_list(14)
         
-        if len(patterns) < 5:
+        summary = merge_rollups(daily)
+        if summary["total"] < 5:
             return {"insights": []}
         
-        # Build pattern context
-        pattern_context = []
-        for p in patterns[:20]:
-            pattern_context.append(f"{p.get('frequency')} frequency → {p.get('action')} action")
-            if p.get('text'):
-                pattern_context.append(f"  \"{p.get('text')[:50]}...\"")
-        
-        pattern_summary = "\n".join(pattern_context)
+        pattern_summary = describe_rollups(daily, summary)
+        rhythm = describe_features(await load_rhythm_features(user_id))
+        if rhythm:
+            pattern_summary += "\n" + rhythm
         
         system_message = """You notice creative rhythms and patterns. Speak in affective, embodied language.
 
@@ -630,58 +1814,271 @@ Be specific but poetic. Grounded but warm. Notice tempo, texture, emotional arc.
 
         prompt = f"Recent creative activity:\n{pattern_summary}\n\nWhat rhythms emerge? Describe the felt quality of their pattern. 2-3 sentences, warm and specific."
         
-        # Call AI based on preference
-        if use_hermes:
-            client = AsyncOpenAI(
-                api_key=NOUS_API_KEY,
-                base_url=NOUS_API_BASE
-            )
-            
-            response = await client.chat.completions.create(
-                model="Hermes-4-70B",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                top_p=0.95,
-                max_tokens=200
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-        elif use_openai_direct:
-            client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=200
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-        elif use_emergent:
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"pattern_{user_id}",
-                system_message=system_message
-            ).with_model("openai", "gpt-4o")
-            
-            user_message = UserMessage(text=prompt)
-            ai_response = await chat.send_message(user_message)
+        # Call AI based on preference - insights are background work
+        provider = "hermes" if use_hermes else "openai" if use_openai_direct else "emergent"
+        async with llm_scheduler.slot(provider, user_id, priority=BACKGROUND):
+            if use_hermes:
+                client = providers.openai_client(NOUS_API_KEY, NOUS_API_BASE)
+                
+                response = await client.chat.completions.create(
+                    model="Hermes-4-70B",
+                    messages=[
+                        {"role": "system", "content": system_message},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    top_p=0.95,
+                    max_tokens=200
+                )
+                
+                ai_response = response.choices[0].message.content
+                
+            elif use_openai_direct:
+                client = providers.openai_client(OPENAI_API_KEY)
+                
+                response = await client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": system_message},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=200
+                )
+                
+                ai_response = response.choices[0].message.content
+                
+            elif use_emergent:
+                LlmChat, UserMessage = providers.emergent_chat()
+                chat = LlmChat(
+                    api_key=EMERGENT_LLM_KEY,
+                    session_id=f"pattern_{user_id}",
+                    system_message=system_message
+                ).with_model("openai", "gpt-4o")
+                
+                user_message = UserMessage(text=prompt)
+                ai_response = await chat.send_message(user_message)
         
         return {"insights": [ai_response]}
+    except LLMOverloaded:
+        raise
     except Exception as e:
         logging.error(f"Pattern insight error: {str(e)}")
         return {"insights": []}
 
+# ==================== Workspace Bootstrap ====================
+
+async def bootstrap_insights(user_id: str, model: str) -> Dict[str, Any]:
+    # Never generate on the first-paint path - queue it and let the client pick it up from /patterns/insights
+    cached = await read_cached_insights(user_id, model)
+    if cached is not None:
+        return cached
+    return {"insights": None, "job_id": await queue_insights_job(user_id, model)}
+
+async def stream_sections(sections: Dict[str, Any], rev: Optional[int] = None) -> AsyncIterator[bytes]:
+    """One NDJSON line per section, in the order they finish - the sync cursor, when given, goes first"""
+    if rev is not None:
+        yield json.dumps({"section": "rev", "data": rev}).encode() + b"\n"
+    tasks = {asyncio.ensure_future(coro): name for name, coro in sections.items()}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                line = {"section": tasks[task]}
+                if task.exception() is not None:
+                    logging.error(f"Bootstrap section {tasks[task]} failed: {task.exception()}")
+                    line["error"] = str(task.exception()) or type(task.exception()).__name__
+                else:
+                    line["data"] = task.result()
+                yield json.dumps(line, default=str).encode() + b"\n"
+    finally:
+        # Client went away mid-stream
+        for task in pending:
+            task.cancel()
+
+@api_router.get("/workspace/bootstrap")
+async def workspace_bootstrap(frequency: str = "reflect", model: str = "hermes", stream: bool = False,
+                              user_id: str = Depends(get_current_user)):
+    """Everything the workspace paints first, in one round trip: nodes, artifacts, archive summaries and cached insights.
+    The reads run concurrently; stream=true sends each section as an NDJSON line as soon as it is ready."""
+    # Cursor for /sync once these listings are on screen. Read before them, so a write that
+    # lands mid-bootstrap is either in the listings or still ahead of the cursor - never skipped
+    rev = await revisions.sync_cursor(user_id)
+    sections = {
+        "nodes": load_frequency_nodes(user_id, frequency),
+        "artifacts": load_conversation_artifacts(user_id, frequency),
+        "archives": load_archive_summaries(user_id),
+        "insights": bootstrap_insights(user_id, model),
+    }
+    if stream:
+        return StreamingResponse(stream_sections(sections, rev=rev), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*sections.values(), return_exceptions=True)
+    payload = {"frequency": frequency, "rev": rev, "errors": {}}
+    for name, result in zip(sections, results):
+        if isinstance(result, Exception):
+            logging.error(f"Bootstrap section {name} failed: {result}")
+            payload[name] = None
+            payload["errors"][name] = str(result) or type(result).__name__
+        else:
+            payload[name] = result
+    return payload
+
+# ==================== Export / Import ====================
+
+@api_router.get("/export")
+async def export_user_workspace(compression: str = "gzip", user_id: str = Depends(get_current_user)):
+    """Stream the whole workspace as compressed NDJSON"""
+    if compression not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"compression must be one of {', '.join(MEDIA_TYPES)}")
+    try:
+        compressor(compression)  # fail fast (before streaming) if zstd isn't installed
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"flowtion-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}{EXTENSIONS[compression]}"
+    return StreamingResponse(
+        export_workspace(db, user_id, compression),
+        media_type=MEDIA_TYPES[compression],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.post("/import")
+async def import_user_workspace(request: Request, user_id: str = Depends(get_current_user)):
+    """Import an export (gzip, zstd or plain NDJSON) into this workspace with fresh ids"""
+    # Every imported document shares one revision, held in flight until the import ends
+    rev = await revisions.next_rev(user_id)
+    started = time.monotonic()
+    try:
+        result = await import_workspace(db, user_id, request.stream(), rev=rev)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if time.monotonic() - started > revisions.write_lease:
+            # The lease ran out mid-import, so clients may have synced past rev - restamp what landed
+            async with revisions.writing(user_id) as committed:
+                for collection in SYNCED_COLLECTIONS:
+                    await db[collection].update_many({"user_id": user_id, "rev": rev}, {"$set": {"rev": committed}})
+        await revisions.release(user_id, rev)
+        # Even a partial import has written documents - rebuild everything derived from them
+        workspace_cache.invalidate(user_id)
+        canvas_layouts.invalidate(user_id)
+        graph_index.invalidate(user_id)
+        search_index.invalidate(user_id)
+        await sync_workspace(user_id, "nodes")
+        await sync_workspace(user_id, "artifacts")
+        await revisions.bump(user_id, "archives")
+    
+    # Link counts came from the exporting workspace - recount off the request path
+    if result["imported"]["nodes"]:
+        result["recount_job_id"] = await job_runner.enqueue("graph.recount", {"user_id": user_id}, user_id=user_id, dedupe_key=user_id)
+    return result
+
+# ==================== Background Jobs ====================
+
+async def run_insights_refresh(payload: Dict[str, Any]) -> Dict[str, Any]:
+    result = await refresh_pattern_insights(payload["user_id"], payload.get("model", "hermes"))
+    return {"insights": len(result.get("insights", []))}
+
+async def run_activity_backfill(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return await activity.backfill()
+
+async def run_graph_recount(payload: Dict[str, Any]) -> Dict[str, Any]:
+    user_id = payload["user_id"]
+    async with revisions.writing(user_id) as rev:
+        count = await graph_index.recount(user_id, rev)
+    workspace_cache.invalidate(user_id, "nodes")
+    await sync_workspace(user_id, "nodes")
+    return {"nodes": count}
+
+job_runner.register("insights.refresh", run_insights_refresh, concurrency=2, max_attempts=4, timeout=120, backoff=30)
+job_runner.register("graph.recount", run_graph_recount, concurrency=1, max_attempts=5, timeout=600)
+job_runner.register("activity.backfill", run_activity_backfill, concurrency=1, max_attempts=3, timeout=3600, backoff=60)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(get_current_user)):
+    """Status of one of the user's background jobs"""
+    job = await job_runner.get(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# ==================== Health ====================
+
+@api_router.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+async def shared_cache_health() -> Dict[str, Any]:
+    health = {"shared": shared_cache.shared, "invalidations_sent": invalidation_bus.sent, "invalidations_received": invalidation_bus.received}
+    try:
+        health["reachable"] = await asyncio.wait_for(shared_cache.ping(), 1.0)
+    except Exception as e:
+        health["reachable"] = False
+        health["error"] = str(e) or type(e).__name__
+    return health
+
+async def job_health() -> Dict[str, Any]:
+    try:
+        return await asyncio.wait_for(job_runner.stats(), 2.0)
+    except Exception as e:
+        return {"error": str(e) or type(e).__name__}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """Ready only once warmed up and Mongo answers - reports pool and cache stats"""
+    mongo = {"pool": pool_monitor.stats(), "max_pool_size": mongo_options["maxPoolSize"], "min_pool_size": mongo_options["minPoolSize"]}
+    try:
+        mongo["ping_ms"] = round(await asyncio.wait_for(ping(db), 2.0), 2)
+        reachable = True
+    except Exception as e:
+        mongo["error"] = str(e) or type(e).__name__
+        reachable = False
+    
+    # A worker whose warm-up failed retries it once Mongo is back - ready only if it now succeeds
+    if reachable and not readiness["ready"] and readiness["error"] and not warm_up_lock.locked():
+        async with warm_up_lock:
+            await warm_up_worker(attempts=1)
+    
+    ready = readiness["ready"] and reachable
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "warmed_at": readiness["warmed_at"],
+            "warm_up_ms": readiness["warm_up_ms"],
+            "warmed_users": readiness["warmed_users"],
+            "mongo": mongo,
+            "workspace_cache": workspace_cache.stats(),
+            "shared_cache": await shared_cache_health(),
+            "jobs": await job_health() if reachable else None,
+            "llm": llm_scheduler.stats(),
+            "compression": compression_budget.stats(),
+            "streams": turn_streams.stats(),
+            "artifacts": artifact_stats.stats(),
+            "routing": model_router.stats()
+        }
+    )
+
 app.include_router(api_router)
 
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Listings are repetitive JSON - compress responses, backing off when it costs too much CPU
+compression_budget = CpuBudget(budget=float(os.getenv('COMPRESSION_CPU_BUDGET', '0.25')))
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv('COMPRESSION_MIN_BYTES', '1024')),
+    budget=compression_budget
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -696,6 +2093,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WARM_CACHE_USERS = int(os.getenv('WARM_CACHE_USERS', '50'))
+warm_up_lock = asyncio.Lock()
+
+async def warm_workspace_caches(limit: int) -> int:
+    """Load the listings recently active users had open, so their first request after a deploy is a cache hit"""
+    users = await activity.recent_users(limit) if limit > 0 else []
+    for state in users:
+        await load_frequency_nodes(state["user_id"], state["last_frequency"])
+        await load_conversation_artifacts(state["user_id"], state["last_frequency"])
+    return len(users)
+
+async def warm_up_worker(attempts: int = 5):
+    """Open the minimum pool, build indexes and warm the caches - the worker is ready only once this succeeds"""
+    started = datetime.now(timezone.utc)
+    try:
+        await warm_up(db, mongo_options["minPoolSize"], attempts=attempts)
+        await activity.ensure_indexes()
+        await version_history.ensure_indexes()
+        await job_runner.ensure_indexes()
+        await turn_streams.ensure_indexes()
+        await converse_results.ensure_indexes()
+        # Events from before rollups existed - folded in once, by whichever worker gets the job
+        if not await activity.backfilled():
+            await job_runner.enqueue("activity.backfill", {}, dedupe_key="rollups")
+    except Exception as e:
+        readiness.update({"ready": False, "error": str(e) or type(e).__name__})
+        logger.error(f"Warm-up failed, staying unready: {e}")
+        return
+    try:
+        readiness["warmed_users"] = await asyncio.wait_for(warm_workspace_caches(WARM_CACHE_USERS), 10.0)
+    except Exception as e:
+        # Cold caches only cost latency - not a reason to stay out of rotation
+        logger.warning(f"Cache warm-up incomplete: {e!r}")
+    readiness.update({
+        "ready": True,
+        "warmed_at": datetime.now(timezone.utc).isoformat(),
+        "warm_up_ms": round((datetime.now(timezone.utc) - started).total_seconds() * 1000, 1),
+        "error": None
+    })
+
+@app.on_event("startup")
+async def start_background_workers():
+    await warm_up_worker()
+    activity.start()
+    job_runner.start()
+    await invalidation_bus.start(apply_remote_invalidation)
+    
+    # Provider SDKs are imported lazily; warm the configured ones off the event loop
+    configured = [name for name, key in (("hermes", NOUS_API_KEY), ("openai", OPENAI_API_KEY), ("emergent", EMERGENT_LLM_KEY)) if key]
+    asyncio.get_running_loop().run_in_executor(None, providers.preload, configured)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_runner.stop()
+    await activity.stop()
+    await shared_cache.close()
     client.close()
\ No newline at end of file
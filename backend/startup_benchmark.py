@@ -0,0 +1,104 @@
+"""Import-time profile of the backend with a startup budget.
+
+Runs `python -X importtime -c "import server"` in a fresh interpreter,
+prints the heaviest imports and fails (exit 1) when importing the app goes
+over budget or pulls in a provider SDK eagerly.
+
+    cd backend && python startup_benchmark.py [--budget-ms 800] [--runs 3] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+# Must only ever be imported lazily by providers.py
+EAGER_FORBIDDEN = ("openai", "emergentintegrations", "litellm", "boto3", "botocore", "google.genai", "google.generativeai")
+
+
+def _env():
+    env = dict(os.environ)
+    # AsyncIOMotorClient doesn't connect on construction, so a placeholder URL is enough
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "startup_benchmark")
+    return env
+
+
+def profile_imports():
+    """Parse -X importtime output into (module, self_us, cumulative_us, depth) rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("importing server failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def wall_time_ms():
+    """Wall-clock time to start an interpreter and import the app"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import server"], cwd=BACKEND_DIR, env=_env(), check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "800")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = profile_imports()
+
+    # importtime prints children before their parent, so server's direct
+    # imports are the depth-1 rows just before the top-level "server" row
+    direct, pending = [], []
+    for row in rows:
+        if row[3] == 1:
+            pending.append(row)
+        elif row[3] == 0:
+            if row[0] == "server":
+                direct = pending + [row]
+            pending = []
+    server_ms = direct[-1][2] / 1000 if direct else 0.0
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module (direct imports of server)")
+    for name, self_us, cumulative_us, _ in sorted(direct[:-1], key=lambda r: -r[2])[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    print(f"\nimport server (importtime): {server_ms:.1f} ms")
+
+    walls = [wall_time_ms() for _ in range(max(1, args.runs))]
+    wall_ms = statistics.median(walls)
+    print(f"interpreter + import server (median of {len(walls)}): {wall_ms:.1f} ms, budget {args.budget_ms:.0f} ms")
+
+    loaded = {r[0] for r in rows}
+    eager = sorted(m for m in loaded if any(m == f or m.startswith(f + ".") for f in EAGER_FORBIDDEN))
+
+    failed = False
+    if eager:
+        print(f"FAIL: provider SDKs imported eagerly: {', '.join(eager[:10])}")
+        failed = True
+    if wall_ms > args.budget_ms:
+        print(f"FAIL: startup {wall_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
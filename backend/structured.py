@@ -0,0 +1,196 @@
+"""Structured-output artifacts: the model calls a create_artifact tool instead of
+writing ARTIFACT[...] markers into its reply.
+
+Tool-call arguments arrive in fragments when streaming. ToolCallDecoder scans
+each fragment once, tracking string / escape state and brace depth, and
+parses a call the moment its top-level JSON object closes. Nothing is
+re-parsed per fragment. Decoded calls are validated against ArtifactSpec and
+rejects are counted, so both protocols can be compared on useful artifacts
+per completion token (ArtifactStats).
+"""
+import json
+import logging
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+TEXT, TOOLS = "text", "tools"
+
+ARTIFACT_TYPES = ["text_bubble", "lightbulb", "diagram", "table", "image", "shape", "custom"]
+
+ARTIFACT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "create_artifact",
+        "description": "Place a visual artifact on the user's canvas. Call once per artifact.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string", "enum": ARTIFACT_TYPES},
+                "content": {
+                    "type": "object",
+                    "description": "text_bubble/lightbulb: {text}; diagram: {nodes, links}; table: {columns, rows}; image: {url, caption}",
+                },
+                "style": {
+                    "type": "object",
+                    "description": "Colors, gradients, shapes, sizes - e.g. {color, gradient, glow, shape, rounded}",
+                },
+            },
+            "required": ["type", "content"],
+        },
+    },
+}
+
+
+class ArtifactSpec(BaseModel):
+    type: Literal["text_bubble", "lightbulb", "diagram", "table", "image", "shape", "custom"]
+    content: Dict[str, Any]
+    style: Dict[str, Any] = {}
+
+
+def validate_artifact(arguments: Any) -> Optional[Dict[str, Any]]:
+    """A create_artifact payload as a plain spec dict, or None if it doesn't fit the schema"""
+    try:
+        return ArtifactSpec.model_validate(arguments).model_dump()
+    except ValidationError as e:
+        logger.warning(f"Dropped invalid artifact tool call: {e.errors()[:2]}")
+        return None
+
+
+class _ObjectScanner:
+    """Tells when a JSON object streamed in pieces is complete, scanning each character once"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, fragment: str) -> bool:
+        self.parts.append(fragment)
+        if self.complete:
+            return True
+        for ch in fragment:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]":
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    self.complete = True
+                    break
+        return self.complete
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class ToolCallDecoder:
+    """Accumulates streamed tool_call deltas; hands back each call as soon as its arguments are whole"""
+
+    def __init__(self, tool_name: str = "create_artifact"):
+        self.tool_name = tool_name
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self.decoded: List[Dict[str, Any]] = []
+        self.rejected = 0
+
+    def _finish(self, call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        call["done"] = True
+        if call["name"] != self.tool_name:
+            return None
+        try:
+            arguments = json.loads(call["scanner"].text())
+        except ValueError:
+            self.rejected += 1
+            logger.warning("Dropped artifact tool call with malformed JSON arguments")
+            return None
+        spec = validate_artifact(arguments)
+        if spec is None:
+            self.rejected += 1
+            return None
+        self.decoded.append(spec)
+        return spec
+
+    def feed(self, tool_calls) -> List[Dict[str, Any]]:
+        """Feed one chunk's delta.tool_calls; returns the specs completed by it"""
+        completed = []
+        for delta in tool_calls or []:
+            call = self._calls.setdefault(delta.index, {"name": "", "scanner": _ObjectScanner(), "done": False})
+            function = getattr(delta, "function", None)
+            if function is None or call["done"]:
+                continue
+            if function.name:
+                call["name"] += function.name
+            if function.arguments and call["scanner"].feed(function.arguments):
+                spec = self._finish(call)
+                if spec is not None:
+                    completed.append(spec)
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """End of stream: anything left open is truncated (e.g. max_tokens hit mid-call)"""
+        completed = []
+        for call in self._calls.values():
+            if not call["done"]:
+                spec = self._finish(call)
+                if spec is not None:
+                    completed.append(spec)
+        return completed
+
+
+def decode_tool_calls(tool_calls) -> Dict[str, Any]:
+    """Non-streaming response: message.tool_calls -> {"artifacts": [...], "rejected": n}"""
+    artifacts, rejected = [], 0
+    for call in tool_calls or []:
+        if call.function.name != "create_artifact":
+            continue
+        try:
+            spec = validate_artifact(json.loads(call.function.arguments or "{}"))
+        except ValueError:
+            spec = None
+        if spec is None:
+            rejected += 1
+        else:
+            artifacts.append(spec)
+    return {"artifacts": artifacts, "rejected": rejected}
+
+
+class ArtifactStats:
+    """Per protocol: artifacts kept vs dropped and the completion tokens spent producing them"""
+
+    def __init__(self):
+        self.modes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, mode: str, kept: int, dropped: int, completion_tokens: Optional[int] = None):
+        stats = self.modes.setdefault(mode, {"turns": 0, "kept": 0, "dropped": 0, "completion_tokens": 0, "metered_kept": 0})
+        stats["turns"] += 1
+        stats["kept"] += kept
+        stats["dropped"] += dropped
+        if completion_tokens is not None:
+            # Only turns that report usage count towards tokens per artifact
+            stats["completion_tokens"] += completion_tokens
+            stats["metered_kept"] += kept
+
+    def stats(self) -> Dict[str, Any]:
+        report = {}
+        for mode, s in self.modes.items():
+            attempted = s["kept"] + s["dropped"]
+            report[mode] = {
+                **s,
+                "drop_rate": round(s["dropped"] / attempted, 3) if attempted else None,
+                "tokens_per_artifact": round(s["completion_tokens"] / s["metered_kept"], 1) if s["metered_kept"] else None,
+            }
+        return report
@@ -0,0 +1,160 @@
+"""Streamed assistant replies, persisted as coalesced chunks in db.message_chunks.
+
+A streaming turn buffers the provider's deltas and writes them out as one
+chunk every `flush_interval` seconds or `flush_chars` characters, whichever
+comes first (the same coalescing streamGPTReply does in flowtion-service.ts).
+A timer flushes buffered text even when the provider goes quiet mid-reply.
+Chunks carry a per-turn sequence number and clients receive exactly the
+persisted chunks. After a dropped connection a client resumes from the last
+seq it saw, and the reply is never regenerated.
+
+Followers on the worker that is generating are woken on each flush. Followers
+on another worker poll Mongo until the turn leaves the "streaming" status.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STREAMING = "streaming"
+
+
+class LiveTurn:
+    """In-process view of a turn being generated on this worker"""
+
+    def __init__(self):
+        self.chunks: List[Dict[str, Any]] = []
+        self.done = False
+        self._event = asyncio.Event()
+
+    def notify(self):
+        # Swap the event so each waiter is woken exactly once per change
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    @property
+    def event(self) -> asyncio.Event:
+        return self._event
+
+
+class ChunkWriter:
+    def __init__(self, collection, turn_id: str, live: LiveTurn, flush_interval: float, flush_chars: int):
+        self.collection = collection
+        self.turn_id = turn_id
+        self.live = live
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.seq = 0
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._timer: Optional[asyncio.Task] = None
+        # Timer and write-path flushes must not interleave, or seqs could be stored out of order
+        self._lock = asyncio.Lock()
+
+    async def write(self, text: str):
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.flush_chars or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(max(0.0, self._last_flush + self.flush_interval - time.monotonic()))
+        # Cleared before flushing so flush() doesn't cancel the task it is running in
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Timed flush of turn {self.turn_id} failed: {e}")
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            chunk = {"turn_id": self.turn_id, "seq": self.seq, "text": "".join(self._buffer)}
+            self._buffer, self._buffered = [], 0
+            await self.collection.insert_one({**chunk, "created_at": datetime.now(timezone.utc)})
+            self.seq += 1
+            self.live.chunks.append(chunk)
+            self.live.notify()
+
+
+class TurnStreams:
+    def __init__(self, db, flush_interval: float = 0.18, flush_chars: int = 512, poll_interval: float = 0.25,
+                 stale_after: float = 120.0, retain_seconds: float = 24 * 3600, linger: float = 60.0):
+        self.chunks = db.message_chunks
+        self.turns = db.conversations
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retain_seconds = retain_seconds
+        self.linger = linger
+        self._live: Dict[str, LiveTurn] = {}
+
+    async def ensure_indexes(self):
+        await self.chunks.create_index([("turn_id", 1), ("seq", 1)], unique=True)
+        # Finished turns keep their full text on the turn itself - chunks only matter while resuming
+        await self.chunks.create_index("created_at", expireAfterSeconds=int(self.retain_seconds))
+
+    def writer(self, turn_id: str) -> ChunkWriter:
+        live = self._live[turn_id] = LiveTurn()
+        return ChunkWriter(self.chunks, turn_id, live, self.flush_interval, self.flush_chars)
+
+    def finish(self, turn_id: str):
+        """Generation is over (the turn's final status is already stored)"""
+        live = self._live.get(turn_id)
+        if live is None:
+            return
+        live.done = True
+        live.notify()
+        # Keep it a little longer for followers that reconnect right away
+        asyncio.get_running_loop().call_later(self.linger, self._live.pop, turn_id, None)
+
+    async def follow(self, turn_id: str, after_seq: int = -1) -> AsyncIterator[Dict[str, Any]]:
+        """Chunks with seq > after_seq, live, until the turn stops streaming"""
+        after_seq = max(after_seq, -1)
+        live = self._live.get(turn_id)
+        if live is not None:
+            while True:
+                event = live.event
+                for chunk in live.chunks[after_seq + 1:]:
+                    yield chunk
+                    after_seq = chunk["seq"]
+                if live.done:
+                    return
+                await event.wait()
+
+        last_progress = time.monotonic()
+        while True:
+            # Status first: once it reads done, every chunk is already stored
+            turn = await self.turns.find_one({"id": turn_id}, {"_id": 0, "status": 1})
+            chunks = await self.chunks.find(
+                {"turn_id": turn_id, "seq": {"$gt": after_seq}}, {"_id": 0, "turn_id": 1, "seq": 1, "text": 1}
+            ).sort("seq", 1).to_list(None)
+            for chunk in chunks:
+                yield chunk
+                after_seq = chunk["seq"]
+            if turn is None or turn.get("status") != STREAMING:
+                return
+            now = time.monotonic()
+            if chunks:
+                last_progress = now
+            elif now - last_progress > self.stale_after:
+                logger.warning(f"Turn {turn_id} stopped streaming without finishing")
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"live_turns": sum(1 for t in self._live.values() if not t.done)}
@@ -0,0 +1,18 @@
+"""Viewport helpers. The spatial index itself is layout.CanvasLayout, shared with artifact placement."""
+import math
+from typing import Any, Dict, List, Tuple
+
+from layout import artifact_rect
+
+
+def tile_counts(artifacts: List[Dict[str, Any]], tile: float) -> List[Dict[str, Any]]:
+    """Level-of-detail summary: how many artifact centres fall in each tile"""
+    counts: Dict[Tuple[int, int], int] = {}
+    for artifact in artifacts:
+        x, y, w, h = artifact_rect(artifact)
+        cell = (math.floor((x + w / 2) / tile), math.floor((y + h / 2) / tile))
+        counts[cell] = counts.get(cell, 0) + 1
+    return [
+        {"x": cx * tile, "y": cy * tile, "width": tile, "height": tile, "count": count}
+        for (cx, cy), count in sorted(counts.items())
+    ]
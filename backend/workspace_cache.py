@@ -0,0 +1,206 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+CacheKey = Tuple[str, str, str]  # (user_id, kind, scope)
+Generation = Tuple[int, int, int]  # write stamps of (user_id,), (user_id, kind) and the full key
+
+
+class WorkspaceCache:
+    """In-process LRU cache of per-user node/artifact listings.
+
+    Entries are keyed by (user_id, kind, scope) where kind is "nodes" or
+    "artifacts" and scope is the frequency / conversation id. Eviction is by
+    total serialized bytes; every entry also expires after ttl seconds.
+    Cached lists are treated as immutable - writes swap in a new list.
+    Keys are also indexed per user so invalidating one user's listings
+    never scans anyone else's.
+
+    Every write stamps the keys it touches with a new generation. A load
+    reads generation() before querying Mongo and passes it to set(), which
+    drops the list if a write landed in between - otherwise a read that
+    started before the write could cache the old listing for the whole TTL.
+
+    An entry can also carry the ETag it was loaded under. get() with a tag
+    treats an entry loaded under another one as a miss, so a listing served
+    under a newer ETag never comes from a copy a peer worker's write made
+    stale before its invalidation arrived here.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0, max_generations: int = 100000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_generations = max_generations
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[CacheKey]] = {}
+        self._bytes = 0
+        # Last write stamp per key prefix, oldest first. Keys evicted from here read as the
+        # highest stamp evicted so far - never equal to a snapshot taken before their last write
+        self._generations: "OrderedDict[tuple, int]" = OrderedDict()
+        self._writes = 0
+        self._generation_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_fills = 0
+
+    @staticmethod
+    def _size_of(docs: List[Dict[str, Any]]) -> int:
+        return len(json.dumps(docs, default=str))
+
+    def _drop(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry["size"]
+            keys = self._by_user.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[key[0]]
+
+    def _user_keys(self, user_id: str, kind: Optional[str] = None) -> List[CacheKey]:
+        return [k for k in self._by_user.get(user_id, ()) if kind is None or k[1] == kind]
+
+    def get(self, user_id: str, kind: str, scope: str, tag: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        key = (user_id, kind, scope)
+        entry = self._entries.get(key)
+        if entry is None or (tag is not None and entry["tag"] != tag):
+            self.misses += 1
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["docs"]
+
+    def peek(self, user_id: str, kind: str, scope: str) -> Optional[List[Dict[str, Any]]]:
+        """Like get, but without touching LRU order or hit stats"""
+        entry = self._entries.get((user_id, kind, scope))
+        if entry is None or entry["expires_at"] < time.monotonic():
+            return None
+        return entry["docs"]
+
+    def generation(self, user_id: str, kind: str, scope: str) -> Generation:
+        """Snapshot to pass to set() when filling this key from a read"""
+        return tuple(
+            self._generations.get(prefix, self._generation_floor)
+            for prefix in ((user_id,), (user_id, kind), (user_id, kind, scope))
+        )
+
+    def _bump(self, *prefix: str) -> None:
+        self._writes += 1
+        self._generations.pop(prefix, None)
+        self._generations[prefix] = self._writes
+        while len(self._generations) > self.max_generations:
+            _, self._generation_floor = self._generations.popitem(last=False)
+
+    def set(self, user_id: str, kind: str, scope: str, docs: List[Dict[str, Any]],
+            generation: Optional[Generation] = None, tag: Optional[str] = None) -> None:
+        """Cache a listing. With generation (taken before the read) this is a fill and is skipped
+        if the key was written since; without it, it's a write and stamps the key.
+        tag is the ETag the listing was read under, if any."""
+        if generation is None:
+            self._bump(user_id, kind, scope)
+        elif generation != self.generation(user_id, kind, scope):
+            self.stale_fills += 1
+            return
+        self._store((user_id, kind, scope), docs, tag)
+
+    def _store(self, key: CacheKey, docs: List[Dict[str, Any]], tag: Optional[str] = None) -> None:
+        self._drop(key)
+        size = self._size_of(docs)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = {
+            "docs": list(docs),
+            "size": size,
+            "tag": tag,
+            "expires_at": time.monotonic() + self.ttl,
+        }
+        self._by_user.setdefault(key[0], set()).add(key)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _replace(self, key: CacheKey, docs: List[Dict[str, Any]]) -> None:
+        """Swap in new docs for an existing entry, keeping its TTL - not its tag, which the docs have moved past"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        expires_at = entry["expires_at"]
+        self._store(key, docs)
+        if key in self._entries:
+            self._entries[key]["expires_at"] = expires_at
+
+    def upsert(self, user_id: str, kind: str, scope: str, doc: Dict[str, Any]) -> None:
+        """Write-through a single doc into a cached listing (no-op if not cached)"""
+        key = (user_id, kind, scope)
+        self._bump(*key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        docs = [d for d in entry["docs"] if d.get("id") != doc.get("id")]
+        docs.append(doc)
+        self._replace(key, docs)
+
+    def discard(self, user_id: str, kind: str, doc_id: str) -> None:
+        """Remove a doc from every cached listing of this kind for the user"""
+        self._bump(user_id, kind)
+        for key in self._user_keys(user_id, kind):
+            docs = self._entries[key]["docs"]
+            if any(d.get("id") == doc_id for d in docs):
+                self._replace(key, [d for d in docs if d.get("id") != doc_id])
+
+    def invalidate(self, user_id: str, kind: Optional[str] = None, scope: Optional[str] = None) -> None:
+        if kind is None:
+            self._bump(user_id)
+        elif scope is None:
+            self._bump(user_id, kind)
+        else:
+            self._bump(user_id, kind, scope)
+        for key in self._user_keys(user_id, kind):
+            if scope is not None and key[2] != scope:
+                continue
+            self._drop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_fills": self.stale_fills,
+        }
+
+
+class TTLCache:
+    """Small key -> value map with per-entry expiry, capped at max_entries (oldest evicted)"""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Any) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Any) -> Optional[Any]:
+        value = self.get(key)
+        self._entries.pop(key, None)
+        return value
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Send, Sparkles } from 'lucide-react';
 import { toast } from 'sonner';
 
@@ -10,6 +10,7 @@ export default function ConversationalInput({ frequency, onStructureCreated, axi
   const [processing, setProcessing] = useState(false);
   const [suggestion, setSuggestion] = useState('');
   const [modelPreference, setModelPreference] = useState('hermes'); // hermes or openai
+  const lastPreparedAt = useRef(0);
 
   useEffect(() => {
     // Context-aware placeholder suggestions
@@ -22,6 +23,19 @@ export default function ConversationalInput({ frequency, onStructureCreated, axi
     setSuggestion(suggestions[frequency] || "Speak and it builds...");
   }, [frequency]);
 
+  // First keystroke: let the server snapshot context and warm the model connection before submit
+  const handleChange = (e) => {
+    const value = e.target.value;
+    if (!input && value && Date.now() - lastPreparedAt.current > 20000) {
+      lastPreparedAt.current = Date.now();
+      axiosInstance.post(`${API}/converse/prepare`, {
+        current_frequency: frequency,
+        model_preference: modelPreference
+      }).catch(() => {});
+    }
+    setInput(value);
+  };
+
   const handleSubmit = async (e) => {
     e?.preventDefault();
     if (!input.trim() || processing) return;
@@ -31,10 +45,13 @@ export default function ConversationalInput({ frequency, onStructureCreated, axi
     setInput('');
 
     try {
+      // One key per submit - retries of this request are answered from the server's stored result
       const response = await axiosInstance.post(`${API}/converse`, {
         text: userInput,
         current_frequency: frequency,
         model_preference: modelPreference
+      }, {
+        headers: { 'Idempotency-Key': crypto.randomUUID() }
       });
 
       // Pass full response data to parent including user input and model
@@ -102,7 +119,7 @@ export default function ConversationalInput({ frequency, onStructureCreated, axi
             <input
               type="text"
               value={input}
-              onChange={(e) => setInput(e.target.value)}
+              onChange={handleChange}
               onKeyDown={handleKeyDown}
               placeholder={suggestion}
               disabled={processing}
@@ -35,10 +35,55 @@ export default function Workspace({ onLogout }) {
   const [hoveredArtifact, setHoveredArtifact] = useState(null);
 
   useEffect(() => {
-    loadArtifacts();
-    loadInsights();
+    loadWorkspace();
   }, [frequency]);
 
+  // Tell the server when the user goes quiet - it precomputes insights in the background
+  useEffect(() => {
+    const IDLE_SECONDS = 60;
+    let idleTimer;
+    const resetIdle = () => {
+      clearTimeout(idleTimer);
+      idleTimer = setTimeout(() => {
+        axiosInstance.post(`${API}/activity/idle`, { idle_seconds: IDLE_SECONDS, model: 'hermes' })
+          .catch(() => {});
+      }, IDLE_SECONDS * 1000);
+    };
+
+    window.addEventListener('mousemove', resetIdle);
+    window.addEventListener('keydown', resetIdle);
+    resetIdle();
+
+    return () => {
+      window.removeEventListener('mousemove', resetIdle);
+      window.removeEventListener('keydown', resetIdle);
+      clearTimeout(idleTimer);
+    };
+  }, []);
+
+  // One round trip for first paint - artifacts and any precomputed insights together
+  const loadWorkspace = async () => {
+    try {
+      const response = await axiosInstance.get(`${API}/workspace/bootstrap?frequency=${frequency}&model=hermes`);
+      const { artifacts: loaded, insights: cached, errors } = response.data;
+      if (errors?.artifacts) {
+        await loadArtifacts();
+      } else {
+        setArtifacts(loaded || []);
+        setLoading(false);
+      }
+      if (cached?.insights) {
+        setInsights(cached.insights);
+      } else {
+        loadInsights();
+      }
+    } catch (error) {
+      console.error('Failed to bootstrap workspace', error);
+      loadArtifacts();
+      loadInsights();
+    }
+  };
+
   const loadInsights = async () => {
     try {
       const response = await axiosInstance.get(`${API}/patterns/insights?model=hermes`);
@@ -61,9 +106,10 @@ export default function Workspace({ onLogout }) {
   };
 
   const handleStructureCreated = (data, userInput, model) => {
-    // Add new artifacts to canvas
-    if (data.artifacts && data.artifacts.length > 0) {
-      setArtifacts([...artifacts, ...data.artifacts]);
+    // Add new artifacts to canvas, dropping any the server merged away
+    const archivedIds = new Set(data.archived_artifact_ids || []);
+    if (archivedIds.size > 0 || data.artifacts?.length > 0) {
+      setArtifacts([...artifacts.filter(a => !archivedIds.has(a.id)), ...(data.artifacts || [])]);
     }
     
     // Add to conversation history
@@ -0,0 +1,35 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# Backend modules import each other as top-level modules (uvicorn runs from backend/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture(scope="session")
+def server():
+    """The FastAPI app module running against an in-memory Mongo (mongomock-motor)"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import motor.motor_asyncio
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "flowtion_test")
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    import server as server_module
+    return server_module
+
+
+@pytest.fixture
+def api(server):
+    """TestClient signed in as a fresh user; client.user_id is that user's id"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        response = client.post("/api/auth/register", json={
+            "email": f"{uuid.uuid4().hex[:12]}@flowtion.app", "name": "Test", "password": "pw"
+        })
+        client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+        client.user_id = response.json()["user"]["id"]
+        yield client
@@ -0,0 +1,28 @@
+import asyncio
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+
+def authenticate(server, token):
+    return asyncio.run(server.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)))
+
+
+def test_token_cache_evicts_least_recently_used(server, monkeypatch):
+    monkeypatch.setattr(server, "TOKEN_CACHE_SIZE", 2)
+    server._token_cache.clear()
+    a, b, c = (server.create_token(user) for user in ("a", "b", "c"))
+    authenticate(server, a)
+    authenticate(server, b)
+    # A hit makes "a" the most recent, so "b" goes when "c" arrives
+    assert authenticate(server, a) == "a"
+    authenticate(server, c)
+    assert list(server._token_cache) == [a, c]
+
+
+def test_expired_cache_entry_is_dropped_and_token_reverified(server):
+    server._token_cache.clear()
+    token = server.create_token("a")
+    authenticate(server, token)
+    server._token_cache[token] = ("a", 0)
+    assert authenticate(server, token) == "a"
+    assert server._token_cache[token][1] > 0
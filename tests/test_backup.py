@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from backup import FORMAT, ImportFormatError, export_workspace, import_workspace
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def fresh_db():
+    return mongomock_motor.AsyncMongoMockClient().backup_test
+
+
+async def stream(records, chunk=7):
+    raw = b"".join(json.dumps(r).encode() + b"\n" for r in records)
+    for i in range(0, len(raw), chunk):
+        yield raw[i:i + chunk]
+
+
+def export_of(*docs):
+    return [{"format": FORMAT, "version": 1}] + [{"collection": c, "doc": d} for c, d in docs]
+
+
+async def links_by_title(db, user_id):
+    nodes = await db.nodes.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+    ids = {n["id"]: n["title"] for n in nodes}
+    return {n["title"]: sorted(ids.get(i, "?") for i in n["linked_ids"]) for n in nodes}
+
+
+def test_links_outside_the_export_are_dropped_forward_links_kept():
+    async def scenario():
+        db = fresh_db()
+        result = await import_workspace(db, "u2", stream(export_of(
+            ("nodes", {"id": "a", "title": "A", "linked_ids": ["ghost", "b"]}),
+            ("nodes", {"id": "b", "title": "B", "linked_ids": ["a", "later"]}),
+            ("archived_sessions", {"id": "s", "nodes": [{"id": "later", "title": "L"}]}),
+            ("nodes", {"id": "c", "title": "C", "linked_ids": ["d", "gone"]}),
+            ("nodes", {"id": "d", "title": "D", "linked_ids": ["c"]}),
+        )), batch_size=2)
+        assert result["dropped_links"] == 2
+        assert result["imported"]["nodes"] == 4
+        links = await links_by_title(db, "u2")
+        assert links["A"] == ["B"]
+        assert links["C"] == ["D"] and links["D"] == ["C"]
+        # The archived node comes back on restore, so B keeps its link to it
+        assert len(links["B"]) == 2 and "A" in links["B"]
+
+    asyncio.run(scenario())
+
+
+def test_export_import_round_trip_remaps_every_reference():
+    async def scenario():
+        db = fresh_db()
+        await db.nodes.insert_many([
+            {"id": "a", "user_id": "u1", "title": "A", "linked_ids": ["b"], "rev": 5},
+            {"id": "b", "user_id": "u1", "title": "B", "linked_ids": ["a"], "parent_id": "a"},
+        ])
+        await db.artifacts.insert_one({"id": "x", "user_id": "u1", "merged_from": ["y"], "content": {}})
+        chunks = [chunk async for chunk in export_workspace(db, "u1", compression="gzip")]
+
+        async def replay():
+            for chunk in chunks:
+                yield chunk
+
+        result = await import_workspace(db, "u2", replay(), rev=9)
+        assert result["imported"]["nodes"] == 2 and result["dropped_links"] == 0
+        imported = {n["title"]: n for n in await db.nodes.find({"user_id": "u2"}, {"_id": 0}).to_list(None)}
+        assert imported["A"]["linked_ids"] == [imported["B"]["id"]]
+        assert imported["B"]["parent_id"] == imported["A"]["id"] != "a"
+        assert imported["A"]["rev"] == 9
+
+    asyncio.run(scenario())
+
+
+def test_import_rejects_a_foreign_header():
+    async def scenario():
+        with pytest.raises(ImportFormatError):
+            await import_workspace(fresh_db(), "u", stream([{"format": "other"}]))
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import gzip
+
+import pytest
+
+from compression import FAST, NORMAL, Codec, GzipCodec, available_codecs
+
+
+def test_codec_base_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        Codec("none", 1, 1)
+
+
+def test_codec_subclass_must_implement_stream():
+    class OneShot(Codec):
+        def compress(self, data, mode):
+            return data
+
+    with pytest.raises(TypeError):
+        OneShot("one", 1, 1)
+
+
+@pytest.mark.parametrize("mode", [NORMAL, FAST])
+def test_gzip_round_trips_one_shot_and_streamed(mode):
+    codec = GzipCodec()
+    body = b'{"text": "hello"}\n' * 500
+    assert gzip.decompress(codec.compress(body, mode)) == body
+    stream = codec.stream(mode)
+    parts = [stream.chunk(body[i:i + 1000]) for i in range(0, len(body), 1000)]
+    assert gzip.decompress(b"".join(parts) + stream.finish()) == body
+
+
+def test_gzip_is_always_available():
+    assert isinstance(available_codecs()["gzip"], GzipCodec)
@@ -0,0 +1,170 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from events import ActivityRecorder, fold_events, nest_counts
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def fresh_db():
+    """Fixed collection objects, so a test can swap one of their methods"""
+    db = mongomock_motor.AsyncMongoMockClient().activity_test
+    return SimpleNamespace(patterns=db.patterns, pattern_rollups=db.pattern_rollups)
+
+
+async def rollup(db, user_id, bucket="day"):
+    return await db.pattern_rollups.find({"user_id": user_id, "bucket": bucket}, {"_id": 0}).to_list(None)
+
+
+def test_fold_events_counts_buckets_and_transitions():
+    incs = defaultdict(lambda: defaultdict(int))
+    last = {}
+    fold_events([
+        {"user_id": "u", "frequency": "focus", "action": "converse", "timestamp": "2026-01-01T10:05:00+00:00"},
+        {"user_id": "u", "frequency": "dream.x", "action": "converse", "timestamp": "2026-01-01T11:00:00+00:00"},
+        {"user_id": "u", "frequency": "focus", "action": "x", "timestamp": "not a time"},
+    ], last, incs)
+    day = nest_counts(incs[("u", "day", "2026-01-01T00:00:00+00:00")])
+    assert day["total"] == 2
+    assert day["frequencies"] == {"focus": 1, "dream_x": 1}
+    assert day["transitions"] == {"focus": {"dream_x": 1}}
+    assert last == {"u": "dream_x"}
+    assert len([k for k in incs if k[1] == "hour"]) == 2
+
+
+def test_only_failed_inserts_are_requeued():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db)
+        await recorder.ensure_indexes()
+        for i in range(3):
+            recorder.record("u1", "focus", "converse")
+        insert_many = db.patterns.insert_many
+
+        async def partly_failing(docs, ordered=True):
+            await insert_many([d for i, d in enumerate(docs) if i != 1], ordered=ordered)
+            raise BulkWriteError({"writeErrors": [{"index": 1, "code": 91, "errmsg": "shutting down"}]})
+
+        db.patterns.insert_many = partly_failing
+        assert await recorder.flush() == 2
+        assert len(recorder._buffer) == 1
+        db.patterns.insert_many = insert_many
+        assert await recorder.flush() == 1
+        assert await db.patterns.count_documents({}) == 3
+        assert (await rollup(db, "u1"))[0]["total"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_flushing_one_user_leaves_other_users_events_buffered():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db)
+        await recorder.ensure_indexes()
+        recorder.record("u1", "focus", "converse")
+        recorder.record("u2", "dream", "converse")
+        recorder.record("u1", "dream", "converse")
+        assert await recorder.flush("u3") == 0
+        assert await recorder.flush("u1") == 2
+        assert [e["user_id"] for e in recorder._buffer] == ["u2"]
+        assert await db.patterns.count_documents({"user_id": "u2"}) == 0
+        assert (await rollup(db, "u1"))[0]["total"] == 2
+        assert await recorder.flush() == 1
+        assert recorder._buffer == []
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_ids_from_an_earlier_attempt_are_not_requeued():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db)
+        await recorder.ensure_indexes()
+        recorder.record("u1", "focus", "converse")
+        recorder.record("u1", "focus", "converse")
+        await db.patterns.insert_one(dict(recorder._buffer[0]))
+        await recorder.flush()
+        assert recorder._buffer == []
+        assert await db.patterns.count_documents({}) == 2
+
+    asyncio.run(scenario())
+
+
+def test_failed_rollup_writes_are_retried_on_the_next_flush():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db)
+        await recorder.ensure_indexes()
+        bulk_write = db.pattern_rollups.bulk_write
+        failures = [RuntimeError("primary stepped down")]
+
+        async def flaky(ops, ordered=True):
+            if failures:
+                raise failures.pop()
+            return await bulk_write(ops, ordered=ordered)
+
+        db.pattern_rollups.bulk_write = flaky
+        recorder.record("u1", "focus", "converse")
+        await recorder.flush()
+        assert await rollup(db, "u1") == []
+        # Nothing new buffered - the retry still runs
+        await recorder.flush()
+        assert (await rollup(db, "u1"))[0]["total"] == 1
+        recorder.record("u1", "dream", "converse")
+        await recorder.flush()
+        day = (await rollup(db, "u1"))[0]
+        assert day["total"] == 2 and day["transitions"] == {"focus": {"dream": 1}}
+
+    asyncio.run(scenario())
+
+
+def test_last_frequency_cache_is_bounded_and_reloads_from_state():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db, max_users=2)
+        await recorder.ensure_indexes()
+        for user_id in ("u1", "u2", "u3"):
+            recorder.record(user_id, "focus", "converse")
+            await recorder.flush()
+        assert list(recorder._last_frequency) == ["u2", "u3"]
+        recorder.record("u1", "dream", "converse")
+        await recorder.flush()
+        assert (await rollup(db, "u1"))[0]["transitions"] == {"focus": {"dream": 1}}
+        assert len(recorder._last_frequency) == 2
+
+    asyncio.run(scenario())
+
+
+def test_backfill_rebuilds_closed_days_from_raw_events_once():
+    async def scenario():
+        db = fresh_db()
+        recorder = ActivityRecorder(db)
+        await recorder.ensure_indexes()
+        two_days_ago = datetime.now(timezone.utc) - timedelta(days=2)
+        await db.patterns.insert_many([
+            {"user_id": "u1", "frequency": "focus", "action": "converse", "timestamp": two_days_ago.isoformat()},
+            {"user_id": "u1", "frequency": "dream", "action": "converse",
+             "timestamp": (two_days_ago + timedelta(seconds=1)).isoformat()},
+            # Older writers stored real datetimes
+            {"user_id": "u2", "frequency": "focus", "action": "archive", "timestamp": two_days_ago.replace(tzinfo=None)},
+        ])
+        recorder.record("u1", "focus", "converse")
+        await recorder.flush()
+        assert not await recorder.backfilled()
+
+        totals = await recorder.backfill()
+        assert totals == {"events": 3, "rollups": 4, "users": 2}
+        assert await recorder.backfilled()
+        await recorder.backfill()
+
+        days = sorted(await rollup(db, "u1"), key=lambda r: r["start"])
+        assert [d["total"] for d in days] == [2, 1]
+        assert days[0]["transitions"] == {"focus": {"dream": 1}}
+        assert (await rollup(db, "u2"))[0]["actions"] == {"archive": 1}
+
+    asyncio.run(scenario())
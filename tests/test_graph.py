@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from graph import GraphIndex, UserGraph
+
+
+def graph_of(*nodes):
+    graph = UserGraph()
+    for node in nodes:
+        graph.set_node(node)
+    return graph
+
+
+def node(node_id, *links, **extra):
+    return {"id": node_id, "linked_ids": list(links), **extra}
+
+
+def test_links_are_undirected_and_counted_once():
+    graph = graph_of(node("a", "b"), node("b", "a", "c"), node("c"))
+    assert graph.neighbours("a") == ["b"]
+    assert graph.neighbours("b") == ["a", "c"]
+    assert graph.degree("b") == 2
+    assert graph.degree("c") == 1
+
+
+def test_unlinking_one_side_keeps_edge_while_the_other_side_links_back():
+    graph = graph_of(node("a", "b"), node("b", "a"))
+    affected = graph.set_node(node("a"))
+    assert affected == {"a", "b"}
+    assert graph.degree("a") == 1
+
+    graph.set_node(node("b"))
+    assert graph.degree("a") == 0
+    assert graph.degree("b") == 0
+
+
+def test_self_links_and_empty_ids_are_ignored():
+    graph = graph_of(node("a", "a", "", None))
+    assert graph.degree("a") == 0
+
+
+def test_remove_node_drops_edges_on_both_ends():
+    graph = graph_of(node("a", "b", "c"), node("b"), node("c", "b"))
+    assert sorted(graph.remove_node("a")) == ["b", "c"]
+    assert graph.neighbours("b") == ["c"]
+    assert graph.shortest_path("a", "b") is None
+
+
+def test_remove_node_missing_from_the_graph_reports_nodes_still_linking_to_it():
+    # Built after the node was gone: its inbound links are only waiting
+    graph = graph_of(node("a", "gone"), node("b", "gone", "a"))
+    assert sorted(graph.remove_node("gone")) == ["a", "b"]
+    assert graph.dangling() == {}
+    assert graph.neighbours("a") == ["b"]
+
+
+def test_expand_respects_depth_and_limit():
+    chain = graph_of(*(node(str(i), str(i + 1)) for i in range(6)), node("6"))
+    assert chain.expand("0", depth=2, limit=100) == {"0": 0, "1": 1, "2": 2}
+    assert len(chain.expand("0", depth=10, limit=3)) == 3
+    assert chain.expand("missing", depth=2, limit=10) == {}
+
+
+def test_shortest_path_is_shortest_and_ordered_from_source():
+    #   a - b - c - d
+    #    \_______/
+    graph = graph_of(node("a", "b", "x"), node("b", "c"), node("c", "d"), node("x", "c"), node("d"))
+    path = graph.shortest_path("a", "d")
+    assert path[0] == "a" and path[-1] == "d"
+    assert len(path) == 4
+    assert graph.shortest_path("d", "a")[0] == "d"
+    assert graph.shortest_path("a", "a") == ["a"]
+
+
+def test_shortest_path_gives_up_past_max_depth():
+    chain = graph_of(*(node(str(i), str(i + 1)) for i in range(10)), node("10"))
+    assert chain.shortest_path("0", "10", max_depth=3) is None
+    assert chain.shortest_path("0", "10") == [str(i) for i in range(11)]
+
+
+def test_components_largest_first_with_min_size():
+    graph = graph_of(node("a", "b"), node("b", "c"), node("c"), node("x", "y"), node("y"), node("solo"))
+    assert graph.components() == [["a", "b", "c"], ["x", "y"], ["solo"]]
+    assert graph.components(min_size=2) == [["a", "b", "c"], ["x", "y"]]
+
+
+def test_lineage_follows_parents_merges_and_children():
+    graph = graph_of(
+        node("root"),
+        node("mid", parent_id="root"),
+        node("leaf", parent_id="mid", merged_from=["m1"]),
+        node("m1", merged_from=["m0"]),
+        node("m0"),
+        node("other", parent_id="leaf"),
+    )
+    lineage = graph.lineage("leaf")
+    assert lineage == {"ancestors": ["mid", "root"], "merged_from": ["m1", "m0"], "children": ["other"]}
+
+
+def test_lineage_survives_parent_cycles():
+    graph = graph_of(node("a", parent_id="b"), node("b", parent_id="a"))
+    assert graph.lineage("a")["ancestors"] == ["b"]
+
+
+def test_links_to_missing_nodes_are_ignored_until_the_node_appears():
+    graph = graph_of(node("a", "ghost", "b"), node("b"))
+    assert graph.degree("a") == 1
+    assert graph.degree("ghost") == 0
+    assert graph.components() == [["a", "b"]]
+    assert graph.dangling() == {"a": ["ghost"]}
+
+    assert graph.set_node(node("ghost")) == {"ghost", "a"}
+    assert graph.degree("a") == 2 and graph.dangling() == {}
+
+
+def test_unlinking_or_removing_a_node_stops_waiting_on_its_targets():
+    graph = graph_of(node("a", "ghost"), node("b", "ghost"))
+    graph.set_node(node("a"))
+    graph.remove_node("b")
+    assert graph.waiting == {}
+    graph.set_node(node("ghost"))
+    assert graph.degree("ghost") == 0
+
+
+def test_recount_prunes_dangling_links():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().graph_test
+        await db.nodes.insert_many([
+            {"id": "g-a", "user_id": "graph-user", "linked_ids": ["ghost", "g-b"]},
+            {"id": "g-b", "user_id": "graph-user", "linked_ids": []},
+        ])
+        index = GraphIndex(db)
+        assert await index.recount("graph-user", rev=7) == 2
+        docs = {n["id"]: n for n in await db.nodes.find({"user_id": "graph-user"}, {"_id": 0}).to_list(None)}
+        assert docs["g-a"]["linked_ids"] == ["g-b"]
+        assert docs["g-a"]["link_count"] == 1 and docs["g-b"]["link_count"] == 1
+        assert (await index.get("graph-user")).dangling() == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+def test_failed_warm_up_is_rerun_before_reporting_ready(api, server, monkeypatch):
+    assert api.get("/api/health/ready").status_code == 200
+    real_warm_up = server.warm_up
+    built = []
+    real_ensure = server.activity.ensure_indexes
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("Indexes not created on nodes")
+
+    async def ensure_indexes():
+        built.append(1)
+        await real_ensure()
+
+    monkeypatch.setattr(server.activity, "ensure_indexes", ensure_indexes)
+    monkeypatch.setattr(server, "warm_up", broken)
+    server.readiness.update({"ready": False, "error": "Mongo unreachable during warm-up"})
+
+    # Mongo answers pings, but index creation still fails - stay out of rotation
+    response = api.get("/api/health/ready")
+    assert response.status_code == 503
+    assert server.readiness["error"] == "Indexes not created on nodes"
+    assert built == []
+
+    monkeypatch.setattr(server, "warm_up", real_warm_up)
+    response = api.get("/api/health/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+    assert built == [1]
+
+
+def test_warm_up_loads_recently_active_users_listings(api, server):
+    api.portal.call(server.db.nodes.insert_one, {"id": "n1", "user_id": api.user_id, "title": "warm", "frequency": "focus"})
+    server.activity.record(api.user_id, "focus", "converse")
+    api.portal.call(server.activity.flush)
+    server.workspace_cache.invalidate(api.user_id)
+
+    assert api.portal.call(server.warm_workspace_caches, 1000) >= 1
+    cached = server.workspace_cache.get(api.user_id, "nodes", "focus")
+    assert [n["title"] for n in cached] == ["warm"]
+    assert server.workspace_cache.get(api.user_id, "artifacts", "focus") == []
@@ -0,0 +1,117 @@
+import asyncio
+import copy
+
+import pytest
+
+from history import VersionHistory, apply_patch, diff
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def fresh_db():
+    return mongomock_motor.AsyncMongoMockClient().history_test
+
+
+@pytest.mark.parametrize("old,new", [
+    ({"a": 1, "b": {"c": 2, "d": [1, 2]}}, {"a": 1, "b": {"c": 3, "d": [1, 2, 3]}, "e": None}),
+    ({"gone": 1, "nested": {"x": {"y": 1}}}, {"nested": {"x": {}}}),
+    ({"a/b": 1, "t~n": {"k": 1}}, {"a/b": 2, "t~n": {"k": 2, "~1": 0}}),
+    ({"type": "text"}, {"type": "table", "content": {"rows": [[1, 2]]}}),
+])
+def test_diff_then_patch_round_trips(old, new):
+    ops = diff(old, new)
+    assert apply_patch(copy.deepcopy(old), ops) == new
+    assert diff(new, new) == []
+
+
+def test_lists_are_replaced_whole_and_values_copied():
+    old, new = {"tags": ["a", "b"]}, {"tags": ["b"]}
+    ops = diff(old, new)
+    assert ops == [{"op": "replace", "path": "/tags", "value": ["b"]}]
+    patched = apply_patch(copy.deepcopy(old), ops)
+    patched["tags"].append("c")
+    assert ops[0]["value"] == ["b"]
+
+
+def test_root_replace_when_types_differ():
+    assert apply_patch({"a": 1}, diff({"a": 1}, [1])) == [1]
+
+
+def versions_of(count):
+    return [{"id": "n1", "title": f"v{i}", "body": {"text": "x" * 200, "i": i}, "updated_at": f"2026-01-01T00:00:{i:02d}"}
+            for i in range(count)]
+
+
+def test_every_version_replays_across_snapshots():
+    async def scenario():
+        history = VersionHistory(fresh_db(), snapshot_every=4)
+        await history.ensure_indexes()
+        docs = versions_of(11)
+        for before, after in zip(docs, docs[1:]):
+            await history.record("node", "u1", before, after)
+
+        cold = VersionHistory(history.collection.database, snapshot_every=4)
+        for i, doc in enumerate(docs):
+            assert await cold.get_version("node", "u1", "n1", i) == doc
+        assert await cold.get_version("node", "other-user", "n1", 3) is None
+
+        listing = await history.list_versions("node", "u1", "n1", limit=20)
+        assert listing["total_versions"] == 11
+        snapshots = [v["version"] for v in listing["versions"] if v["snapshot"]]
+        assert sorted(snapshots) == [0, 4, 8]
+        assert listing["storage"]["ratio"] < 0.8
+        assert listing["versions"][0]["changed"] == ["body", "title", "updated_at"]
+
+    asyncio.run(scenario())
+
+
+def test_as_of_and_unchanged_writes():
+    async def scenario():
+        history = VersionHistory(fresh_db())
+        docs = versions_of(3)
+        assert await history.record("node", "u1", docs[0], docs[1]) == 1
+        assert await history.record("node", "u1", docs[1], docs[1]) == 1
+        assert await history.record("node", "u1", docs[1], docs[2]) == 2
+        assert (await history.as_of("node", "u1", "n1", "2026-01-01T00:00:01.5"))["title"] == "v1"
+        assert await history.as_of("node", "u1", "n1", "2025-12-31") is None
+
+    asyncio.run(scenario())
+
+
+def test_second_worker_with_a_stale_head_appends_after_the_latest():
+    async def scenario():
+        db = fresh_db()
+        a, b = VersionHistory(db), VersionHistory(db)
+        await a.ensure_indexes()
+        docs = versions_of(4)
+        await a.record("node", "u1", docs[0], docs[1])
+        await b.record("node", "u1", docs[1], docs[2])
+        # a still caches version 1 as the head - the insert conflicts, a reloads and appends v3
+        assert await a.record("node", "u1", docs[2], docs[3]) == 3
+        assert await b.get_version("node", "u1", "n1", 3) == docs[3]
+        assert await b.get_version("node", "u1", "n1", 2) == docs[2]
+
+    asyncio.run(scenario())
+
+
+def test_version_past_the_head_is_not_found():
+    async def scenario():
+        history = VersionHistory(fresh_db())
+        docs = versions_of(3)
+        for before, after in zip(docs, docs[1:]):
+            await history.record("node", "u1", before, after)
+        assert await history.get_version("node", "u1", "n1", 2) == docs[2]
+        assert await history.get_version("node", "u1", "n1", 3) is None
+        assert await history.get_version("node", "u1", "n1", 999) is None
+        assert await history.get_version("node", "u1", "n1", -1) is None
+
+    asyncio.run(scenario())
+
+
+def test_node_version_endpoint_404s_past_the_head(api, server):
+    node = {"id": "hist-n1", "user_id": api.user_id, "title": "v0", "frequency": "focus"}
+    api.portal.call(server.db.nodes.insert_one, node)
+    assert api.patch("/api/nodes/hist-n1", json={"title": "v1"}).status_code == 200
+
+    assert api.get("/api/nodes/hist-n1/versions/1").json()["title"] == "v1"
+    assert api.get("/api/nodes/hist-n1/versions/999").status_code == 404
@@ -0,0 +1,182 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def workers(count=2, **options):
+    """Stores in separate 'processes' sharing one Mongo collection"""
+    collection = mongomock_motor.AsyncMongoMockClient().test.idempotency_keys
+    options.setdefault("poll_interval", 0.01)
+    return [IdempotencyStore(collection, **options) for _ in range(count)]
+
+
+def counted(result):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        return result
+
+    return fn, calls
+
+
+def test_retry_on_another_worker_replays_the_stored_result():
+    async def scenario():
+        a, b = workers()
+        await a.ensure_indexes()
+        fn, calls = counted({"message": "hi"})
+        assert await a.run("u1:k", "fp", fn) == ({"message": "hi"}, False)
+        assert await b.run("u1:k", "fp", fn) == ({"message": "hi"}, True)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_retry_waits_for_the_worker_running_it():
+    async def scenario():
+        a, b = workers()
+        await a.ensure_indexes()
+        release = asyncio.Event()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await release.wait()
+            return {"n": 1}
+
+        first = asyncio.create_task(a.run("u1:k", "fp", slow))
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(b.run("u1:k", "fp", slow))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        release.set()
+        assert await first == ({"n": 1}, False)
+        assert await second == ({"n": 1}, True)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_different_body_under_the_same_key_conflicts_across_workers():
+    async def scenario():
+        a, b = workers()
+        await a.ensure_indexes()
+        fn, _ = counted({"ok": True})
+        await a.run("u1:k", "fp1", fn)
+        with pytest.raises(IdempotencyConflict):
+            await b.run("u1:k", "fp2", fn)
+
+    asyncio.run(scenario())
+
+
+def test_failed_call_frees_the_key_for_a_retry():
+    async def scenario():
+        a, b = workers()
+        await a.ensure_indexes()
+
+        async def boom():
+            raise RuntimeError("upstream down")
+
+        with pytest.raises(RuntimeError):
+            await a.run("u1:k", "fp", boom)
+        fn, calls = counted({"ok": True})
+        assert await b.run("u1:k", "fp", fn) == ({"ok": True}, False)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_claim_of_a_dead_worker_is_taken_over_after_its_lease():
+    async def scenario():
+        (b,) = workers(count=1)
+        await b.ensure_indexes()
+        now = datetime.now(timezone.utc)
+        # Claimed by a worker that died mid-call
+        await b.collection.insert_one({"key": "u1:k", "fingerprint": "fp", "state": "pending",
+                                       "lease_until": now + timedelta(seconds=0.05),
+                                       "expires_at": now + timedelta(seconds=600)})
+        fn, calls = counted({"ok": True})
+        assert await asyncio.wait_for(b.run("u1:k", "fp", fn), 1.0) == ({"ok": True}, False)
+        assert len(calls) == 1
+        assert (await b.collection.find_one({"key": "u1:k"}))["state"] == "done"
+
+    asyncio.run(scenario())
+
+
+def test_expired_results_are_not_replayed():
+    async def scenario():
+        a, b = workers(ttl=0.01)
+        await a.ensure_indexes()
+        fn, calls = counted({"ok": True})
+        await a.run("u1:k", "fp", fn)
+        await asyncio.sleep(0.02)
+        assert await b.run("u1:k", "fp", fn) == ({"ok": True}, False)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_without_a_collection_results_stay_in_process():
+    async def scenario():
+        store = IdempotencyStore()
+        await store.ensure_indexes()
+        fn, calls = counted({"ok": True})
+        await store.run("k", "fp", fn)
+        assert await store.run("k", "fp", fn) == ({"ok": True}, True)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_lease_is_renewed_while_a_slow_call_runs():
+    async def scenario():
+        a, b = workers(lease_seconds=0.15)
+        await a.ensure_indexes()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.6)
+            return {"n": 1}
+
+        first = asyncio.create_task(a.run("u1:k", "fp", slow))
+        await asyncio.sleep(0.02)
+        # Well past the original lease - the key must still belong to the first worker
+        second = asyncio.create_task(b.run("u1:k", "fp", slow))
+        assert await first == ({"n": 1}, False)
+        assert await second == ({"n": 1}, True)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_worker_that_lost_its_claim_leaves_the_new_one_alone():
+    async def scenario():
+        (a,) = workers(count=1)
+        await a.ensure_indexes()
+
+        def taken_over(outcome):
+            async def fn():
+                # Another worker took the key over after this one's lease lapsed
+                await a.collection.update_one({"key": "u1:k"}, {"$set": {"owner": "peer"}})
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return outcome
+            return fn
+
+        with pytest.raises(RuntimeError):
+            await a.run("u1:k", "fp", taken_over(RuntimeError("upstream down")))
+        claim = await a.collection.find_one({"key": "u1:k"})
+        assert (claim["state"], claim["owner"]) == ("pending", "peer")
+
+        await a.collection.delete_many({})
+        await a.run("u1:k", "fp", taken_over({"ok": True}))
+        claim = await a.collection.find_one({"key": "u1:k"})
+        assert (claim["state"], claim["owner"]) == ("pending", "peer")
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture
+def insights(api, server, monkeypatch):
+    """Records queued refresh jobs instead of running them; generating an insight fails the test"""
+    queued = []
+
+    async def queue_insights_job(user_id, model):
+        queued.append((user_id, model))
+        return f"job-{len(queued)}"
+
+    async def compute_pattern_insights(user_id, model):
+        raise AssertionError("insights were generated on a read")
+
+    monkeypatch.setattr(server, "queue_insights_job", queue_insights_job)
+    monkeypatch.setattr(server, "compute_pattern_insights", compute_pattern_insights)
+    return queued
+
+
+def store_insights(api, server, fingerprint, computed_at=None):
+    api.portal.call(server.db.insights.insert_one, {
+        "user_id": api.user_id, "model": "hermes", "insights": ["you drift toward dream at night"],
+        "fingerprint": fingerprint,
+        "computed_at": (computed_at or datetime.now(timezone.utc)).isoformat(),
+    })
+
+
+def current_fingerprint(api, server):
+    return api.portal.call(server.current_pattern_fingerprint, api.user_id)
+
+
+def test_short_idle_does_not_precompute(api, server, insights):
+    response = api.post("/api/activity/idle", json={"idle_seconds": server.IDLE_PRECOMPUTE_SECONDS - 1})
+    assert response.json() == {"queued": False, "reason": "not idle long enough"}
+    assert insights == []
+
+
+def test_idle_precompute_is_queued_without_stored_insights(api, server, insights):
+    response = api.post("/api/activity/idle", json={"idle_seconds": server.IDLE_PRECOMPUTE_SECONDS})
+    assert response.json() == {"queued": True, "job_id": "job-1"}
+    assert insights == [(api.user_id, "hermes")]
+
+
+def test_idle_precompute_skips_current_and_recent_insights(api, server, insights):
+    server.activity.record(api.user_id, "focus", "converse")
+    store_insights(api, server, current_fingerprint(api, server))
+    idle = {"idle_seconds": server.IDLE_PRECOMPUTE_SECONDS}
+    assert api.post("/api/activity/idle", json=idle).json() == {"queued": False, "reason": "insights are current"}
+
+    # The pattern moved on, but the stored insights are younger than INSIGHTS_MIN_INTERVAL
+    server.activity.record(api.user_id, "dream", "converse")
+    assert api.post("/api/activity/idle", json=idle).json() == {"queued": False, "reason": "refreshed recently"}
+    assert insights == []
+
+
+def test_idle_precompute_refreshes_stale_insights(api, server, insights):
+    computed_at = datetime.now(timezone.utc) - timedelta(seconds=server.INSIGHTS_MIN_INTERVAL + 1)
+    store_insights(api, server, "an older pattern", computed_at)
+    response = api.post("/api/activity/idle", json={"idle_seconds": server.IDLE_PRECOMPUTE_SECONDS})
+    assert response.json()["queued"] is True
+    assert insights == [(api.user_id, "hermes")]
+
+
+def test_stored_insights_are_served_and_requeued_when_the_pattern_moved_on(api, server, insights):
+    store_insights(api, server, "an older pattern")
+    first = api.get("/api/patterns/insights")
+    assert first.json() == {"insights": ["you drift toward dream at night"]}
+    assert insights == [(api.user_id, "hermes")]
+
+    # The next read comes from the shared cache - no fingerprint check, no second job
+    assert api.get("/api/patterns/insights").json() == first.json()
+    assert insights == [(api.user_id, "hermes")]
+
+
+def test_current_stored_insights_are_served_without_a_refresh(api, server, insights):
+    server.activity.record(api.user_id, "focus", "converse")
+    store_insights(api, server, current_fingerprint(api, server))
+    assert api.get("/api/patterns/insights").json() == {"insights": ["you drift toward dream at night"]}
+    assert insights == []
+
+
+def test_reading_insights_flushes_only_the_readers_pending_events(api, server, insights, monkeypatch):
+    flushed = []
+    real_flush = server.activity.flush
+
+    async def flush(user_id=None):
+        flushed.append(user_id)
+        return await real_flush(user_id)
+
+    monkeypatch.setattr(server.activity, "flush", flush)
+    server.activity.record(api.user_id, "focus", "converse")
+    store_insights(api, server, "an older pattern")
+    api.get("/api/patterns/insights")
+    assert api.user_id in flushed
+    assert api.portal.call(server.db.patterns.count_documents, {"user_id": api.user_id}) == 1
@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from jobs import RUNNING, JobRunner
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def runner(**options):
+    jobs = mongomock_motor.AsyncMongoMockClient().jobs_test.jobs
+    return JobRunner(SimpleNamespace(jobs=jobs), **options)
+
+
+def test_lease_keeper_survives_mongo_errors():
+    async def scenario():
+        jobs = runner(lease_seconds=0.3)
+        await jobs.collection.insert_one({"id": "j1", "worker": jobs.worker_id, "status": RUNNING})
+        update_one = jobs.collection.update_one
+        failures = [ConnectionError("primary stepped down")] * 2
+
+        async def flaky(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return await update_one(*args, **kwargs)
+
+        jobs.collection.update_one = flaky
+        keeper = asyncio.create_task(jobs._keep_lease("j1"))
+        await asyncio.sleep(0.25)
+        assert not keeper.done()
+        assert jobs.lease_errors == 2
+        assert (await jobs.collection.find_one({"id": "j1"})).get("lease_until") is not None
+        keeper.cancel()
+        await asyncio.gather(keeper, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_lease_keeper_stops_once_the_lease_is_lost():
+    async def scenario():
+        jobs = runner(lease_seconds=0.03)
+        await jobs.collection.insert_one({"id": "j1", "worker": "another-worker", "status": RUNNING})
+        await asyncio.wait_for(jobs._keep_lease("j1"), 1.0)
+
+    asyncio.run(scenario())
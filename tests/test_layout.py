@@ -0,0 +1,136 @@
+import layout
+from layout import CanvasLayout, CanvasLayouts, GridIndex, place_artifacts
+
+TURN = [{"type": "text_bubble"}] * 3
+
+
+def fill(canvas: CanvasLayout, count: int) -> None:
+    turn = 0
+    while len(canvas) < count:
+        place_artifacts(None, TURN, layout=canvas, keys=[f"a{turn}-{i}" for i in range(3)])
+        turn += 1
+
+
+def overlaps(rects):
+    index = GridIndex()
+    clashes = 0
+    for rect in rects:
+        clashes += bool(index.query(rect))
+        index.insert(rect)
+    return clashes
+
+
+def as_docs(canvas: CanvasLayout):
+    return [
+        {"id": key, "position": {"x": r[0], "y": r[1]}, "size": {"width": r[2], "height": r[3]}}
+        for key, r in ((key, canvas.index.rect_of(key)) for key in list(canvas.index._keys))
+    ]
+
+
+def test_grid_index_remove_and_reinsert_under_key():
+    index = GridIndex(cell_size=100)
+    index.insert((0, 0, 50, 50), "a", key="a")
+    index.insert((500, 500, 50, 50), "b", key="b")
+    assert index.query_items((0, 0, 60, 60)) == ["a"]
+
+    index.insert((400, 400, 50, 50), "a2", key="a")
+    assert index.query_items((0, 0, 60, 60)) == []
+    assert sorted(index.query_items((390, 390, 200, 200))) == ["a2", "b"]
+
+    assert index.remove("b") == (500, 500, 50, 50)
+    assert index.remove("b") is None
+    assert len(index) == 1
+
+
+def test_placements_never_overlap():
+    canvas = CanvasLayout()
+    fill(canvas, 600)
+    assert overlaps([canvas.index.rect_of(k) for k in canvas.index._keys]) == 0
+
+
+def test_place_artifacts_without_layout_matches_spiral_from_anchor():
+    existing = [{"id": "a", "position": {"x": 400, "y": 300}, "size": {"width": 200, "height": 100}}]
+    placed = place_artifacts(existing, TURN)
+    rects = [(400, 300, 200, 100)] + [
+        (p["position"]["x"], p["position"]["y"], p["size"]["width"], p["size"]["height"]) for p in placed
+    ]
+    assert overlaps(rects) == 0
+
+
+def test_warm_placement_cost_does_not_grow_with_canvas(monkeypatch):
+    probes = [0]
+    is_free = GridIndex.is_free
+
+    def counting(self, *args, **kwargs):
+        probes[0] += 1
+        return is_free(self, *args, **kwargs)
+
+    monkeypatch.setattr(GridIndex, "is_free", counting)
+
+    def probes_per_turn(size):
+        canvas = CanvasLayout()
+        fill(canvas, size)
+        probes[0] = 0
+        for turn in range(20):
+            place_artifacts(None, TURN, layout=canvas, keys=[f"t{turn}-{i}" for i in range(3)])
+        return probes[0] / 20
+
+    small, large = probes_per_turn(200), probes_per_turn(2000)
+    # Restarting the spiral at the anchor every turn costs probes in proportion to the canvas (~10x here)
+    assert large < 3 * small
+
+
+def test_cold_layout_starts_near_the_frontier():
+    warm = CanvasLayout()
+    fill(warm, 1000)
+    cold = CanvasLayout.from_artifacts(as_docs(warm))
+    assert cold.frontier[0] >= warm.frontier[0] - 12
+
+    placed = place_artifacts(None, TURN, layout=cold, keys=["n1", "n2", "n3"])
+    assert len(placed) == 3
+    assert overlaps([cold.index.rect_of(k) for k in cold.index._keys]) == 0
+
+
+def test_removed_artifact_frees_its_slot_for_the_next_turn():
+    canvas = CanvasLayout()
+    fill(canvas, 300)
+    first = canvas.index.rect_of("a0-0")
+    assert first[:2] == canvas.anchor
+
+    canvas.remove("a0-0")
+    assert canvas.frontier == (0, 0)
+    (placed,) = place_artifacts(None, TURN[:1], layout=canvas, keys=["again"])
+    assert (placed["position"]["x"], placed["position"]["y"]) == canvas.anchor
+
+
+def test_layouts_follow_write_through():
+    layouts = CanvasLayouts()
+    canvas = layouts.build("u1", "reflect", [
+        {"id": "a", "conversation_id": "reflect", "position": {"x": 400, "y": 300}},
+    ])
+    layouts.build("u2", "reflect", [])
+
+    layouts.artifact_changed("u1", {"id": "a", "conversation_id": "reflect", "archived": True})
+    assert canvas.index.rect_of("a") is None
+
+    layouts.artifact_changed("u1", {"id": "b", "conversation_id": "reflect", "position": {"x": 0, "y": 0}})
+    assert canvas.index.rect_of("b") is not None
+    assert len(layouts.get("u2", "reflect")) == 0
+
+    layouts.artifact_removed("u1", "b")
+    assert len(canvas) == 0
+
+    layouts.invalidate("u1")
+    assert layouts.get("u1", "reflect") is None
+    assert layouts.get("u2", "reflect") is not None
+
+
+def test_diagram_relaxation_keeps_rects_and_keys():
+    canvas = CanvasLayout()
+    fill(canvas, 90)
+    specs = [{"type": "diagram"}, {"type": "text_bubble"}, {"type": "lightbulb"}]
+    placed = place_artifacts(None, specs, layout=canvas, keys=["d", "t", "l"])
+    for key, p in zip(["d", "t", "l"], placed):
+        assert canvas.index.rect_of(key)[:2] == (p["position"]["x"], p["position"]["y"])
+    assert overlaps([canvas.index.rect_of(k) for k in canvas.index._keys]) == 0
+    assert layout.ring_offsets(1)[0] == (1, 0)
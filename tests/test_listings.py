@@ -0,0 +1,118 @@
+import uuid
+
+
+class SlowListing:
+    """Wraps db so the next artifact listing query runs `during` after reading, before it returns"""
+
+    def __init__(self, db, during):
+        self._db = db
+        self._during = during
+
+    def __getattr__(self, name):
+        collection = getattr(self._db, name)
+        if name != "artifacts" or self._during is None:
+            return collection
+        listing = self
+        real_find = collection.find
+
+        class Cursor:
+            def __init__(self, cursor):
+                self._cursor = cursor
+
+            async def to_list(self, length=None):
+                docs = await self._cursor.to_list(length)
+                during, listing._during = listing._during, None
+                await during()
+                return docs
+
+        class Collection:
+            def __getattr__(self, attr):
+                return getattr(collection, attr)
+
+            def find(self, *args, **kwargs):
+                cursor = real_find(*args, **kwargs)
+                return Cursor(cursor) if "conversation_id" in (args[0] if args else {}) else cursor
+
+        return Collection()
+
+    def __getitem__(self, name):
+        return self._db[name]
+
+
+def artifact(user_id, artifact_id, text):
+    return {"id": artifact_id, "user_id": user_id, "conversation_id": "reflect", "type": "text_bubble",
+            "content": {"text": text}, "style": {}, "position": {"x": 0, "y": 0}, "size": {"width": 200, "height": 100}}
+
+
+def test_listing_read_before_a_write_is_not_cached(api, server, monkeypatch):
+    api.portal.call(server.db.artifacts.insert_one, artifact(api.user_id, "a1", "old"))
+
+    async def write():
+        await server.update_artifact("a1", {"content": {"text": "new"}}, api.user_id)
+
+    monkeypatch.setattr(server, "db", SlowListing(server.db, write))
+    # This read started before the write, so it may answer with the old text - but must not cache it
+    api.get("/api/artifacts/reflect")
+    assert server.workspace_cache.peek(api.user_id, "artifacts", "reflect") is None
+
+    fresh = api.get("/api/artifacts/reflect")
+    assert [a["content"]["text"] for a in fresh.json()] == ["new"]
+    etag = fresh.headers["etag"]
+    again = api.get("/api/artifacts/reflect", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+
+def second_user(api):
+    response = api.post("/api/auth/register", json={
+        "email": f"{uuid.uuid4().hex[:12]}@flowtion.app", "name": "Other", "password": "pw"
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def test_unchanged_listing_revalidates_with_304(api, server):
+    api.portal.call(server.db.artifacts.insert_one, artifact(api.user_id, "rv-a1", "hello"))
+    first = api.get("/api/artifacts/reflect")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    again = api.get("/api/artifacts/reflect", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+
+def test_write_bumps_the_etag(api, server):
+    api.portal.call(server.db.artifacts.insert_one, artifact(api.user_id, "bump-a1", "old"))
+    etag = api.get("/api/artifacts/reflect").headers["etag"]
+    assert api.patch("/api/artifacts/bump-a1", json={"content": {"text": "new"}}).status_code == 200
+
+    changed = api.get("/api/artifacts/reflect", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert [a["content"]["text"] for a in changed.json()] == ["new"]
+
+
+def test_etags_are_not_shared_across_users(api, server):
+    mine = api.get("/api/artifacts/reflect")
+    other = second_user(api)
+    theirs = api.get("/api/artifacts/reflect", headers=other)
+    assert theirs.headers["etag"] != mine.headers["etag"]
+    cross = api.get("/api/artifacts/reflect", headers={**other, "If-None-Match": mine.headers["etag"]})
+    assert cross.status_code == 200
+
+
+def test_new_etag_is_never_served_with_a_peers_stale_copy(api, server):
+    api.portal.call(server.db.artifacts.insert_one, artifact(api.user_id, "peer-a1", "old"))
+    etag = api.get("/api/artifacts/reflect").headers["etag"]
+    assert server.workspace_cache.peek(api.user_id, "artifacts", "reflect") is not None
+
+    # Another worker writes and bumps the revision; its invalidation hasn't reached this one yet
+    api.portal.call(server.db.artifacts.update_one, {"id": "peer-a1"}, {"$set": {"content": {"text": "new"}}})
+    api.portal.call(server.revisions.bump, api.user_id, "artifacts", {"reflect"})
+
+    response = api.get("/api/artifacts/reflect", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [a["content"]["text"] for a in response.json()] == ["new"]
+    assert api.get("/api/artifacts/reflect", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import workspace_cache
+from workspace_cache import TTLCache
+
+
+@pytest.fixture
+def prompts(server, monkeypatch):
+    """A fresh prepared-prompt cache on a fake clock; every build renders a new, numbered prompt"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(workspace_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(server, "prepared_prompts", TTLCache(ttl=30))
+    monkeypatch.setattr(server, "choose_provider", lambda preference: "emergent")
+    builds = []
+
+    async def build_system_message(user_id, frequency, provider, artifact_mode=server.TEXT):
+        builds.append((user_id, frequency, provider, artifact_mode))
+        return f"prompt-{len(builds)}"
+
+    monkeypatch.setattr(server, "build_system_message", build_system_message)
+    return SimpleNamespace(clock=clock, builds=builds)
+
+
+def system_message(api, server, frequency="dream", provider="emergent", mode=None):
+    return api.portal.call(server.conversation_system_message, api.user_id, frequency, provider, mode or server.TEXT)
+
+
+def test_prepared_prompt_is_used_exactly_once(api, server, prompts):
+    response = api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    assert response.json() == {"prepared": True, "provider": "emergent", "expires_in": 30}
+    # A second keystroke reuses the pending prompt instead of rendering another
+    api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    assert len(prompts.builds) == 1
+
+    assert system_message(api, server) == "prompt-1"
+    assert system_message(api, server) == "prompt-2"
+    assert len(prompts.builds) == 2
+
+
+@pytest.mark.parametrize("frequency, provider, mode", [
+    ("focus", "emergent", None),
+    ("dream", "hermes", None),
+    ("dream", "emergent", "tools"),
+])
+def test_prepared_prompt_is_keyed_by_frequency_provider_and_mode(api, server, prompts, frequency, provider, mode):
+    api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    assert system_message(api, server, frequency, provider, mode) == "prompt-2"
+    # The miss left the prepared prompt for the turn it was made for
+    assert system_message(api, server) == "prompt-1"
+
+
+def test_prepared_prompt_is_not_shared_across_users(api, server, prompts):
+    api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    other = api.portal.call(server.conversation_system_message, f"other-{api.user_id}", "dream", "emergent", server.TEXT)
+    assert other == "prompt-2"
+    assert system_message(api, server) == "prompt-1"
+
+
+def test_prepared_prompt_expires_after_its_ttl(api, server, prompts):
+    api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    prompts.clock.now += server.prepared_prompts.ttl + 1
+    assert system_message(api, server) == "prompt-2"
+
+    api.post("/api/converse/prepare", json={"current_frequency": "dream"})
+    prompts.clock.now += server.prepared_prompts.ttl - 1
+    assert system_message(api, server) == "prompt-3"
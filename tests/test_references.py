@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from references import extract_references, find_merge_groups, merge_content, resolve_references
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.mark.parametrize("text,groups", [
+    ("Let's merge ARTIFACT_aaaa1111 with ARTIFACT_bbbb2222.", [["aaaa1111", "bbbb2222"]]),
+    ("I won't merge ARTIFACT_aaaa1111 with ARTIFACT_bbbb2222.", []),
+    ("I won’t merge ARTIFACT_aaaa1111 with ARTIFACT_bbbb2222.", []),
+    ("We should not combine ARTIFACT_aaaa1111 and ARTIFACT_bbbb2222.", []),
+    ("There's no need to fuse ARTIFACT_aaaa1111 and ARTIFACT_bbbb2222.", []),
+    ("Merge ARTIFACT_aaaa1111 with ARTIFACT_bbbb2222, not ARTIFACT_cccc3333.", [["aaaa1111", "bbbb2222"]]),
+    ("Merging ARTIFACT_aaaa1111 alone, not ARTIFACT_bbbb2222.", []),
+    ("ARTIFACT_aaaa1111 and ARTIFACT_bbbb2222 look related. Blend ARTIFACT_cccc3333 into ARTIFACT_dddd4444!",
+     [["cccc3333", "dddd4444"]]),
+])
+def test_merge_groups_respect_negation(text, groups):
+    assert find_merge_groups(text) == groups
+
+
+def test_extract_references_dedupes_in_order():
+    assert extract_references("ARTIFACT_abcd1234- then ARTIFACT_ffff and ARTIFACT_abcd1234") == ["abcd1234", "ffff"]
+
+
+def test_merge_content_joins_text_and_unions_lists():
+    merged = merge_content([{"text": "a", "items": [1, 2]}, {"text": "b", "items": [2, 3], "extra": {"k": "v"}}])
+    assert merged == {"text": "a\n\nb", "items": [1, 2, 3], "extra": {"k": "v"}}
+
+
+def test_each_prefix_needs_exactly_one_live_match():
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().references_test
+        ids = ["abcd0000-0000-0000-0000-000000000001", "abcd0000-0000-0000-0000-000000000002",
+               "beef0000-0000-0000-0000-000000000000", "cafe0000-0000-0000-0000-000000000000"]
+        # Lots of artifacts behind one short prefix, stored first
+        await db.artifacts.insert_many([{"id": f"dead{i:04d}-0000-0000-0000-000000000000", "user_id": "u1"} for i in range(40)])
+        await db.artifacts.insert_many([
+            {"id": ids[0], "user_id": "u1"},
+            {"id": ids[1], "user_id": "u1"},
+            {"id": ids[2], "user_id": "u1"},
+            {"id": ids[3], "user_id": "u1", "archived": True},
+            {"id": "beef1111-0000-0000-0000-000000000000", "user_id": "someone-else"},
+        ])
+
+        resolved = await resolve_references(db, "u1", ["dead", "abcd0000", ids[1], "beef", "cafe0000", "dead0007", "f00d"])
+        # "abcd0000" matches two artifacts, "cafe0000" only an archived one, "f00d" nothing
+        assert {ref: a["id"] for ref, a in resolved.items()} == {
+            ids[1]: ids[1],
+            "beef": ids[2],
+            "dead0007": "dead0007-0000-0000-0000-000000000000",
+        }
+        assert await resolve_references(db, "u1", []) == {}
+
+    asyncio.run(scenario())
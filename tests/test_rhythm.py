@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+from analytics import rhythm_features
+
+
+def test_rhythm_features_are_cached_until_new_events_are_stored(api, server, monkeypatch):
+    calls = []
+    real = server.rhythm_features
+
+    def counting(events, now=None):
+        calls.append(len(events))
+        return real(events, now)
+
+    monkeypatch.setattr(server, "rhythm_features", counting)
+    for frequency in ("focus", "dream", "focus"):
+        server.activity.record(api.user_id, frequency, "converse")
+
+    first = api.get("/api/patterns/stats").json()
+    assert first["events"] == 3
+    assert api.get("/api/patterns/stats").json() == first
+    assert calls == [3]
+
+    server.activity.record(api.user_id, "dream", "converse")
+    assert api.get("/api/patterns/stats").json()["events"] == 4
+    assert calls == [3, 4]
+
+
+def test_rhythm_features_parse_mixed_timestamps_as_utc():
+    events = [
+        {"timestamp": datetime(2026, 3, 1, 9, 0), "frequency": "focus"},
+        {"timestamp": datetime(2026, 3, 1, 9, 10, tzinfo=timezone.utc), "frequency": "dream"},
+        {"timestamp": "2026-03-01T09:20:00", "frequency": "focus"},
+        {"timestamp": "2026-03-01T10:30:00+01:00", "frequency": "dream"},
+        {"timestamp": "yesterday-ish", "frequency": "focus"},
+        {"timestamp": 1234, "frequency": "focus"},
+        {"frequency": "focus"},
+    ]
+    features = rhythm_features(events, now=datetime(2026, 3, 1, 12, tzinfo=timezone.utc).timestamp())
+    assert features["events"] == 4
+    assert features["frequencies"] == {"dream": 2, "focus": 2}
+    # Naive values are UTC, not the server's local time
+    assert features["first_at"] == "2026-03-01T09:00:00+00:00"
+    assert features["last_at"] == "2026-03-01T09:30:00+00:00"
+    assert features["sessions"]["count"] == 1
+
+
+def test_pattern_stats_survive_legacy_and_malformed_events(api, server):
+    docs = [
+        {"user_id": api.user_id, "frequency": "focus", "timestamp": datetime(2025, 1, 1, 8)},
+        {"user_id": api.user_id, "frequency": "dream", "timestamp": "2025-01-01T08:05:00+00:00"},
+        {"user_id": api.user_id, "frequency": "focus", "timestamp": "not a time"},
+    ]
+    api.portal.call(server.db.patterns.insert_many, docs)
+    response = api.get("/api/patterns/stats")
+    assert response.status_code == 200
+    assert response.json()["events"] == 2
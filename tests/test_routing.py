@@ -0,0 +1,119 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import routing
+from routing import ModelRouter, validate_rules
+
+ROUTES = Path(routing.__file__).parent / "model_routes.json"
+
+SHORT, MEDIUM, LONG = "hi there", "x" * 500, "x" * 1600
+ARTIFACT = "draw a diagram of " + "x" * 450
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(str(ROUTES))
+
+
+@pytest.mark.parametrize("text, user_tier, rule, tier, max_tokens", [
+    (SHORT, "free", "quick-reply", "light", 160),
+    (SHORT, "pro", "quick-reply", "light", 160),
+    ("draw a map", "free", "default", "standard", 300),
+    (ARTIFACT, "pro", "pro-heavy", "heavy", 700),
+    (ARTIFACT, "free", "default", "standard", 300),
+    (MEDIUM, "pro", "default", "standard", 300),
+    (LONG, "pro", "long-input", "heavy", 700),
+    # Free plans stop at standard even when a later rule would go heavy
+    (LONG, "free", "long-input", "standard", 300),
+    (LONG + " draw a diagram", "pro", "pro-heavy", "heavy", 700),
+    (LONG + " draw a diagram", "free", "long-input", "standard", 300),
+])
+def test_rules_are_tried_in_order(router, text, user_tier, rule, tier, max_tokens):
+    route = router.route("hermes", text, user_tier)
+    assert (route["rule"], route["tier"], route["max_tokens"]) == (rule, tier, max_tokens)
+
+
+def test_free_turn_over_long_input_threshold_is_capped(router):
+    route = router.route("hermes", LONG, "free")
+    assert route["model"] == "Hermes-4-70B"
+    assert route["capped"] is True
+    assert router.stats()["capped"] == 1
+
+
+def test_rule_naming_the_plan_may_exceed_its_cap(tmp_path):
+    config = json.loads(ROUTES.read_text())
+    config["rules"].insert(0, {"name": "free-trial", "when": {"min_chars": 1500, "user_tiers": ["free"]}, "tier": "heavy"})
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps(config))
+    route = ModelRouter(str(path)).route("hermes", LONG, "free")
+    assert (route["rule"], route["tier"], route["capped"]) == ("free-trial", "heavy", False)
+
+
+def test_cap_must_name_a_known_tier():
+    config = json.loads(ROUTES.read_text())
+    config["tier_caps"] = {"free": "premium"}
+    with pytest.raises(ValueError, match="unknown tier 'premium'"):
+        validate_rules(config)
+
+
+def test_slow_tier_degrades_then_recovers_after_ttl(router, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(routing.time, "monotonic", lambda: now[0])
+    router.record("hermes", "Hermes-4-405B", 30.0)
+    assert router.route("hermes", LONG, "pro")["tier"] == "standard"
+    now[0] += router.latency_ttl
+    assert router.route("hermes", LONG, "pro")["tier"] == "heavy"
+
+
+def edited(change):
+    config = json.loads(ROUTES.read_text())
+    change(config)
+    return config
+
+
+MALFORMED = {
+    "list at top level": [],
+    "tier not an object": edited(lambda c: c["tiers"].update(light="gpt-4o")),
+    "models not an object": edited(lambda c: c["tiers"]["light"].update(models=["gpt-4o"])),
+    "boolean max_tokens": edited(lambda c: c["tiers"]["light"].update(max_tokens=True)),
+    "rule not an object": edited(lambda c: c["rules"].insert(0, "quick-reply")),
+    "when not an object": edited(lambda c: c["rules"][0].update(when=["max_chars"])),
+    "text max_chars": edited(lambda c: c["rules"][0]["when"].update(max_chars="80")),
+    "string artifacts": edited(lambda c: c["rules"][0]["when"].update(artifacts="no")),
+    "user_tiers not a list": edited(lambda c: c["rules"][1]["when"].update(user_tiers="pro")),
+    "unhashable tier": edited(lambda c: c["rules"][0].update(tier=["light"])),
+    "text latency budget": edited(lambda c: c["rules"][1].update(latency_budget_s="12")),
+    "keywords not a list": edited(lambda c: c.update(artifact_keywords="diagram")),
+    "caps not an object": edited(lambda c: c.update(tier_caps=["standard"])),
+}
+
+
+@pytest.mark.parametrize("config", MALFORMED.values(), ids=MALFORMED.keys())
+def test_malformed_rules_raise_value_error(config):
+    with pytest.raises(ValueError):
+        validate_rules(config)
+
+
+@pytest.mark.parametrize("config", MALFORMED.values(), ids=MALFORMED.keys())
+def test_broken_edit_keeps_the_previous_rules(tmp_path, config):
+    path = tmp_path / "routes.json"
+    path.write_text(ROUTES.read_text())
+    router = ModelRouter(str(path))
+    path.write_text(json.dumps(config))
+    os.utime(path, (1, 1))
+    assert router.reload() is False
+    route = router.route("hermes", SHORT, "free")
+    assert (route["rule"], route["tier"]) == ("quick-reply", "light")
+
+
+def test_unparseable_file_keeps_the_previous_rules(tmp_path):
+    path = tmp_path / "routes.json"
+    path.write_text(ROUTES.read_text())
+    router = ModelRouter(str(path))
+    path.write_text('{"tiers": ')
+    os.utime(path, (1, 1))
+    assert router.reload() is False
+    assert router.route("hermes", LONG, "pro")["tier"] == "heavy"
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+import scheduler
+from scheduler import BACKGROUND, INTERACTIVE, LLMOverloaded, LLMScheduler, ProviderGate, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_spends_burst_then_reports_wait(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.take() == 0.0
+
+
+def test_bucket_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=1.0, burst=2)
+    bucket.take()
+    clock[0] += 100
+    assert bucket.full
+    assert bucket.tokens == 2
+
+
+def test_bucket_reserve_keeps_a_token_back(clock):
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert bucket.take(reserve=1.0) == 0.0
+    assert bucket.take(reserve=1.0) == pytest.approx(1.0)
+    assert bucket.take() == 0.0
+
+
+def test_overloaded_rounds_retry_after_up_to_a_whole_second():
+    assert LLMOverloaded(0.01, "x").retry_after == 1
+    assert LLMOverloaded(2.2, "x").retry_after == 3
+
+
+def test_background_calls_cannot_drain_the_users_last_token(clock):
+    sched = LLMScheduler(user_rate_per_min=60, user_burst=2)
+
+    async def run(priority):
+        async with sched.slot("hermes", "u1", priority):
+            pass
+
+    asyncio.run(run(BACKGROUND))
+    with pytest.raises(LLMOverloaded) as info:
+        asyncio.run(run(BACKGROUND))
+    assert info.value.reason == "Too many AI requests"
+    asyncio.run(run(INTERACTIVE))
+
+
+def test_gate_serves_interactive_waiters_before_background():
+    async def scenario():
+        gate = ProviderGate(limit=1, max_queue=8, queue_timeout=5)
+        await gate.acquire(INTERACTIVE)
+        order = []
+
+        async def waiter(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [asyncio.create_task(waiter("bg1", BACKGROUND)), asyncio.create_task(waiter("bg2", BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(waiter("fg", INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert gate.depth == 3
+        gate.release()
+        await asyncio.gather(*tasks)
+        assert gate.active == 0
+        return order
+
+    assert asyncio.run(scenario()) == ["fg", "bg1", "bg2"]
+
+
+def test_background_is_shed_at_half_the_queue():
+    async def scenario():
+        gate = ProviderGate(limit=1, max_queue=4, queue_timeout=5)
+        await gate.acquire(INTERACTIVE)
+        tasks = [asyncio.create_task(gate.acquire(BACKGROUND)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded) as info:
+            await gate.acquire(BACKGROUND)
+        assert info.value.reason == "LLM queue full"
+        # Interactive callers still have room
+        tasks += [asyncio.create_task(gate.acquire(INTERACTIVE)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded):
+            await gate.acquire(INTERACTIVE)
+        assert gate.shed == 2
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_sheds_and_leaves_the_slot_count_intact():
+    async def scenario():
+        gate = ProviderGate(limit=1, max_queue=4, queue_timeout=0.01)
+        await gate.acquire(INTERACTIVE)
+        with pytest.raises(LLMOverloaded) as info:
+            await gate.acquire(INTERACTIVE)
+        assert info.value.reason == "LLM queue timeout"
+        gate.release()
+        assert gate.active == 0 and gate.depth == 0
+        await gate.acquire(INTERACTIVE)
+        assert gate.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_skipped_on_release():
+    async def scenario():
+        gate = ProviderGate(limit=1, max_queue=4, queue_timeout=5)
+        await gate.acquire(INTERACTIVE)
+        doomed = asyncio.create_task(gate.acquire(INTERACTIVE))
+        survivor = asyncio.create_task(gate.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+        doomed.cancel()
+        await asyncio.gather(doomed, return_exceptions=True)
+        gate.release()
+        await survivor
+        assert gate.active == 1
+        gate.release()
+        assert gate.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_stats_reports_each_provider_gate():
+    sched = LLMScheduler(provider_concurrency=3)
+
+    async def run():
+        async with sched.slot("openai", "u1"):
+            return sched.stats()
+
+    during = asyncio.run(run())["openai"]
+    assert during["active"] == 1 and during["limit"] == 3
+    assert sched.stats()["openai"]["active"] == 0
@@ -0,0 +1,102 @@
+from search import UserSearchIndex, tag_facets, tokenize
+
+
+def make_index():
+    index = UserSearchIndex()
+    index.add_node({"id": "n1", "title": "Garden plans", "content": "tomatoes and basil", "tags": ["home"],
+                    "frequency": "build"})
+    index.add_node({"id": "n2", "title": "Reading list", "content": "a book about the garden", "tags": ["home", "books"],
+                    "frequency": "study"})
+    index.add_node({"id": "n3", "title": "Gardening tools", "aliases": ["Shed"], "content": "rake",
+                    "frequency": "build", "archived": True})
+    index.add_artifact({"id": "a1", "content": {"text": "garden sketch with basil"}, "conversation_id": "build"})
+    return index
+
+
+def ids(results):
+    return [meta["id"] for _, meta in results]
+
+
+def test_tokenize_lowercases_and_splits_on_punctuation():
+    assert tokenize("Hello, World-wide!") == ["hello", "world", "wide"]
+    assert tokenize(None) == []
+
+
+def test_title_hit_outranks_body_hit():
+    results = make_index().search("garden", prefix=False)
+    assert ids(results)[0] == "n1"
+    assert set(ids(results)) == {"n1", "n2", "a1"}
+    scores = [score for score, _ in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_rare_terms_weigh_more_than_common_ones():
+    index = make_index()
+    # "basil" is in two docs, "tomatoes" in one - the doc with both must lead
+    assert ids(index.search("basil tomatoes", prefix=False))[0] == "n1"
+
+
+def test_last_token_is_prefix_expanded_with_exact_match_preferred():
+    index = make_index()
+    assert "n3" in ids(index.search("gard", include_archived=True))
+    assert ids(index.search("gard", prefix=False)) == []
+
+
+def test_prefix_expansions_score_below_the_exact_term():
+    index = UserSearchIndex()
+    index.add_node({"id": "exact", "title": "plan"})
+    index.add_node({"id": "longer", "title": "planet"})
+    results = index.search("plan")
+    assert ids(results) == ["exact", "longer"]
+    assert results[0][0] > results[1][0]
+
+
+def test_filters_kind_frequency_tags_and_archived():
+    index = make_index()
+    assert ids(index.search("garden", kind="artifact")) == ["a1"]
+    assert set(ids(index.search("garden", frequency="build"))) == {"n1", "a1"}
+    assert ids(index.search("garden", tags=["books"])) == ["n2"]
+    assert "n3" not in ids(index.search("gardening"))
+    assert ids(index.search("gardening", include_archived=True)) == ["n3"]
+
+
+def test_reindexing_replaces_old_terms_and_remove_cleans_postings():
+    index = make_index()
+    index.add_node({"id": "n1", "title": "Kitchen", "content": "", "frequency": "build"})
+    assert "n1" not in ids(index.search("tomatoes"))
+    assert ids(index.search("kitchen")) == ["n1"]
+
+    index.remove("node:n1")
+    index.remove("node:n1")
+    assert "tomatoes" not in index.postings
+    assert index.search("kitchen") == []
+    assert abs(index.total_length - sum(meta["length"] for meta in index.docs.values())) < 1e-9
+
+
+def test_set_archived_hides_a_frequency():
+    index = make_index()
+    index.set_archived("node", "study", True)
+    assert "n2" not in ids(index.search("garden"))
+
+
+def test_suggest_matches_titles_and_aliases_once_per_node():
+    index = make_index()
+    index.add_node({"id": "n4", "title": "Shed repairs", "aliases": ["shed"], "frequency": "build"})
+    assert [s["id"] for s in index.suggest("gar")] == ["n1"]
+    assert [s["id"] for s in index.suggest("SHED")] == ["n4"]
+    assert index.suggest("   ") == []
+    assert index.suggest("re", frequency="build") == [] and [s["id"] for s in index.suggest("re")] == ["n2"]
+
+
+def test_suggest_respects_limit_and_sees_new_nodes():
+    index = UserSearchIndex()
+    for i in range(5):
+        index.add_node({"id": f"n{i}", "title": f"note {i}"})
+    assert [s["title"] for s in index.suggest("note", limit=2)] == ["note 0", "note 1"]
+    index.add_node({"id": "x", "title": "notebook"})
+    assert "x" in [s["id"] for s in index.suggest("noteb")]
+
+
+def test_tag_facets_sorted_by_count_then_name():
+    results = make_index().search("garden")
+    assert tag_facets(results) == {"home": 2, "books": 1}
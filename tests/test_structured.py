@@ -0,0 +1,97 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from structured import ArtifactStats, ToolCallDecoder, decode_tool_calls
+
+
+def delta(index, arguments=None, name=None):
+    return SimpleNamespace(index=index, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def call(name, arguments):
+    return SimpleNamespace(function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def fragments(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+SPEC = {"type": "text_bubble", "content": {"text": 'She said "hi {there}" \\ then left'}, "style": {"color": "#fff"}}
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_call_decodes_when_its_object_closes_however_it_is_fragmented(size):
+    decoder = ToolCallDecoder()
+    pieces = fragments(json.dumps(SPEC), size)
+    assert decoder.feed([delta(0, name="create_artifact")]) == []
+    completed = []
+    for i, piece in enumerate(pieces):
+        completed += decoder.feed([delta(0, piece)])
+        if i < len(pieces) - 1:
+            assert completed == []
+    assert completed == [SPEC]
+    assert decoder.close() == []
+    assert decoder.rejected == 0
+
+
+def test_escape_split_across_fragments_keeps_string_state():
+    decoder = ToolCallDecoder()
+    decoder.feed([delta(0, '{"type": "lightbulb", "content": {"text": "a \\', name="create_artifact")])
+    # The escaped quote and the brace after it are still inside the string
+    assert decoder.feed([delta(0, '"}"')]) == []
+    assert decoder.feed([delta(0, '}}')]) == [{"type": "lightbulb", "content": {"text": 'a "}'}, "style": {}}]
+
+
+def test_interleaved_calls_are_decoded_by_index():
+    decoder = ToolCallDecoder()
+    first = {"type": "table", "content": {"columns": ["a"], "rows": [["1"]]}}
+    second = {"type": "image", "content": {"url": "x.png"}}
+    a, b = fragments(json.dumps(first), 5), fragments(json.dumps(second), 5)
+    completed = decoder.feed([delta(0, name="create_artifact"), delta(1, name="create_artifact")])
+    for i in range(max(len(a), len(b))):
+        batch = ([delta(0, a[i])] if i < len(a) else []) + ([delta(1, b[i])] if i < len(b) else [])
+        completed += decoder.feed(batch)
+    assert [c["type"] for c in completed] == ["image", "table"]
+
+
+def test_name_arriving_in_pieces_is_joined():
+    decoder = ToolCallDecoder()
+    decoder.feed([delta(0, name="create_")])
+    decoder.feed([delta(0, name="artifact")])
+    assert decoder.feed([delta(0, json.dumps(SPEC))]) == [SPEC]
+
+
+def test_truncated_call_is_rejected_on_close():
+    decoder = ToolCallDecoder()
+    decoder.feed([delta(0, json.dumps(SPEC)[:-5], name="create_artifact")])
+    assert decoder.close() == []
+    assert decoder.rejected == 1
+    assert decoder.decoded == []
+
+
+def test_schema_rejects_and_other_tools_are_not_counted_alike():
+    decoder = ToolCallDecoder()
+    decoder.feed([delta(0, '{"type": "hologram", "content": {}}', name="create_artifact")])
+    decoder.feed([delta(1, '{"q": "weather"}', name="web_search")])
+    assert decoder.close() == []
+    assert decoder.rejected == 1
+
+
+def test_non_streaming_calls_are_validated():
+    result = decode_tool_calls([
+        call("create_artifact", json.dumps(SPEC)),
+        call("create_artifact", '{"type": "text_bubble", "content": '),
+        call("web_search", "{}"),
+    ])
+    assert result == {"artifacts": [SPEC], "rejected": 1}
+
+
+def test_stats_only_meter_turns_that_report_usage():
+    stats = ArtifactStats()
+    stats.record("tools", kept=2, dropped=1, completion_tokens=100)
+    stats.record("tools", kept=1, dropped=0)
+    report = stats.stats()["tools"]
+    assert report["drop_rate"] == 0.25
+    assert report["tokens_per_artifact"] == 50.0
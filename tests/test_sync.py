@@ -0,0 +1,141 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from revisions import RevisionCounter
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def counter(**options):
+    db = mongomock_motor.AsyncMongoMockClient().sync_test
+    return RevisionCounter(SimpleNamespace(revisions=db.revisions), **options)
+
+
+def test_cursor_stays_below_the_lowest_write_in_flight():
+    async def scenario():
+        revisions = counter()
+        assert await revisions.sync_cursor("u1") == 0
+        first = await revisions.next_rev("u1")
+        second = await revisions.next_rev("u1")
+        assert (first, second) == (1, 2)
+        # The later write lands first - its revision must not be handed out yet
+        await revisions.release("u1", second)
+        assert await revisions.current_rev("u1") == 2
+        assert await revisions.sync_cursor("u1") == 0
+        await revisions.release("u1", first)
+        assert await revisions.sync_cursor("u1") == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_allocations_get_distinct_revisions():
+    async def scenario():
+        revisions = counter()
+
+        async def write():
+            async with revisions.writing("u1") as rev:
+                await asyncio.sleep(0)
+                return rev
+
+        revs = await asyncio.gather(*(write() for _ in range(20)))
+        assert sorted(revs) == list(range(1, 21))
+        assert await revisions.sync_cursor("u1") == 20
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_write_stops_holding_the_cursor_after_its_lease():
+    async def scenario():
+        revisions = counter(write_lease=0.05)
+        await revisions.next_rev("u1")  # never released
+        async with revisions.writing("u1"):
+            pass
+        assert await revisions.sync_cursor("u1") == 0
+        time.sleep(0.06)
+        assert await revisions.sync_cursor("u1") == 2
+        # The next allocation drops the stale entry
+        async with revisions.writing("u1"):
+            pass
+        doc = await revisions.collection.find_one({})
+        assert doc["open"] == []
+
+    asyncio.run(scenario())
+
+
+def test_sync_does_not_skip_a_write_that_lands_after_a_later_one(api, server):
+    call = api.portal.call
+    node = {"id": "sync-a", "user_id": api.user_id, "title": "A", "frequency": "focus"}
+    call(server.db.nodes.insert_many, [node, {**node, "id": "sync-b", "title": "B"}])
+    since = api.get("/api/sync", params={"since": 0}).json()["rev"]
+
+    # Request A takes its revision, then stalls before writing
+    slow_rev = call(server.revisions.next_rev, api.user_id)
+    # Request B starts later and finishes first
+    assert api.patch("/api/nodes/sync-b", json={"title": "B2"}).status_code == 200
+
+    first = api.get("/api/sync", params={"since": since}).json()
+    assert first["rev"] < slow_rev
+    assert [n["title"] for n in first["nodes"]] == ["B2"]
+
+    # A lands, then the client syncs from the cursor it was given
+    call(server.db.nodes.update_one, {"id": "sync-a"}, {"$set": {"title": "A2", "rev": slow_rev}})
+    call(server.revisions.release, api.user_id, slow_rev)
+    second = api.get("/api/sync", params={"since": first["rev"]}).json()
+    assert sorted(n["title"] for n in second["nodes"]) == ["A2", "B2"]
+    assert second["rev"] >= slow_rev + 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_bootstrap_cursor_does_not_skip_a_write_during_the_listings(api, server, monkeypatch, stream):
+    written = {}
+
+    async def listing_then_write(user_id, frequency):
+        # The listing is read, then a write lands before the other sections finish
+        async with server.revisions.writing(user_id) as rev:
+            await server.db.nodes.insert_one({"id": "late", "user_id": user_id, "title": "Late",
+                                              "frequency": frequency, "rev": rev})
+        written["rev"] = rev
+        return []
+
+    monkeypatch.setattr(server, "load_frequency_nodes", listing_then_write)
+    response = api.get("/api/workspace/bootstrap", params={"stream": stream})
+    assert response.status_code == 200
+    if stream:
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["section"] == "rev"
+        cursor = lines[0]["data"]
+    else:
+        cursor = response.json()["rev"]
+    assert cursor < written["rev"]
+    synced = api.get("/api/sync", params={"since": cursor}).json()
+    assert "Late" in [n["title"] for n in synced["nodes"]]
+
+
+def test_deleted_nodes_neighbour_shows_up_in_the_delta(api, server, monkeypatch):
+    call = api.portal.call
+    node = {"user_id": api.user_id, "frequency": "focus", "linked_ids": []}
+    call(server.db.nodes.insert_many, [{**node, "id": "nb-a", "title": "A", "linked_ids": ["nb-b"]},
+                                       {**node, "id": "nb-b", "title": "B"}])
+    call(server.graph_index.invalidate, api.user_id)
+    since = api.get("/api/sync", params={"since": 0}).json()["rev"]
+
+    cursors = []
+    node_deleted = server.graph_index.node_deleted
+
+    async def watching(user_id, node_id, rev=None):
+        # The tombstone is stored by now - the cursor must still sit below the neighbours' update
+        cursors.append((await server.revisions.sync_cursor(user_id), rev))
+        return await node_deleted(user_id, node_id, rev)
+
+    monkeypatch.setattr(server.graph_index, "node_deleted", watching)
+    assert api.delete("/api/nodes/nb-b").status_code == 200
+    [(cursor, rev)] = cursors
+    assert cursor < rev
+
+    delta = api.get("/api/sync", params={"since": since}).json()
+    assert [(n["id"], n["linked_ids"]) for n in delta["nodes"]] == [("nb-a", [])]
+    assert delta["rev"] >= rev
@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import pytest
+
+from turn_stream import TurnStreams
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def streams(**options):
+    return TurnStreams(mongomock_motor.AsyncMongoMockClient().turn_stream_test, **options)
+
+
+def test_buffered_text_is_flushed_when_the_provider_goes_quiet():
+    async def scenario():
+        turns = streams(flush_interval=0.05, flush_chars=1000)
+        writer = turns.writer("t1")
+        await writer.write("Hel")
+        await writer.write("lo")
+        assert writer.live.chunks == []
+        # No further deltas - the timer has to write the chunk out
+        await asyncio.sleep(0.15)
+        assert [c["text"] for c in writer.live.chunks] == ["Hello"]
+        stored = await turns.chunks.find({"turn_id": "t1"}, {"_id": 0, "seq": 1, "text": 1}).to_list(None)
+        assert stored == [{"seq": 0, "text": "Hello"}]
+
+    asyncio.run(scenario())
+
+
+def test_final_flush_cancels_the_timer_without_duplicating_chunks():
+    async def scenario():
+        turns = streams(flush_interval=0.05, flush_chars=4)
+        writer = turns.writer("t1")
+        for delta in ["ab", "cdef", "g"]:
+            await writer.write(delta)
+        await writer.flush()
+        await asyncio.sleep(0.1)
+        stored = await turns.chunks.find({"turn_id": "t1"}, {"_id": 0, "seq": 1, "text": 1}).sort("seq", 1).to_list(None)
+        assert stored == [{"seq": 0, "text": "abcdef"}, {"seq": 1, "text": "g"}]
+        assert writer.live.chunks == [{"turn_id": "t1", **c} for c in stored]
+
+    asyncio.run(scenario())
+
+
+def test_follower_sees_timed_flush_before_the_turn_finishes():
+    async def scenario():
+        turns = streams(flush_interval=0.05, flush_chars=1000)
+        writer = turns.writer("t1")
+        await writer.write("partial")
+        follower = turns.follow("t1")
+        chunk = await asyncio.wait_for(follower.__anext__(), timeout=1)
+        assert chunk["text"] == "partial"
+        turns.finish("t1")
+        await follower.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_turn_events_reports_an_errored_turn(api, server):
+    turn = {"id": "t-err", "user_id": api.user_id, "conversation_id": "focus", "status": "error", "error": "boom"}
+    api.portal.call(server.db.conversations.insert_one, turn)
+    response = api.get("/api/converse/stream/t-err")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["type"] for e in events] == ["turn", "error"]
+    assert events[-1]["detail"] == "boom"
+
+
+def test_history_pages_through_turns_sharing_a_timestamp(api, server):
+    timestamp = "2026-01-01T00:00:00+00:00"
+    turns = [{"id": f"turn-{i}", "user_id": api.user_id, "conversation_id": "focus", "status": "done",
+              "timestamp": timestamp} for i in range(5)]
+    turns.append({"id": "turn-old", "user_id": api.user_id, "conversation_id": "focus", "status": "done",
+                  "timestamp": "2025-12-31T00:00:00+00:00"})
+    api.portal.call(server.db.conversations.insert_many, turns)
+
+    seen, params = [], {"limit": 2}
+    while True:
+        page = api.get("/api/conversations/focus/history", params=params).json()
+        seen = [t["id"] for t in page["turns"]] + seen
+        if page["next_before"] is None:
+            break
+        params = {"limit": 2, "before": page["next_before"], "before_id": page["next_before_id"]}
+    assert seen == ["turn-old"] + [f"turn-{i}" for i in range(5)]
+
+
+def fake_generation(server, monkeypatch, hold=None):
+    """Stub the provider call: streams 'Hel' + 'lo', or waits on `hold` after admission"""
+    calls = []
+
+    async def generate_reply(data, user_id, provider, on_text=None, admitted=None):
+        calls.append(data.text)
+        admitted.set_result(None)
+        await on_text("Hel")
+        if hold is not None:
+            await hold.wait()
+        await on_text("lo")
+        return {"text": "Hello", "artifacts": [], "rejected": 0, "completion_tokens": None, "mode": "text", "route": None}
+
+    monkeypatch.setattr(server, "choose_provider", lambda preference: "hermes")
+    monkeypatch.setattr(server, "generate_reply", generate_reply)
+    return calls
+
+
+def stream_events(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_retried_stream_post_follows_the_turn_already_started(api, server, monkeypatch):
+    calls = fake_generation(server, monkeypatch)
+    body = {"text": "tell me about tides", "current_frequency": "focus"}
+    first = api.post("/api/converse/stream", json=body, headers={"Idempotency-Key": "k1"})
+    retry = api.post("/api/converse/stream", json=body, headers={"Idempotency-Key": "k1"})
+
+    assert calls == ["tell me about tides"]
+    assert retry.headers["x-turn-id"] == first.headers["x-turn-id"]
+    events = stream_events(retry)
+    assert "".join(e["text"] for e in events if e["type"] == "chunk") == "Hello"
+    assert events[-1]["type"] == "done"
+    turns = api.portal.call(server.db.conversations.count_documents, {"user_id": api.user_id})
+    assert turns == 1
+
+
+def test_stream_idempotency_key_reused_for_another_body_is_rejected(api, server, monkeypatch):
+    fake_generation(server, monkeypatch)
+    api.post("/api/converse/stream", json={"text": "one"}, headers={"Idempotency-Key": "k2"})
+    response = api.post("/api/converse/stream", json={"text": "two"}, headers={"Idempotency-Key": "k2"})
+    assert response.status_code == 422
+
+
+def test_cancelled_turn_is_marked_interrupted(api, server, monkeypatch):
+    async def scenario():
+        hold = asyncio.Event()
+        fake_generation(server, monkeypatch, hold)
+        data = server.ConversationInput(text="slow one")
+        started = await server.start_streaming_turn(data, api.user_id, "hermes")
+        [task] = [t for t in server.background_tasks if not t.done()]
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await server.db.conversations.find_one({"id": started["turn_id"]})
+
+    turn = api.portal.call(scenario)
+    assert turn["status"] == "interrupted"
+    events = stream_events(api.get(f"/api/converse/stream/{turn['id']}"))
+    assert [e["type"] for e in events] == ["turn", "chunk", "interrupted"]
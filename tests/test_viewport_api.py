@@ -0,0 +1,42 @@
+def artifact(user_id, i, x, y, conversation_id="reflect"):
+    return {
+        "id": f"{user_id}-a{i}", "user_id": user_id, "conversation_id": conversation_id, "type": "text_bubble",
+        "content": {"text": str(i)}, "style": {},
+        "position": {"x": x, "y": y}, "size": {"width": 200, "height": 100},
+    }
+
+
+def test_viewport_sees_every_artifact_past_the_old_listing_cap(api, server):
+    docs = [artifact(api.user_id, i, (i % 50) * 250, (i // 50) * 150) for i in range(1200)]
+    api.portal.call(server.db.artifacts.insert_many, docs)
+
+    body = api.get("/api/artifacts/reflect/viewport", params={
+        "x0": 0, "y0": 0, "x1": 20000, "y1": 20000, "max_artifacts": 5000
+    }).json()
+    assert body["total"] == 1200
+    assert len(body["artifacts"]) == 1200
+    assert len(api.get("/api/artifacts/reflect").json()) == 1200
+
+
+def test_viewport_index_follows_writes_without_rebuilding(api, server):
+    docs = [artifact(api.user_id, i, i * 300, 0) for i in range(5)]
+    api.portal.call(server.db.artifacts.insert_many, docs)
+    api.get("/api/artifacts/reflect/viewport", params={"x0": 0, "y0": 0, "x1": 100, "y1": 100})
+    layout = server.canvas_layouts.get(api.user_id, "reflect")
+
+    moved = f"{api.user_id}-a1"
+    api.patch(f"/api/artifacts/{moved}", json={"position": {"x": 5000, "y": 5000}})
+    api.delete(f"/api/artifacts/{api.user_id}-a2")
+
+    near_origin = api.get("/api/artifacts/reflect/viewport", params={"x0": 0, "y0": 0, "x1": 1400, "y1": 200}).json()
+    far = api.get("/api/artifacts/reflect/viewport", params={"x0": 4900, "y0": 4900, "x1": 5300, "y1": 5200}).json()
+    assert sorted(a["id"] for a in near_origin["artifacts"]) == [f"{api.user_id}-a{i}" for i in (0, 3, 4)]
+    assert [a["id"] for a in far["artifacts"]] == [moved]
+    assert server.canvas_layouts.get(api.user_id, "reflect") is layout
+
+
+def test_viewport_rejects_non_positive_max_artifacts(api):
+    params = {"x0": 0, "y0": 0, "x1": 10, "y1": 10}
+    assert api.get("/api/artifacts/reflect/viewport", params={**params, "max_artifacts": 0}).status_code == 422
+    assert api.get("/api/artifacts/reflect/viewport", params={**params, "max_artifacts": 10 ** 6}).status_code == 422
+    assert api.get("/api/artifacts/reflect/viewport", params={**params, "max_artifacts": 1}).status_code == 200
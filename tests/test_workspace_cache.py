@@ -0,0 +1,116 @@
+from workspace_cache import WorkspaceCache
+
+
+def doc(doc_id, **extra):
+    return {"id": doc_id, **extra}
+
+
+def test_discard_removes_doc_from_every_scope_of_that_user_only():
+    cache = WorkspaceCache()
+    cache.set("u1", "artifacts", "reflect", [doc("a"), doc("b")])
+    cache.set("u1", "artifacts", "dream", [doc("a")])
+    cache.set("u2", "artifacts", "reflect", [doc("a")])
+
+    cache.discard("u1", "artifacts", "a")
+
+    assert cache.get("u1", "artifacts", "reflect") == [doc("b")]
+    assert cache.get("u1", "artifacts", "dream") == []
+    assert cache.get("u2", "artifacts", "reflect") == [doc("a")]
+
+
+def test_discard_only_visits_the_users_own_keys():
+    cache = WorkspaceCache()
+    for i in range(500):
+        cache.set(f"other{i}", "nodes", "focus", [doc("x")])
+    cache.set("u1", "nodes", "focus", [doc("x")])
+    cache.set("u1", "artifacts", "focus", [doc("x")])
+
+    assert cache._user_keys("u1", "nodes") == [("u1", "nodes", "focus")]
+    cache.discard("u1", "nodes", "x")
+    assert cache.get("u1", "nodes", "focus") == []
+    assert cache.get("u1", "artifacts", "focus") == [doc("x")]
+
+
+def test_invalidate_by_kind_and_scope():
+    cache = WorkspaceCache()
+    cache.set("u1", "nodes", "focus", [doc("n")])
+    cache.set("u1", "nodes", "dream", [doc("n")])
+    cache.set("u1", "artifacts", "focus", [doc("a")])
+
+    cache.invalidate("u1", "nodes", "focus")
+    assert cache.peek("u1", "nodes", "focus") is None
+    assert cache.peek("u1", "nodes", "dream") is not None
+
+    cache.invalidate("u1")
+    assert cache.stats()["entries"] == 0
+    assert cache._by_user == {}
+
+
+def test_user_index_follows_lru_eviction():
+    cache = WorkspaceCache(max_bytes=200)
+    cache.set("u1", "nodes", "focus", [doc("n", text="x" * 100)])
+    cache.set("u2", "nodes", "focus", [doc("n", text="y" * 100)])
+
+    assert cache.peek("u1", "nodes", "focus") is None
+    assert "u1" not in cache._by_user
+    assert cache._user_keys("u2") == [("u2", "nodes", "focus")]
+
+
+def test_upsert_keeps_entry_indexed():
+    cache = WorkspaceCache()
+    cache.set("u1", "artifacts", "reflect", [doc("a", v=1)])
+    cache.upsert("u1", "artifacts", "reflect", doc("a", v=2))
+
+    assert cache.get("u1", "artifacts", "reflect") == [doc("a", v=2)]
+    assert cache._user_keys("u1", "artifacts") == [("u1", "artifacts", "reflect")]
+
+
+def test_fill_is_dropped_when_a_write_lands_during_the_read():
+    cache = WorkspaceCache()
+    generation = cache.generation("u1", "nodes", "focus")
+    cache.upsert("u1", "nodes", "focus", doc("n", title="new"))
+    cache.set("u1", "nodes", "focus", [doc("n", title="old")], generation)
+    assert cache.peek("u1", "nodes", "focus") is None
+    assert cache.stats()["stale_fills"] == 1
+
+    generation = cache.generation("u1", "nodes", "focus")
+    cache.set("u1", "nodes", "focus", [doc("n", title="new")], generation)
+    assert cache.peek("u1", "nodes", "focus") == [doc("n", title="new")]
+
+
+def test_writes_to_wider_scopes_and_other_keys():
+    cache = WorkspaceCache()
+    generation = cache.generation("u1", "nodes", "focus")
+    cache.upsert("u1", "nodes", "dream", doc("n"))
+    cache.upsert("u2", "nodes", "focus", doc("n"))
+    cache.invalidate("u1", "artifacts")
+    assert cache.generation("u1", "nodes", "focus") == generation
+
+    for write in (lambda: cache.discard("u1", "nodes", "n"), lambda: cache.invalidate("u1", "nodes"),
+                  lambda: cache.invalidate("u1")):
+        generation = cache.generation("u1", "nodes", "focus")
+        write()
+        cache.set("u1", "nodes", "focus", [doc("stale")], generation)
+        assert cache.peek("u1", "nodes", "focus") is None
+
+
+def test_evicted_generations_never_match_an_older_snapshot():
+    cache = WorkspaceCache(max_generations=2)
+    generation = cache.generation("u1", "nodes", "focus")
+    cache.upsert("u1", "nodes", "focus", doc("n"))
+    for i in range(5):
+        cache.upsert(f"other{i}", "nodes", "focus", doc("n"))
+    assert len(cache._generations) == 2
+    assert cache.generation("u1", "nodes", "focus") != generation
+
+
+def test_tagged_get_misses_entries_loaded_under_another_etag():
+    cache = WorkspaceCache()
+    cache.set("u1", "nodes", "focus", [doc("n")], cache.generation("u1", "nodes", "focus"), tag='W/"x-1.0"')
+    assert cache.get("u1", "nodes", "focus", 'W/"x-1.0"') == [doc("n")]
+    assert cache.get("u1", "nodes", "focus", 'W/"x-2.0"') is None
+    assert cache.get("u1", "nodes", "focus") == [doc("n")]
+
+    # A write-through moves the docs past the tag they were loaded under
+    cache.upsert("u1", "nodes", "focus", doc("m"))
+    assert cache.get("u1", "nodes", "focus", 'W/"x-1.0"') is None